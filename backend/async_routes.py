@@ -0,0 +1,142 @@
+"""
+    `async def` versions of the read endpoints of `main.py`, served with an AsyncSession.
+
+    `main.py` registers this router ahead of its own routes when `settings.db_mode` is "async",
+    so these handlers take precedence over the sync ones with the same path. Each handler runs
+    the sync data layer of `models` through `AsyncSession.run_sync` and keeps the responses and
+    errors of its sync counterpart.
+"""
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.async_db import get_async_db
+from core.config import settings
+from core.etags import etag_matches, not_modified, set_etag
+from core.fast_json import FastJSONResponse
+from core.user_management import UserManagement
+from models.basic_models import *
+from models.expenses import *
+from models.settlement import *
+from models.trips import *
+from models.user_base import *
+
+router = APIRouter()
+
+bearer_security = HTTPBearer()
+
+
+async def get_current_user(session: AsyncSession, credentials: HTTPAuthorizationCredentials) -> CurrentUser:
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = await session.run_sync(UserManagement.get_current_user, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    return user
+
+
+async def ensure_trip_exists(session: AsyncSession, trip_id: int):
+    result = await session.execute(select(Trip.id).where(Trip.id == trip_id))
+    if result.first() is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+
+def load_trips_page(session, user_id: Optional[int], limit: Optional[int], after: Optional[str], if_none_match: Optional[str]) -> Tuple[str, Optional[dict]]:
+    """
+        Returns the ETag of the page, and the page as the plain dict of its TripsOut JSON unless
+        `if_none_match` matches the ETag.
+    """
+    query = session.query(Trip)
+    if user_id is not None:
+        query = query.filter(Trip.user_id == user_id)
+    page_size = min(limit or settings.trips_page_size_max, settings.trips_page_size_max)
+    trips, next_cursor = paginate_trips(query, page_size, after)
+    etag = trips_page_etag(trips, next_cursor)
+    if etag_matches(if_none_match, etag):
+        return etag, None
+    return etag, {"trips": convert_trips_to_dicts(session, trips), "next_cursor": next_cursor}
+
+
+async def respond_with_trips_page(session: AsyncSession, user_id: Optional[int], limit: Optional[int], after: Optional[str], if_none_match: Optional[str]) -> Response:
+    try:
+        etag, page = await session.run_sync(load_trips_page, user_id, limit, after, if_none_match)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if page is None:
+        return not_modified(etag)
+    response = FastJSONResponse(page)
+    set_etag(response, etag)
+    return response
+
+
+@router.get("/users/me")
+async def read_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)):
+    """
+        Async version of `main.read_current_user`.
+    """
+    user = await get_current_user(session, credentials)
+    return UserOut(username=user.username, fullName=user.full_name)
+
+
+@router.get("/my-trips", response_model=TripsOut)
+async def get_my_trips(limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)):
+    """
+        Async version of the `/my-trips` endpoint of `main.py`.
+    """
+    user = await get_current_user(session, credentials)
+    return await respond_with_trips_page(session, user.id, limit, after, if_none_match)
+
+
+@router.get("/all-trips", response_model=TripsOut)
+async def get_all_trips(limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)):
+    """
+        Async version of the `/all-trips` endpoint of `main.py`.
+    """
+    await get_current_user(session, credentials)
+    return await respond_with_trips_page(session, None, limit, after, if_none_match)
+
+
+@router.get("/trip/{trip_id}")
+async def get_trip(trip_id: int, response: Response, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)) -> TripOut:
+    """
+        Async version of the `/trip/{trip_id}` endpoint of `main.py`.
+    """
+    user = await get_current_user(session, credentials)
+    trip = (await session.execute(select(Trip).where(Trip.id == trip_id))).scalars().first()
+    if trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    etag = trip_etag(trip, user)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return (await session.run_sync(convert_trips, [trip], user))[0]
+
+
+@router.get("/trip/{trip_id}/expenses")
+async def get_trip_expenses(trip_id: int, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)) -> GetExpenses:
+    """
+        Async version of `main.get_trip_expenses`.
+    """
+    await get_current_user(session, credentials)
+    await ensure_trip_exists(session, trip_id)
+    return await session.run_sync(load_expenses_with_summary_for_trip, trip_id)
+
+
+@router.get("/trip/{trip_id}/settlement")
+async def get_trip_settlement(trip_id: int, mode: str = "auto", credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session: AsyncSession = Depends(get_async_db)) -> SettlementOut:
+    """
+        Async version of `main.get_trip_settlement`.
+    """
+    await get_current_user(session, credentials)
+    await ensure_trip_exists(session, trip_id)
+    summary = await session.run_sync(calculate_summary_for_trip_id, trip_id)
+    try:
+        return settle_balances(summary, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
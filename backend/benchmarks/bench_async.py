@@ -0,0 +1,93 @@
+"""
+    Latency of `/my-trips` under many concurrent clients, served by the sync handler of
+    `main.py` (threadpool, blocking Session) versus the async one of `async_routes`
+    (event loop, AsyncSession over aiosqlite).
+
+    Requests go through the ASGI app in process with httpx, so the numbers leave out the
+    network and the HTTP parsing of a real server.
+
+    Usage: python -m benchmarks.bench_async [--clients 500] [--requests 10] [--trips 20]
+"""
+import asyncio
+import time
+
+import click
+import httpx
+from fastapi import FastAPI
+
+from async_routes import router
+from benchmarks.bench_my_trips import pooled_dependency, seed
+from benchmarks.common import percentile, temporary_database
+from core.async_db import async_sessionmaker, build_async_engine, get_async_db
+from core.db import get_db, get_read_db
+from core.user_management import UserManagement
+from main import app
+
+
+async def load_test(asgi_app, clients: int, requests: int):
+    headers = {"Authorization": "Bearer bench-token"}
+    latencies = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(app=asgi_app, base_url="http://bench", limits=limits, timeout=None) as client:
+        await client.get("/my-trips", headers=headers)
+
+        async def run_client():
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = await client.get("/my-trips", headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def async_app(url):
+    engine = build_async_engine(url)
+    AsyncSession = async_sessionmaker(engine)
+
+    async def get_bench_async_db():
+        async with AsyncSession() as session:
+            yield session
+    asgi_app = FastAPI()
+    asgi_app.include_router(router)
+    asgi_app.dependency_overrides[get_async_db] = get_bench_async_db
+    return asgi_app, engine
+
+
+@click.command()
+@click.option("--clients", default=500, help="Concurrent clients")
+@click.option("--requests", default=10, help="Requests per client")
+@click.option("--trips", default=20, help="Trips owned by the benchmark user")
+def main(clients, requests, trips):
+    with temporary_database() as (url, engine, Session):
+        seed(Session, trips)
+
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = pooled_dependency(Session)
+        try:
+            UserManagement.token_cache.clear()
+            results = {"sync": asyncio.run(load_test(app, clients, requests))}
+        finally:
+            app.dependency_overrides.clear()
+
+        async def run_async():
+            asgi_app, async_engine = async_app(url)
+            try:
+                return await load_test(asgi_app, clients, requests)
+            finally:
+                await async_engine.dispose()
+        UserManagement.token_cache.clear()
+        results["async"] = asyncio.run(run_async())
+
+        for mode, (latencies, elapsed) in results.items():
+            print(
+                f"{mode:>6}: p50 {percentile(latencies, 50) * 1000:8.1f} ms, "
+                f"p99 {percentile(latencies, 99) * 1000:8.1f} ms, "
+                f"{len(latencies) / elapsed:7.1f} req/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
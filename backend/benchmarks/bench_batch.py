@@ -0,0 +1,107 @@
+"""
+    Latency of building a trip itinerary on a file database: a trip, `--events` events and
+    `--expenses` expenses, written
+    - "separate": with one request per operation, as the UI does with the single endpoints, each
+      authenticating the token and committing its own transaction
+    - "batch": with a single POST /batch, authenticated once and committed once
+    Reports the wall time per itinerary and the statements and commits each one took.
+
+    Usage: python -m benchmarks.bench_batch [--itineraries 20] [--events 30] [--expenses 5]
+"""
+import click
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import Timer, percentile, temporary_database
+from core.config import settings
+from core.db import get_db, get_read_db
+from main import app
+from models.user_base import Token, User
+
+
+def itinerary(number: int, events: int, expenses: int, user_ids):
+    trip = {"startDate": "2023-04-01", "endDate": "2023-04-30", "origin": f"Origin {number}", "destination": "Lisbon"}
+    operations = [{"op": "create_trip", "args": trip}]
+    operations += [
+        {"op": "add_event", "args": {"description": f"Event {i}", "time": f"2023-04-{i % 30 + 1:02d}", "trip_id": "$0"}}
+        for i in range(events)
+    ]
+    operations += [
+        {"op": "create_expense", "args": {
+            "trip_id": "$0", "description": f"Expense {i}", "paid_user_id": user_ids[0],
+            "details": [{"owe_user_id": user_ids[0], "amount": 1000 + i}],
+        }}
+        for i in range(expenses)
+    ]
+    return operations
+
+
+@click.command()
+@click.option("--itineraries", default=20, help="Itineraries written each way")
+@click.option("--events", default=30, help="Events per itinerary")
+@click.option("--expenses", default=5, help="Expenses per itinerary")
+def main(itineraries, events, expenses):
+    settings.password_hash_iterations = 1000
+    with temporary_database() as (url, engine, Session):
+        session = Session()
+        user = User(username="bench", password="pw", full_name="Bench")
+        session.add(user)
+        session.flush()
+        session.add(Token(token="bench-token", user_id=user.id))
+        session.commit()
+        user_ids = [user.id]
+        session.close()
+
+        counts = {"statements": 0, "commits": 0}
+
+        def count_statement(*args):
+            counts["statements"] += 1
+
+        def count_commit(conn):
+            counts["commits"] += 1
+        event.listen(engine, "before_cursor_execute", count_statement)
+        event.listen(engine, "commit", count_commit)
+
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = pooled_dependency(Session)
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer bench-token"}
+        paths = {"create_trip": "/trip/create", "add_event": "/trip/add-event"}
+        try:
+            click.echo(f"Itinerary of 1 trip, {events} events and {expenses} expenses")
+            click.echo(f"{'':<10}{'p50 ms':>9}{'p99 ms':>9}{'statements':>12}{'commits':>9}")
+            for label in ("separate", "batch"):
+                samples = []
+                counts.update(statements=0, commits=0)
+                for number in range(itineraries):
+                    operations = itinerary(number, events, expenses, user_ids)
+                    if label == "batch":
+                        with Timer() as timer:
+                            response = client.post("/batch", json={"operations": operations}, headers=headers)
+                        assert response.status_code == 200, response.text
+                        samples.append(timer.elapsed)
+                        continue
+                    elapsed, trip_id = 0.0, None
+                    for operation in operations:
+                        args = {key: trip_id if value == "$0" else value for key, value in operation["args"].items()}
+                        path = f"/trip/{trip_id}/expenses" if operation["op"] == "create_expense" else paths[operation["op"]]
+                        with Timer() as timer:
+                            response = client.post(path, json=args, headers=headers)
+                        assert response.status_code == 200, response.text
+                        elapsed += timer.elapsed
+                        if operation["op"] == "create_trip":
+                            # /trip/create does not return the id, looked up outside of the measures
+                            with engine.connect() as conn:
+                                trip_id = conn.exec_driver_sql("SELECT max(id) FROM trips").scalar()
+                            counts["statements"] -= 1
+                    samples.append(elapsed)
+                click.echo(
+                    f"{label:<10}{percentile(samples, 50) * 1000:>9.1f}{percentile(samples, 99) * 1000:>9.1f}"
+                    f"{counts['statements'] / itineraries:>12.0f}{counts['commits'] / itineraries:>9.0f}"
+                )
+        finally:
+            app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+    Latency of /calendar pages on a seeded dataset (see core.seeding), for the user with the most
+    trips and for a typical one, on windows of increasing width, comparing:
+    - "page 1" / "page 10": `models.calendar.calendar_page`, the single statement merging the
+      index ranges of the user's trips
+    - "heap merge": the first page merged in Python with `heapq.merge` from one DB-API cursor per
+      trip, each reading its trip's index range in order
+    The first page is also timed through GET /calendar.
+
+    Usage: python -m benchmarks.bench_calendar [--trips 100000] [--users 10000] [--requests 5] [--limit 100]
+"""
+import heapq
+import time
+from datetime import date
+from itertools import islice
+
+import click
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import Timer, percentile, temporary_database
+from core.config import settings
+from core.db import get_db, get_read_db
+from core.seeding import seed_database
+from main import app
+from models.calendar import calendar_events, calendar_page, user_trip_ids
+from models.trips import TripUsers
+from models.user_base import Token
+
+# Seeded trips start between 2020-01-01 and 2025-06-22
+WINDOWS = [
+    ("week", date(2022, 3, 1), date(2022, 3, 7)),
+    ("month", date(2022, 3, 1), date(2022, 3, 31)),
+    ("year", date(2022, 1, 1), date(2022, 12, 31)),
+    ("all", date(2020, 1, 1), date(2025, 12, 31)),
+]
+
+TRIP_EVENTS = "SELECT time, trip_id, id, description FROM trip_event WHERE trip_id = ? AND time >= ? AND time <= ? ORDER BY time, id"
+
+
+def timed(function, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        with Timer() as timer:
+            result = function()
+        samples.append(timer.elapsed)
+    return percentile(samples, 50), result
+
+
+def heap_merge_page(session, trip_ids, start: date, end: date, limit: int):
+    connection = session.connection().connection
+    cursors = [connection.cursor().execute(TRIP_EVENTS, (trip_id, start.isoformat(), end.isoformat())) for trip_id in trip_ids]
+    try:
+        return list(islice(heapq.merge(*cursors), limit))
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+
+@click.command()
+@click.option("--trips", default=100000, help="Trips in the database")
+@click.option("--users", default=10000, help="Users in the database")
+@click.option("--requests", default=5, help="Rounds per measure")
+@click.option("--limit", default=100, help="Page size")
+def main(trips, users, requests, limit):
+    settings.password_hash_iterations = 1000
+    with temporary_database() as (url, engine, Session):
+        start = time.perf_counter()
+        seed_database(engine, users=users, trips=trips, max_trip_size=8, expenses_per_participant=0.1)
+        click.echo(f"Seeded {trips} trips in {time.perf_counter() - start:.1f} s")
+        session = Session()
+        busiest = session.execute(
+            select(TripUsers.user_id).group_by(TripUsers.user_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        for user_id in (busiest, users // 2):
+            trip_ids = session.execute(user_trip_ids(user_id)).scalars().all()
+            click.echo(f"User {user_id}: {len(trip_ids)} trips")
+            click.echo(f"{'window':<8}{'events':>8}{'page 1':>9}{'page 10':>9}{'heap merge':>12}  (ms, p50, pages of {limit})")
+            for label, first, last in WINDOWS:
+                count = session.execute(select(func.count()).select_from(calendar_events(user_id, first, last).subquery())).scalar()
+                first_time, (events, after) = timed(lambda: calendar_page(session, user_id, first, last, limit), requests)
+                for _ in range(8):
+                    if after is None:
+                        break
+                    _, after = calendar_page(session, user_id, first, last, limit, after)
+                tenth_time = timed(lambda: calendar_page(session, user_id, first, last, limit, after), requests)[0] if after else float("nan")
+                merge_time, rows = timed(lambda: heap_merge_page(session, trip_ids, first, last, limit), requests)
+                assert [(row[1], row[2]) for row in rows] == [(event["tripId"], event["id"]) for event in events]
+                click.echo(f"{label:<8}{count:>8}{first_time * 1000:>9.2f}{tenth_time * 1000:>9.2f}{merge_time * 1000:>12.2f}")
+
+        session.add(Token(token="bench-token", user_id=busiest))
+        session.commit()
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = pooled_dependency(Session)
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer bench-token"}
+        try:
+            click.echo(f"GET /calendar of user {busiest}, first page of {limit} (ms, p50)")
+            for label, first, last in WINDOWS:
+                params = {"from": first.isoformat(), "to": last.isoformat(), "limit": limit}
+                request_time, _ = timed(lambda: client.get("/calendar", params=params, headers=headers), requests)
+                click.echo(f"{label:<8}{request_time * 1000:>9.2f}")
+        finally:
+            app.dependency_overrides.clear()
+            session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+    Owed amounts imported per second by `POST /trip/{trip_id}/expenses/import`, as JSON
+    and as CSV, versus one `POST /trip/{trip_id}/expenses` request per expense ("per-request").
+
+    Usage: python -m benchmarks.bench_expense_import [--expenses 10000] [--participants 20]
+"""
+import json
+import random
+from datetime import date
+
+import click
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import Timer, temporary_database
+from core.db import get_db
+from main import app
+from models.expenses import check_trip_balances
+from models.trips import Trip, TripUsers
+from models.user_base import Token, User
+
+HEADERS = {"Authorization": "Bearer bench-token"}
+
+
+def seed(Session, participants: int) -> int:
+    session = Session()
+    users = [User(username=f"user{i}", password="pw", full_name=f"User {i}") for i in range(participants)]
+    session.add_all(users)
+    session.flush()
+    session.add(Token(token="bench-token", user_id=users[0].id))
+    trip = Trip(start_date=date(2023, 1, 1), end_date=date(2023, 1, 10), origin="A", destination="B", user_id=users[0].id)
+    session.add(trip)
+    session.flush()
+    session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users])
+    session.commit()
+    trip_id = trip.id
+    session.close()
+    return trip_id
+
+
+def generate(trip_id: int, expenses: int, participants: int, lines: int):
+    rng = random.Random(7)
+    return [
+        {
+            "trip_id": trip_id,
+            "description": f"Expense {i}",
+            "paid_user_id": rng.randint(1, participants),
+            "details": [
+                {"owe_user_id": owe_user_id, "amount": rng.randint(100, 10000)}
+                for owe_user_id in rng.sample(range(1, participants + 1), lines)
+            ],
+        }
+        for i in range(expenses)
+    ]
+
+
+def to_csv(expenses) -> str:
+    rows = ["ref,description,paid_user_id,owe_user_id,amount"]
+    for ref, expense in enumerate(expenses):
+        rows.extend(
+            f"{ref},{expense['description']},{expense['paid_user_id']},{detail['owe_user_id']},{detail['amount']}"
+            for detail in expense["details"]
+        )
+    return "\n".join(rows) + "\n"
+
+
+def import_per_request(client, trip_id, expenses):
+    for expense in expenses:
+        response = client.post(f"/trip/{trip_id}/expenses", headers=HEADERS, json=expense)
+        assert response.status_code == 200, response.text
+
+
+def import_json(client, trip_id, expenses):
+    response = client.post(f"/trip/{trip_id}/expenses/import", headers=HEADERS, content=json.dumps(expenses))
+    assert response.status_code == 200, response.text
+
+
+def import_csv(client, trip_id, expenses):
+    response = client.post(
+        f"/trip/{trip_id}/expenses/import",
+        headers={**HEADERS, "Content-Type": "text/csv"},
+        content=to_csv(expenses),
+    )
+    assert response.status_code == 200, response.text
+
+
+@click.command()
+@click.option("--expenses", default=10000, help="Expenses per import")
+@click.option("--participants", default=20, help="Participants of the trip")
+@click.option("--lines", default=4, help="Owing users per expense")
+@click.option("--per-request", default=500, help="Expenses created one request at a time, for comparison")
+def main(expenses, participants, lines, per_request):
+    modes = (
+        ("per-request", import_per_request, per_request),
+        ("json", import_json, expenses),
+        ("csv", import_csv, expenses),
+    )
+    for mode, run, count in modes:
+        with temporary_database() as (url, engine, Session):
+            trip_id = seed(Session, participants)
+            payload = generate(trip_id, count, participants, lines)
+            app.dependency_overrides[get_db] = pooled_dependency(Session)
+            try:
+                with Timer() as timer:
+                    run(TestClient(app), trip_id, payload)
+            finally:
+                app.dependency_overrides.clear()
+            session = Session()
+            assert check_trip_balances(session, trip_id) == []
+            session.close()
+            print(f"{mode:>12}: {count * lines / timer.elapsed:10.0f} lines/s ({count} expenses, {timer.elapsed * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+    Time and query count of loading the expenses and summary of one trip.
+
+    Compares `load_expenses_with_summary_for_trip` with the former per-expense path,
+    which ran one query per expense for its owed amounts, one for the paying user and
+    one for the owing users (and loaded everything twice to build the summary).
+
+    Usage: python -m benchmarks.bench_expenses [--expenses 10000] [--participants 20]
+"""
+import random
+
+import click
+from sqlalchemy import event
+
+from benchmarks.common import Timer, temporary_database
+from models.expenses import Expense, ExpenseMeta, load_expenses_with_summary_for_trip
+from models.user_base import User
+
+
+def seed(engine, expenses: int, participants: int, lines: int):
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "password": "pw", "full_name": f"User {i}"}
+            for i in range(1, participants + 1)
+        ])
+        conn.execute(ExpenseMeta.__table__.insert(), [
+            {"id": i, "trip_id": 1, "paid_user_id": rng.randint(1, participants), "description": f"Expense {i}"}
+            for i in range(1, expenses + 1)
+        ])
+        conn.execute(Expense.__table__.insert(), [
+            {"expense_id": i, "owe_user_id": owe_user_id, "amount": rng.randint(100, 10000)}
+            for i in range(1, expenses + 1)
+            for owe_user_id in rng.sample(range(1, participants + 1), lines)
+        ])
+
+
+def load_per_expense(session, trip_id):
+    def convert(meta):
+        session.query(Expense).filter(Expense.expense_id == meta.id).all()
+        session.query(User).filter(User.id == meta.paid_user_id).first()
+        session.query(User).join(Expense, Expense.owe_user_id == User.id).filter(Expense.expense_id == meta.id).all()
+    for _ in range(2):
+        for meta in session.query(ExpenseMeta).filter(ExpenseMeta.trip_id == trip_id).all():
+            convert(meta)
+
+
+def measure(engine, Session, load):
+    statements = []
+    record = lambda *args: statements.append(args[2])
+    session = Session()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with Timer() as timer:
+            load(session, 1)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        session.close()
+    return timer.elapsed, len(statements)
+
+
+@click.command()
+@click.option("--expenses", default=10000, help="Expenses of the trip")
+@click.option("--participants", default=20, help="Participants of the trip")
+@click.option("--lines", default=4, help="Owing users per expense")
+def main(expenses, participants, lines):
+    with temporary_database() as (url, engine, Session):
+        seed(engine, expenses, participants, lines)
+        for name, load in (("per-expense", load_per_expense), ("aggregated", load_expenses_with_summary_for_trip)):
+            elapsed, queries = measure(engine, Session, load)
+            print(f"{name:>12}: {elapsed * 1000:9.1f} ms, {queries:6d} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+    `/login` throughput with PBKDF2 password hashing in the process pool of `core.passwords`,
+    for an increasing number of hashing processes, and the share of requests rejected with 503.
+
+    Usage: python -m benchmarks.bench_login [--logins 200] [--concurrency 32] [--iterations 600000]
+"""
+import asyncio
+import os
+import time
+
+import click
+import httpx
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import temporary_database
+from core.config import settings
+from core.db import get_db
+from core.passwords import hash_password, hasher
+from main import app
+from models.user_base import User
+
+
+def seed(Session, users: int):
+    stored = hash_password("bench-password")
+    session = Session()
+    session.add_all([User(username=f"user{i}", password=stored, full_name=f"User {i}") for i in range(users)])
+    session.commit()
+    session.close()
+
+
+async def run(logins: int, concurrency: int, users: int):
+    statuses = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        async def login(i):
+            async with semaphore:
+                response = await client.post("/login", auth=(f"user{i % users}", "bench-password"))
+                statuses.append(response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+    return statuses, elapsed
+
+
+@click.command()
+@click.option("--logins", default=200, help="Logins per run")
+@click.option("--concurrency", default=32, help="Logins in flight at a time")
+@click.option("--iterations", default=settings.password_hash_iterations, help="PBKDF2 iterations")
+@click.option("--max-pending", default=settings.password_max_pending, help="Hashes queued or running before 503")
+def main(logins, concurrency, iterations, max_pending):
+    settings.password_hash_iterations = iterations
+    hasher.max_pending = max_pending
+    users = 50
+    with temporary_database() as (url, engine, Session):
+        seed(Session, users)
+        app.dependency_overrides[get_db] = pooled_dependency(Session)
+        try:
+            workers = 1
+            while workers <= os.cpu_count():
+                hasher.shutdown()
+                hasher.workers = workers
+                statuses, elapsed = asyncio.run(run(logins, concurrency, users))
+                ok = statuses.count(200)
+                print(
+                    f"{workers:>3} processes: {ok / elapsed:7.1f} logins/s, "
+                    f"{ok / elapsed / workers:7.1f} logins/s/core, "
+                    f"{statuses.count(503)} rejected with 503"
+                )
+                workers *= 2
+        finally:
+            app.dependency_overrides.clear()
+            hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+    Overhead of `core.metrics.MetricsMiddleware` per request: a trivial ASGI app is called
+    directly, with and without the middleware, and the difference of the mean call times is
+    reported. A query timed by the SQLAlchemy cursor events is measured the same way.
+
+    Usage: python -m benchmarks.bench_metrics [--requests 200000]
+"""
+import asyncio
+import time
+
+import click
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+
+from core.metrics import MetricsMiddleware, MetricsRegistry, RequestStats, current_request_stats, instrument_engines
+
+SCOPE = {"type": "http", "method": "GET", "path": "/items/1", "query_string": b"", "headers": []}
+
+
+async def plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def time_calls(app, requests: int) -> float:
+    # Routed as by starlette: the endpoint and app are in the scope once the app returns
+    endpoint_app = FastAPI()
+    endpoint_app.get("/items/{item_id}")(plain_app)
+    scope = {**SCOPE, "app": endpoint_app, "endpoint": plain_app}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def time_queries(queries: int) -> float:
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for _ in range(queries):
+            conn.exec_driver_sql("SELECT 1")
+        return (time.perf_counter() - start) / queries
+
+
+@click.command()
+@click.option("--requests", default=200000, help="Calls of each app")
+def main(requests):
+    bare = min(asyncio.run(time_calls(plain_app, requests)) for _ in range(3))
+    wrapped = min(asyncio.run(time_calls(MetricsMiddleware(plain_app, registry=MetricsRegistry()), requests)) for _ in range(3))
+    click.echo(f"bare app:         {bare * 1e6:6.2f} us/request")
+    click.echo(f"with middleware:  {wrapped * 1e6:6.2f} us/request")
+    click.echo(f"overhead:         {(wrapped - bare) * 1e6:6.2f} us/request")
+
+    plain = min(time_queries(requests // 4) for _ in range(3))
+    instrument_engines()
+    token = current_request_stats.set(RequestStats())
+    timed = min(time_queries(requests // 4) for _ in range(3))
+    current_request_stats.reset(token)
+    click.echo(f"query overhead:   {(timed - plain) * 1e6:6.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+    Requests/sec on `/my-trips` with the per-request engine that `core.db.get_db`
+    used to build ("legacy") versus the process-wide pooled engine ("pooled").
+
+    Usage: python -m benchmarks.bench_my_trips [--trips 20] [--requests 500]
+"""
+from datetime import date
+
+import click
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import Timer, temporary_database
+from core import user_management
+from core.db import get_db, get_read_db
+from main import app
+from models.trips import Trip, TripEvent, TripUsers
+from models.user_base import Token, User
+
+
+def seed(Session, trips: int):
+    session = Session()
+    user = User(username="bench", password="bench", full_name="Bench User")
+    session.add(user)
+    session.flush()
+    session.add(Token(token="bench-token", user_id=user.id))
+    for i in range(trips):
+        trip = Trip(start_date=date(2023, 1, 1), end_date=date(2023, 1, 10),
+                    origin=f"Origin {i}", destination=f"Destination {i}", user_id=user.id)
+        session.add(trip)
+        session.flush()
+        session.add(TripUsers(user_id=user.id, trip_id=trip.id))
+        session.add(TripEvent(description=f"Event {i}", time=date(2023, 1, 2), trip_id=trip.id))
+    session.commit()
+    session.close()
+
+
+def legacy_dependency(url):
+    def get_legacy_db():
+        engine = create_engine(url)
+        user_management.create_tables(engine)
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    return get_legacy_db
+
+
+def pooled_dependency(Session):
+    def get_pooled_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+    return get_pooled_db
+
+
+def run(client, requests: int) -> float:
+    headers = {"Authorization": "Bearer bench-token"}
+    client.get("/my-trips", headers=headers)
+    with Timer() as timer:
+        for _ in range(requests):
+            response = client.get("/my-trips", headers=headers)
+            assert response.status_code == 200, response.text
+    return requests / timer.elapsed
+
+
+@click.command()
+@click.option("--trips", default=20, help="Trips owned by the benchmark user")
+@click.option("--requests", default=500, help="Requests per mode")
+def main(trips, requests):
+    with temporary_database() as (url, engine, Session):
+        seed(Session, trips)
+        client = TestClient(app)
+        results = {}
+        for mode, dependency in (("legacy", legacy_dependency(url)), ("pooled", pooled_dependency(Session))):
+            app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = dependency
+            try:
+                results[mode] = run(client, requests)
+            finally:
+                app.dependency_overrides.clear()
+        for mode, rps in results.items():
+            print(f"{mode:>8}: {rps:8.1f} req/s")
+        print(f"speedup: {results['pooled'] / results['legacy']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
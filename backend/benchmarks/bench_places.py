@@ -0,0 +1,119 @@
+"""
+    Memory footprint and latency of the `core.prefix_index.PrefixIndex` behind
+    /destinations/suggest, for synthetic distinct place names with Zipf-like trip counts.
+
+    Reports the memory allocated by `load` (tracemalloc), the latency of `suggest` per prefix
+    length, on the first lookup of a prefix (cold) and on the next ones (warm), and the latency of
+    `add`/`remove`, i.e. of a trip creation or deletion.
+
+    Usage: python -m benchmarks.bench_places [--places 1000000] [--lookups 2000] [--changes 2000] [--cache-threshold 64]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+import click
+
+from benchmarks.common import Timer, percentile
+from core.prefix_index import PrefixIndex
+
+SYLLABLES = [
+    "ba", "be", "bo", "ca", "ce", "da", "di", "el", "fa", "fo", "ga", "gre", "ha", "in", "ka", "la", "le",
+    "li", "lo", "ma", "me", "mi", "mo", "na", "ne", "no", "or", "pa", "po", "ra", "re", "ri", "ro", "sa",
+    "se", "so", "ta", "te", "to", "tra", "va", "ve", "vi", "za", "zu", "ber", "burg", "dorf", "ville", "ton",
+]
+QUALIFIERS = ["", "", "", "San ", "Saint-", "New ", "Bad ", "Porto ", "Santa ", "El "]
+
+
+def place_names(count: int, rng: random.Random):
+    seen = set()
+    while len(seen) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        name = rng.choice(QUALIFIERS) + name
+        if rng.random() < 0.1:
+            name = name.replace("a", "á", 1)
+        if name.lower() in seen:
+            name = f"{name} {len(seen)}"
+        seen.add(name.lower())
+        yield name
+
+
+def report_latencies(label: str, samples):
+    click.echo(
+        f"{label:<22}{percentile(samples, 50) * 1e6:>9.1f}{percentile(samples, 99) * 1e6:>9.1f}"
+        f"{max(samples) * 1e6:>9.1f}"
+    )
+
+
+@click.command()
+@click.option("--places", default=1_000_000, help="Distinct place names")
+@click.option("--lookups", default=2000, help="Lookups per prefix length")
+@click.option("--changes", default=2000, help="Trip creations and deletions")
+@click.option("--cache-threshold", default=64, help="PrefixIndex.cache_threshold")
+@click.option("--seed", default=7, help="Random seed")
+def main(places, lookups, changes, cache_threshold, seed):
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    counted = [(name, max(1, int(1000 / rank ** 0.8))) for rank, name in enumerate(place_names(places, rng), 1)]
+    rng.shuffle(counted)
+    click.echo(f"{places} places generated in {time.perf_counter() - start:.1f}s")
+
+    index = PrefixIndex(cache_threshold=cache_threshold)
+    with Timer() as timer:
+        index.load(counted)
+    click.echo(f"load: {timer.elapsed:.1f}s, {len(index)} keys")
+
+    # Loaded again under tracemalloc, which slows it down several times
+    index = None
+    gc.collect()
+    tracemalloc.start()
+    index = PrefixIndex(cache_threshold=cache_threshold)
+    # Fresh strings, as fetched from the database by `models.places.reload_places`
+    index.load((name.encode().decode(), count) for name, count in counted)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    click.echo(f"memory: {current / 2 ** 20:.1f} MiB retained ({current / len(index):.0f} B per place), {peak / 2 ** 20:.1f} MiB peak")
+    strings = sum(sys.getsizeof(key) for key in index._keys) + sum(sys.getsizeof(name) for key, name in zip(index._keys, index._names) if name is not key)
+    arrays = sys.getsizeof(index._keys) + sys.getsizeof(index._names) + sys.getsizeof(index._counts)
+    click.echo(f"  strings {strings / 2 ** 20:.1f} MiB, sorted arrays {arrays / 2 ** 20:.1f} MiB, cached tops {(current - strings - arrays) / 2 ** 20:.1f} MiB for {len(index._top)} prefixes")
+    shared = sum(1 for key, name in zip(index._keys, index._names) if key is name)
+    click.echo(f"names sharing their key: {shared / len(index):.0%}")
+
+    keys = index._keys
+    click.echo(f"{'suggest, µs':<22}{'p50':>9}{'p99':>9}{'max':>9}")
+    for length in (1, 2, 3, 4, 6):
+        prefixes = list({key[:length] for key in rng.sample(keys, min(lookups, len(keys)))})
+        cold, warm = [], []
+        for prefix in prefixes:
+            with Timer() as timer:
+                index.suggest(prefix, 10)
+            cold.append(timer.elapsed)
+            with Timer() as timer:
+                index.suggest(prefix, 10)
+            warm.append(timer.elapsed)
+        report_latencies(f"{length} chars, cold", cold)
+        report_latencies(f"{length} chars, warm", warm)
+    click.echo(f"cached prefixes: {len(index._top)}")
+
+    click.echo(f"{'change, µs':<22}{'p50':>9}{'p99':>9}{'max':>9}")
+    names = [name for name, _ in rng.sample(counted, changes)]
+    new_names = list(place_names(changes, random.Random(seed + 1)))
+    for label, change, values in (
+        ("add existing", index.add, names),
+        ("remove existing", index.remove, names),
+        ("add new", index.add, [f"{name} Nuevo" for name in new_names]),
+        ("remove last trip", index.remove, [f"{name} Nuevo" for name in new_names]),
+    ):
+        samples = []
+        for name in values:
+            with Timer() as timer:
+                change(name)
+            samples.append(timer.elapsed)
+        report_latencies(label, samples)
+
+
+if __name__ == "__main__":
+    main()
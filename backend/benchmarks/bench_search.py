@@ -0,0 +1,76 @@
+"""
+    Latency of `/trips/search` queries of increasing selectivity on a seeded dataset (see
+    core.seeding), for the index lookup alone (`search_trip_ids`) of the first and second pages,
+    and the whole request of the first page.
+
+    Usage: python -m benchmarks.bench_search [--trips 1000000] [--requests 50]
+"""
+import time
+
+import click
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import percentile, temporary_database
+from core.config import settings
+from core.db import get_db, get_read_db
+from core.seeding import seed_database
+from main import app
+from models.search import search_trip_ids
+from models.user_base import Token
+
+QUERIES = [
+    ("rare word", "Reykjavik Marrakesh"),
+    ("event + place", "concert tokyo"),
+    ("common word", "paris"),
+    ("prefix", "ba"),
+]
+
+
+@click.command()
+@click.option("--trips", default=1000000, help="Trips in the database")
+@click.option("--requests", default=50, help="Requests per query")
+@click.option("--limit", default=50, help="Page size")
+def main(trips, requests, limit):
+    settings.password_hash_iterations = 1000
+    with temporary_database() as (url, engine, Session):
+        start = time.perf_counter()
+        seed_database(engine, users=max(trips // 10, 100), trips=trips, max_trip_size=5, expenses_per_participant=0.5)
+        click.echo(f"Seeded and indexed {trips} trips in {time.perf_counter() - start:.1f} s")
+        session = Session()
+        session.add(Token(token="bench-token", user_id=1))
+        session.commit()
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = pooled_dependency(Session)
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer bench-token"}
+        try:
+            click.echo(
+                f"{'query':<16}{'ranked':>9}{'index p50':>11}{'index p95':>11}{'page 2 p50':>12}"
+                f"{'request p50':>13}{'request p95':>13}  (ms)"
+            )
+            for label, q in QUERIES:
+                ranked = len(search_trip_ids(session, q, trips)[0])
+                index_samples, next_samples, request_samples = [], [], []
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    _, after = search_trip_ids(session, q, limit)
+                    index_samples.append(time.perf_counter() - start)
+                    if after is not None:
+                        start = time.perf_counter()
+                        search_trip_ids(session, q, limit, after)
+                        next_samples.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    client.get("/trips/search", params={"q": q, "limit": limit}, headers=headers)
+                    request_samples.append(time.perf_counter() - start)
+                click.echo(
+                    f"{label:<16}{ranked:>9}{percentile(index_samples, 50) * 1000:>11.1f}{percentile(index_samples, 95) * 1000:>11.1f}"
+                    f"{percentile(next_samples, 50) * 1000:>12.2f}"
+                    f"{percentile(request_samples, 50) * 1000:>13.1f}{percentile(request_samples, 95) * 1000:>13.1f}"
+                )
+        finally:
+            app.dependency_overrides.clear()
+            session.close()
+
+
+if __name__ == "__main__":
+    main()
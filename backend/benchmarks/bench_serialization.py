@@ -0,0 +1,85 @@
+"""
+    CPU time and bytes on the wire of a TripsOut listing, per 1k trips, for:
+    - "pydantic": TripOut models, then FastAPI's jsonable_encoder and stdlib json (before)
+    - "dicts + json" / "dicts + orjson": `convert_trips_to_dicts` encoded by `core.fast_json`
+    Loading (the queries and building the trips) and encoding are timed separately, and the
+    encoded page is gzipped at a few levels.
+
+    Usage: python -m benchmarks.bench_serialization [--trips 5000] [--max-trip-size 50] [--rounds 3]
+"""
+import gzip
+import json
+import time
+
+import click
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import temporary_database
+from core.config import settings
+from core.fast_json import dumps
+from core.seeding import seed_database
+from models.trips import Trip, TripsOut, convert_trips, convert_trips_to_dicts
+
+
+def stdlib_dumps(value) -> bytes:
+    return json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def measure(load, encode, rounds: int):
+    best_load = best_encode = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        page = load()
+        loaded = time.process_time()
+        body = encode(page)
+        best_load = min(best_load, loaded - start)
+        best_encode = min(best_encode, time.process_time() - loaded)
+    return best_load, best_encode, body
+
+
+@click.command()
+@click.option("--trips", default=5000, help="Trips in the listing")
+@click.option("--max-trip-size", default=50, help="Largest number of participants of a trip")
+@click.option("--rounds", default=3, help="Best of this many rounds")
+def main(trips, max_trip_size, rounds):
+    settings.password_hash_iterations = 1000
+    with temporary_database() as (url, engine, Session):
+        seed_database(engine, users=max(trips, 1000), trips=trips, max_trip_size=max_trip_size, batch_size=10000)
+        session = Session()
+        rows = session.query(Trip).order_by(Trip.id).all()
+        variants = {
+            "pydantic": (
+                lambda: TripsOut(trips=convert_trips(session, rows), next_cursor=None),
+                lambda page: stdlib_dumps(jsonable_encoder(page)),
+            ),
+            "dicts + json": (
+                lambda: {"trips": convert_trips_to_dicts(session, rows), "next_cursor": None},
+                stdlib_dumps,
+            ),
+            "dicts + orjson": (
+                lambda: {"trips": convert_trips_to_dicts(session, rows), "next_cursor": None},
+                dumps,
+            ),
+        }
+        per_1k = 1000 / trips
+        click.echo(f"{trips} trips, CPU ms per 1k trips")
+        click.echo(f"{'variant':<16}{'load':>9}{'encode':>9}{'total':>9}{'KiB':>9}")
+        for name, (load, encode) in variants.items():
+            load_time, encode_time, body = measure(load, encode, rounds)
+            click.echo(
+                f"{name:<16}{load_time * per_1k * 1000:>9.1f}{encode_time * per_1k * 1000:>9.1f}"
+                f"{(load_time + encode_time) * per_1k * 1000:>9.1f}{len(body) * per_1k / 1024:>9.1f}"
+            )
+        session.close()
+
+    click.echo("gzip of the page, per 1k trips")
+    click.echo(f"{'level':<16}{'CPU ms':>9}{'KiB':>9}{'ratio':>9}")
+    for level in (1, 6, 9):
+        start = time.process_time()
+        compressed = gzip.compress(body, compresslevel=level)
+        elapsed = time.process_time() - start
+        click.echo(f"{level:<16}{elapsed * per_1k * 1000:>9.1f}{len(compressed) * per_1k / 1024:>9.1f}{len(body) / len(compressed):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
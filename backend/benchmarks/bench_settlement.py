@@ -0,0 +1,38 @@
+"""
+    Time to settle random trip balances with the greedy and exact settlement engines.
+
+    Usage: python -m benchmarks.bench_settlement [--participants 1000 --participants 10000]
+"""
+import random
+
+import click
+
+from benchmarks.common import Timer
+from models.settlement import EXACT_SETTLEMENT_MAX_USERS, settle_exact, settle_greedy
+
+
+def random_balances(rng, participants: int):
+    values = [rng.randint(-100000, 100000) for _ in range(participants - 1)]
+    values.append(-sum(values))
+    return {f"user{i}": value for i, value in enumerate(values)}
+
+
+@click.command()
+@click.option("--participants", multiple=True, type=int, default=[100, 1000, 10000])
+@click.option("--repeat", default=5, help="Runs per size, the best one is reported")
+def main(participants, repeat):
+    rng = random.Random(11)
+    runs = [("greedy", settle_greedy, size) for size in participants]
+    runs.append(("exact", settle_exact, EXACT_SETTLEMENT_MAX_USERS))
+    for name, settle, size in runs:
+        net = random_balances(rng, size)
+        best = None
+        for _ in range(repeat):
+            with Timer() as timer:
+                transfers = settle(net)
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+        print(f"{name:>6} {size:6d} users: {best * 1000:8.2f} ms, {len(transfers)} transfers")
+
+
+if __name__ == "__main__":
+    main()
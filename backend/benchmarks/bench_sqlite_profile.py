@@ -0,0 +1,120 @@
+"""
+    Concurrent reads and writes on a SQLite file with SQLite's defaults (rollback journal,
+    synchronous=full, one pool) versus the performance profile of `core.config.settings`
+    (WAL, synchronous=normal, mmap, larger cache) with a separate read-only pool.
+
+    Writer threads add expenses to one trip while reader threads load the expenses and summary
+    of another one, so the cost of a read does not grow during the run.
+
+    Usage: python -m benchmarks.bench_sqlite_profile [--seconds 5] [--readers 4] [--writers 2]
+"""
+import threading
+import time
+
+import click
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import percentile, temporary_database
+from core.config import settings
+from core.db import build_engine
+from models.expenses import CreateExpenseRequest, OweUserDetail, create_expenses, load_expenses_with_summary_for_trip
+from models.trips import Trip, TripUsers
+from models.user_base import User
+
+DEFAULTS = {
+    "sqlite_journal_mode": "delete",
+    "sqlite_synchronous": "full",
+    "sqlite_mmap_size": 0,
+    "sqlite_cache_size": -2000,
+}
+
+
+def seed(Session, participants: int, expenses: int):
+    session = Session()
+    users = [User(username=f"user{i}", password="pw", full_name=f"User {i}") for i in range(participants)]
+    session.add_all(users)
+    session.flush()
+    trips = [Trip(origin="A", destination=destination, user_id=users[0].id) for destination in ("Read", "Write")]
+    session.add_all(trips)
+    session.flush()
+    session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users for trip in trips])
+    session.commit()
+    trip_ids, user_ids = [trip.id for trip in trips], [user.id for user in users]
+    for i in range(expenses):
+        create_expenses(session, expense(trip_ids[0], user_ids, i))
+    session.close()
+    return trip_ids, user_ids
+
+
+def expense(trip_id, user_ids, i) -> CreateExpenseRequest:
+    return CreateExpenseRequest(
+        trip_id=trip_id,
+        description=f"Expense {i}",
+        paid_user_id=user_ids[i % len(user_ids)],
+        details=[OweUserDetail(owe_user_id=user_id, amount=100) for user_id in user_ids[:3]],
+    )
+
+
+def run(WriteSession, ReadSession, trip_ids, user_ids, seconds, readers, writers):
+    read_trip_id, write_trip_id = trip_ids
+    deadline = time.perf_counter() + seconds
+    read_latencies, write_latencies = [], []
+
+    def read():
+        session = ReadSession()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            load_expenses_with_summary_for_trip(session, read_trip_id)
+            session.rollback()
+            read_latencies.append(time.perf_counter() - start)
+        session.close()
+
+    def write():
+        session = WriteSession()
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            create_expenses(session, expense(write_trip_id, user_ids, i))
+            write_latencies.append(time.perf_counter() - start)
+            i += 1
+        session.close()
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    threads += [threading.Thread(target=write) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return read_latencies, write_latencies
+
+
+@click.command()
+@click.option("--seconds", default=5, help="Duration of each run")
+@click.option("--readers", default=4, help="Reader threads")
+@click.option("--writers", default=2, help="Writer threads")
+@click.option("--expenses", default=500, help="Expenses of the trip the readers load")
+def main(seconds, readers, writers, expenses):
+    profile = {name: getattr(settings, name) for name in DEFAULTS}
+    for mode, overrides in (("defaults", DEFAULTS), ("profile", profile)):
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+        with temporary_database() as (url, engine, Session):
+            trip_ids, user_ids = seed(Session, 10, expenses)
+            if mode == "profile":
+                read_engine = build_engine(url, read_only=True)
+                ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+            else:
+                read_engine, ReadSession = None, Session
+            reads, writes = run(Session, ReadSession, trip_ids, user_ids, seconds, readers, writers)
+            if read_engine is not None:
+                read_engine.dispose()
+        print(
+            f"{mode:>9}: {len(reads) / seconds:7.1f} reads/s (p99 {percentile(reads, 99) * 1000:6.1f} ms), "
+            f"{len(writes) / seconds:7.1f} writes/s (p99 {percentile(writes, 99) * 1000:6.1f} ms)"
+        )
+    for name, value in profile.items():
+        setattr(settings, name, value)
+
+
+if __name__ == "__main__":
+    main()
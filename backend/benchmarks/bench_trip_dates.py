@@ -0,0 +1,130 @@
+"""
+    Latency of "which trips overlap this date window" on a seeded dataset (see core.seeding), for
+    windows of increasing width, comparing:
+    - "scan": the naive filter on the whole trips table (NOT INDEXED)
+    - "indexed": the bounded range of `models.trip_dates.overlapping_trips` on the date index
+    - "tree cold" / "tree warm": `trip_intervals`, on the first and the next queries of a window
+    Each returns the ids of all the overlapping trips. Pages of `--limit` trips are then timed
+    from both sources, the first one and the tenth one, alone and through GET /trips.
+
+    Usage: python -m benchmarks.bench_trip_dates [--trips 1000000] [--requests 20] [--limit 100]
+"""
+import time
+from datetime import date
+
+import click
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import Timer, percentile, temporary_database
+from core.config import settings
+from core.db import get_db, get_read_db
+from core.seeding import seed_database
+from main import app
+from models.trip_dates import (
+    overlapping_trips, overlapping_trips_page, overlapping_trips_page_from_index, reload_trip_intervals,
+    reset_trip_intervals, trip_intervals,
+)
+from models.trips import Trip
+from models.user_base import Token
+
+# Seeded trips start between 2020-01-01 and 2025-06-22
+WINDOWS = [
+    ("day", date(2022, 3, 1), date(2022, 3, 1)),
+    ("week", date(2022, 3, 1), date(2022, 3, 7)),
+    ("month", date(2022, 3, 1), date(2022, 3, 31)),
+    ("quarter", date(2022, 1, 1), date(2022, 3, 31)),
+    ("year", date(2022, 1, 1), date(2022, 12, 31)),
+    ("no trips", date(2030, 1, 1), date(2030, 1, 31)),
+]
+
+
+def timed(function, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        with Timer() as timer:
+            result = function()
+        samples.append(timer.elapsed)
+    return percentile(samples, 50), result
+
+
+@click.command()
+@click.option("--trips", default=1000000, help="Trips in the database")
+@click.option("--requests", default=20, help="Rounds per measure")
+@click.option("--limit", default=100, help="Page size of the /trips requests")
+def main(trips, requests, limit):
+    settings.password_hash_iterations = 1000
+    with temporary_database() as (url, engine, Session):
+        start = time.perf_counter()
+        seed_database(engine, users=max(trips // 10, 100), trips=trips, max_trip_size=2, expenses_per_participant=0.1)
+        click.echo(f"Seeded {trips} trips in {time.perf_counter() - start:.1f} s")
+        session = Session()
+        session.add(Token(token="bench-token", user_id=1))
+        session.commit()
+
+        reset_trip_intervals()
+        with Timer() as timer:
+            reload_trip_intervals(session)
+        size = sum(column.itemsize * len(column) for column in (trip_intervals._starts, trip_intervals._ends, trip_intervals._ids))
+        size += sum(level.itemsize * len(level) for level in trip_intervals._levels)
+        click.echo(f"Interval index: loaded in {timer.elapsed:.1f} s, {size / 2 ** 20:.1f} MiB of arrays")
+
+        scan = text("SELECT id FROM trips NOT INDEXED WHERE start_date <= :end AND end_date >= :start")
+        click.echo(f"{'window':<10}{'trips':>8}{'scan':>9}{'indexed':>9}{'tree cold':>11}{'tree warm':>11}  (ms, p50)")
+        for label, first, last in WINDOWS:
+            scan_time, ids = timed(lambda: session.execute(scan, {"start": first, "end": last}).all(), requests)
+            indexed_time, indexed = timed(
+                lambda: overlapping_trips(session, first, last).with_entities(Trip.id).all(), requests
+            )
+
+            def cold():
+                trip_intervals._cache.clear()
+                return trip_intervals.overlapping(first.toordinal(), last.toordinal())
+            cold_time, tree = timed(cold, requests)
+            warm_time, _ = timed(lambda: trip_intervals.overlapping(first.toordinal(), last.toordinal()), requests)
+            assert sorted(row[0] for row in ids) == sorted(row[0] for row in indexed) == sorted(interval[2] for interval in tree)
+            click.echo(
+                f"{label:<10}{len(ids):>8}{scan_time * 1000:>9.1f}{indexed_time * 1000:>9.1f}"
+                f"{cold_time * 1000:>11.2f}{warm_time * 1000:>11.3f}"
+            )
+
+        click.echo(f"Pages of {limit} trips")
+        click.echo(f"{'window':<10}{'page 1':>9}{'page 10':>9}{'tree 1':>9}{'tree 10':>9}  (ms, p50)")
+        for label, first, last in WINDOWS:
+            row = []
+            for page in (overlapping_trips_page, overlapping_trips_page_from_index):
+                after = None
+                for number in range(1, 11):
+                    page_time, (trips_page, next_cursor) = timed(lambda: page(session, first, last, limit, after), requests)
+                    if number in (1, 10):
+                        row.append(page_time)
+                    session.expunge_all()
+                    after = next_cursor
+                    if after is None:
+                        break
+                row.extend([float("nan")] * (len(row) % 2))
+            click.echo(f"{label:<10}" + "".join(f"{value * 1000:>9.1f}" for value in row))
+
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = pooled_dependency(Session)
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer bench-token"}
+        try:
+            click.echo(f"GET /trips, first page of {limit}")
+            click.echo(f"{'window':<10}{'indexed':>9}{'tree':>9}  (ms, p50)")
+            for label, first, last in WINDOWS:
+                params = {"overlaps_from": first.isoformat(), "overlaps_to": last.isoformat(), "limit": limit}
+                times = []
+                for interval_index in (False, True):
+                    settings.trip_interval_index = interval_index
+                    request_time, _ = timed(lambda: client.get("/trips", params=params, headers=headers), requests)
+                    times.append(request_time)
+                click.echo(f"{label:<10}{times[0] * 1000:>9.1f}{times[1] * 1000:>9.1f}")
+        finally:
+            settings.trip_interval_index = False
+            app.dependency_overrides.clear()
+            session.close()
+
+
+if __name__ == "__main__":
+    main()
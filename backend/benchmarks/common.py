@@ -0,0 +1,51 @@
+"""
+    Helpers shared by the benchmark scripts in this package.
+
+    Benchmarks are plain scripts, run from the `backend` directory, e.g.
+    `python -m benchmarks.bench_my_trips`.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy.orm import sessionmaker
+
+from core.db import build_engine, init_db
+
+
+@contextmanager
+def temporary_database():
+    """
+        Yields `(url, engine, Session)` for a fresh SQLite file that is removed afterwards.
+    """
+    directory = tempfile.mkdtemp(prefix="tb-bench-")
+    path = os.path.join(directory, "bench.db")
+    url = f"sqlite:///{path}"
+    engine = build_engine(url)
+    init_db(engine)
+    try:
+        yield url, engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        engine.dispose()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,207 @@
+"""
+    In-process load test of `main.app`.
+
+    Seeds a temporary SQLite database, then drives the app through httpx's ASGI transport with
+    concurrent virtual users. Each user signs up and logs in, then repeatedly creates a trip,
+    lists `/all-trips`, reads a `/trip/{trip_id}` and adds an event to it. Throughput and
+    latency percentiles are reported per endpoint. They can be saved as a JSON baseline, and a
+    later run compared against it fails when an endpoint regressed.
+
+    Usage:
+        python -m benchmarks.loadtest [--users 20] [--iterations 10] [--save baseline.json]
+        python -m benchmarks.loadtest --compare baseline.json [--tolerance 0.2]
+"""
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List
+
+import click
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_my_trips import pooled_dependency
+from benchmarks.common import percentile, temporary_database
+from core.config import settings
+from core.db import build_engine, get_db, get_read_db
+from core.passwords import hash_password, hasher
+from core.user_management import UserManagement
+from main import app
+from models.trips import Trip, TripEvent, TripUsers
+from models.user_base import User
+
+PASSWORD = "load-test-password"
+
+
+def seed(engine, users: int, trips: int, events: int) -> List[int]:
+    """
+        Bulk inserts `users` users sharing one password hash, and `trips` trips with `events` events each.
+        Returns the trip ids.
+    """
+    rng = random.Random(15)
+    stored = hash_password(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"seed{i}", "password": stored, "full_name": f"Seed User {i}"}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(Trip.__table__.insert(), [
+            {"id": i, "start_date": date(2023, 1, 1) + timedelta(days=i % 365), "end_date": date(2023, 1, 10) + timedelta(days=i % 365),
+             "origin": f"Origin {i % 50}", "destination": f"Destination {i % 200}", "user_id": rng.randint(1, users)}
+            for i in range(1, trips + 1)
+        ])
+        conn.execute(TripUsers.__table__.insert(), [
+            {"trip_id": i, "user_id": user_id}
+            for i in range(1, trips + 1)
+            for user_id in rng.sample(range(1, users + 1), min(3, users))
+        ])
+        if events:
+            conn.execute(TripEvent.__table__.insert(), [
+                {"trip_id": i, "description": f"Event {j}", "time": date(2023, 1, 2) + timedelta(days=j)}
+                for i in range(1, trips + 1)
+                for j in range(events)
+            ])
+    return list(range(1, trips + 1))
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client, label: str, method: str, url: str, expected: int = 200, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[label].append(time.perf_counter() - start)
+        if response.status_code != expected:
+            self.errors[label] += 1
+        return response
+
+    def results(self, elapsed: float) -> Dict[str, Dict]:
+        return {
+            label: {
+                "count": len(samples),
+                "errors": self.errors[label],
+                "rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            }
+            for label, samples in sorted(self.latencies.items())
+        }
+
+
+async def virtual_user(client, recorder: Recorder, number: int, iterations: int, trip_ids: List[int], rng: random.Random):
+    username = f"vu{number}"
+    await recorder.request(client, "POST /signup", "POST", "/signup",
+                           json={"username": username, "password": PASSWORD, "full_name": f"Virtual User {number}"})
+    response = await recorder.request(client, "POST /login", "POST", "/login", auth=(username, PASSWORD))
+    if response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for i in range(iterations):
+        await recorder.request(client, "POST /trip/create", "POST", "/trip/create", headers=headers, json={
+            "startDate": "2023-05-01", "endDate": "2023-05-08", "origin": f"Origin {number}", "destination": f"Destination {i}",
+        })
+        await recorder.request(client, "GET /all-trips", "GET", "/all-trips", headers=headers, params={"limit": 50})
+        trip_id = rng.choice(trip_ids)
+        await recorder.request(client, "GET /trip/{trip_id}", "GET", f"/trip/{trip_id}", headers=headers)
+        await recorder.request(client, "POST /trip/add-event", "POST", "/trip/add-event", headers=headers, json={
+            "description": f"Event of {username}", "time": "2023-05-02", "trip_id": trip_id,
+        })
+
+
+async def drive(users: int, iterations: int, trip_ids: List[int]):
+    recorder = Recorder()
+    rng = random.Random(16)
+    async with httpx.AsyncClient(app=app, base_url="http://loadtest", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(virtual_user(client, recorder, n, iterations, trip_ids, rng) for n in range(users)))
+        elapsed = time.perf_counter() - start
+    return recorder.results(elapsed)
+
+
+def run_load_test(users: int, iterations: int, seed_users: int, seed_trips: int, seed_events: int) -> Dict[str, Dict]:
+    """
+        Runs the load test against a fresh temporary database and returns the results per endpoint.
+    """
+    UserManagement.token_cache.clear()
+    with temporary_database() as (url, engine, Session):
+        trip_ids = seed(engine, seed_users, seed_trips, seed_events)
+        read_engine = build_engine(url, read_only=True)
+        app.dependency_overrides[get_db] = pooled_dependency(Session)
+        app.dependency_overrides[get_read_db] = pooled_dependency(sessionmaker(autocommit=False, autoflush=False, bind=read_engine))
+        try:
+            return asyncio.run(drive(users, iterations, trip_ids))
+        finally:
+            app.dependency_overrides.clear()
+            read_engine.dispose()
+
+
+def compare_results(baseline: Dict[str, Dict], current: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+        Returns the regressions of `current` against `baseline`: errors, a p95 latency more than
+        `tolerance` above the baseline, or a throughput more than `tolerance` below it.
+    """
+    regressions = []
+    for label, base in baseline.items():
+        result = current.get(label)
+        if result is None:
+            regressions.append(f"{label}: not measured")
+            continue
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{label}: {result['errors']} errors (baseline {base['errors']})")
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {result['p95_ms']} ms (baseline {base['p95_ms']} ms)")
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: {result['rps']} req/s (baseline {base['rps']} req/s)")
+    return regressions
+
+
+@click.command()
+@click.option("--users", default=20, help="Concurrent virtual users")
+@click.option("--iterations", default=10, help="Scenario iterations per virtual user")
+@click.option("--seed-users", default=1000, help="Users in the database before the run")
+@click.option("--seed-trips", default=5000, help="Trips in the database before the run")
+@click.option("--seed-events", default=3, help="Events per seeded trip")
+@click.option("--password-iterations", default=settings.password_hash_iterations, help="PBKDF2 iterations of the signups and logins")
+@click.option("--save", type=click.Path(dir_okay=False), default=None, help="Write the results to this JSON file")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False), default=None, help="Fail on regressions against this JSON baseline")
+@click.option("--tolerance", default=0.2, help="Allowed relative regression of p95 latency and throughput")
+def main(users, iterations, seed_users, seed_trips, seed_events, password_iterations, save, compare, tolerance):
+    settings.password_hash_iterations = password_iterations
+    try:
+        results = run_load_test(users, iterations, seed_users, seed_trips, seed_events)
+    finally:
+        hasher.shutdown()
+
+    click.echo(f"{'endpoint':<22}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for label, result in results.items():
+        click.echo(
+            f"{label:<22}{result['count']:>7}{result['errors']:>8}{result['rps']:>9.1f}"
+            f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        )
+
+    if save:
+        config = {"users": users, "iterations": iterations, "seed_users": seed_users, "seed_trips": seed_trips,
+                  "seed_events": seed_events, "password_iterations": password_iterations}
+        with open(save, "w") as f:
+            json.dump({"config": config, "endpoints": results}, f, indent=2)
+        click.echo(f"Saved results to {save}")
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline["endpoints"], results, tolerance)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+        click.echo(f"No regression against {compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+    Async counterpart of `core.db`, used when `settings.db_mode` is "async".
+
+    Sessions are SQLAlchemy `AsyncSession`s over aiosqlite, which runs every SQLite call in
+    a thread of its own connection: a request waiting on the database does not hold one of
+    the threadpool workers the sync handlers run on. The data layer of `models` is written
+    against the sync `Session` API. Async handlers reuse it as is through
+    `AsyncSession.run_sync`.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from core.config import settings
+from core.db import apply_sqlite_pragmas, is_memory_url
+
+
+def async_url(url: str) -> str:
+    """
+        Returns the aiosqlite flavour of a SQLite URL, e.g. "sqlite+aiosqlite:///mydatabase.db".
+    """
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+
+def build_async_engine(url: str):
+    """
+        Builds an async engine with the connection pool configured in `core.config.settings`.
+
+        aiosqlite defaults to opening a connection (and its thread) per checkout for file databases,
+        they are pooled like the connections of the sync engine instead.
+
+        Args:
+        - url: The SQLAlchemy database URL, sync or async flavour.
+
+        Returns:
+        - A new SQLAlchemy AsyncEngine.
+    """
+    url = async_url(url)
+    if is_memory_url(url):
+        engine = create_async_engine(url, poolclass=StaticPool)
+    else:
+        engine = create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    if url.startswith("sqlite"):
+        apply_sqlite_pragmas(engine)
+    return engine
+
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def get_async_engine():
+    # Built on first use, so the sync mode does not need aiosqlite installed
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        _async_engine = build_async_engine(settings.database_url)
+        _AsyncSessionLocal = async_sessionmaker(_async_engine)
+    return _async_engine
+
+
+def async_sessionmaker(bind):
+    return sessionmaker(bind, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    """
+        FastAPI dependency yielding one AsyncSession per request.
+
+        Like `core.db.get_db`, the session is rolled back if the request handler raises and is
+        always closed afterwards.
+    """
+    get_async_engine()
+    session = _AsyncSessionLocal()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _AsyncSessionLocal = None
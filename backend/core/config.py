@@ -0,0 +1,91 @@
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    """
+        Runtime configuration of the backend.
+
+        Every field can be overridden with an environment variable of the same
+        name (case insensitive), e.g. `DATABASE_URL=sqlite:///other.db python main.py`.
+    """
+    database_url: str = "sqlite:///mydatabase.db"
+    test_database_url: str = "sqlite:///test_mydatabase.db"
+
+    # Connection pool of the process-wide engine
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 3600
+    # Connection pool of the read-only engine serving the GET endpoints (see core.db.get_read_db)
+    db_read_pool_size: int = 10
+    # SQLite performance profile, applied to every new connection (see core.db.sqlite_pragmas).
+    # In WAL mode readers do not block the writer and commits append to the log instead of
+    # rewriting pages; synchronous=normal only fsyncs at checkpoints. Negative cache sizes are in KiB.
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000
+    sqlite_busy_timeout: int = 5000
+    sqlite_foreign_keys: bool = True
+    # "sync" serves requests with blocking sessions in the threadpool, "async" serves the read
+    # endpoints of `async_routes` with AsyncSession over aiosqlite (see core.async_db)
+    db_mode: str = "sync"
+
+    # Access tokens: "db" issues random tokens stored in the `tokens` table, "signed" issues
+    # HMAC signed tokens carrying the user id and expiry (see core.tokens). While migrating,
+    # `accept_legacy_tokens` keeps the tokens of the `tokens` table valid in "signed" mode.
+    token_mode: str = "db"
+    accept_legacy_tokens: bool = True
+    # Must be set (and shared by all workers) in "signed" mode, otherwise a random secret is
+    # generated per process and tokens do not survive a restart.
+    token_secret: str = ""
+    access_token_ttl: int = 7 * 24 * 3600
+    # How often the in-memory copy of the revoked signed tokens is reloaded from the database
+    token_denylist_refresh: int = 30
+
+    # Passwords are hashed with PBKDF2-HMAC-SHA256 in a pool of `password_workers` processes
+    # (one per CPU when 0). Logins and signups get a 503 once `password_max_pending` hashes
+    # are already queued or running.
+    password_hash_iterations: int = 600000
+    password_workers: int = 0
+    password_max_pending: int = 64
+
+    # Token -> user cache of UserManagement.get_current_user
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 60
+
+    # Upper bound of trips returned by one page of the trip listings
+    trips_page_size_max: int = 500
+    # Trips read from the database cursor (and converted) at a time by the NDJSON export
+    trips_export_chunk_size: int = 1000
+
+    # Trip searches page through at most this many of their best matches
+    search_max_candidates: int = 5000
+    # Rankings of the searches being paged through, kept this many seconds (see models.search)
+    search_snapshot_cache_size: int = 256
+    search_snapshot_ttl: int = 300
+
+    # Serve the /trips date window queries from an in-memory interval index of all the trips
+    # (see models.trip_dates) instead of the trips table, caching the results of this many windows
+    trip_interval_index: bool = False
+    trip_interval_cache_size: int = 64
+
+    # Upper bound of events returned by one page of /calendar
+    calendar_page_size_max: int = 500
+
+    # Upper bound of operations of one /batch request, all applied in a single transaction
+    batch_max_operations: int = 500
+
+    # Responses of at least this many bytes are gzipped for the clients sending
+    # "Accept-Encoding: gzip", 0 disables compression. Level 6 is zlib's speed / size default.
+    gzip_minimum_size: int = 1024
+    gzip_level: int = 6
+
+    # Per-route latency, status and database metrics served at /metrics (see core.metrics)
+    metrics_enabled: bool = True
+    # A request running the same statement shape more than this many times logs a possible
+    # N+1 query warning (see core.queries), 0 disables the check
+    query_repeat_threshold: int = 20
+
+
+settings = Settings()
@@ -1,14 +1,164 @@
-from sqlalchemy import create_engine
+from typing import List
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from core import migrations, user_management
+from core.config import settings
+# Registers the tables of these modules on Base.metadata before create_tables runs
+import models.expenses
+import models.trips
+
+
+def is_memory_url(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:", "sqlite+aiosqlite://", "sqlite+aiosqlite:///:memory:")
+
+
+def sqlite_pragmas(read_only: bool = False) -> List[str]:
+    """
+        The PRAGMA statements of the SQLite performance profile of `core.config.settings`.
+    """
+    pragmas = [
+        f"journal_mode={settings.sqlite_journal_mode}",
+        f"synchronous={settings.sqlite_synchronous}",
+        f"mmap_size={settings.sqlite_mmap_size}",
+        f"cache_size={settings.sqlite_cache_size}",
+        f"busy_timeout={settings.sqlite_busy_timeout}",
+        f"foreign_keys={'ON' if settings.sqlite_foreign_keys else 'OFF'}",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine, read_only: bool = False):
+    """
+        Runs `sqlite_pragmas` on every new DBAPI connection of a SQLite engine (sync or async).
+    """
+    pragmas = sqlite_pragmas(read_only)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+    event.listen(getattr(engine, "sync_engine", engine), "connect", on_connect)
+
+
+def build_engine(url: str, read_only: bool = False):
+    """
+        Builds an engine with the connection pool configured in `core.config.settings`.
+
+        In-memory SQLite databases only exist for the lifetime of a single connection,
+        so they share one connection through a `StaticPool` instead.
+
+        Args:
+        - url: The SQLAlchemy database URL.
+        - read_only: Whether the connections must refuse writes, for `get_read_db`.
+
+        Returns:
+        - A new SQLAlchemy engine.
+    """
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    if is_memory_url(url):
+        engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            url,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=settings.db_read_pool_size if read_only else settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=True,
+        )
+    if url.startswith("sqlite"):
+        apply_sqlite_pragmas(engine, read_only)
+    return engine
+
+
+engine = build_engine(settings.database_url)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# A separate pool for the GET endpoints, so reads are not queued behind writes for a connection.
+# An in-memory database cannot be shared between engines, it is served by the one engine.
+read_engine = engine if is_memory_url(settings.database_url) else build_engine(settings.database_url, read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+_test_engine = None
+
+
+def get_test_engine():
+    global _test_engine
+    if _test_engine is None:
+        _test_engine = build_engine(settings.test_database_url)
+        init_db(_test_engine)
+    return _test_engine
+
+
+def init_db(bind=None):
+    """
+        Creates the missing tables and applies the pending migrations of `core.migrations`.
+        Meant to run once, when the application starts.
+    """
+    bind = bind if bind is not None else engine
+    user_management.create_tables(bind)
+    migrations.run_migrations(bind)
+
+
+def explain_query_plan(bind, statement) -> List[str]:
+    """
+        Returns the `detail` column of SQLite's EXPLAIN QUERY PLAN for a SQLAlchemy statement
+        or ORM query, e.g. ["SEARCH users USING INDEX ix_users_username (username=?)"].
+    """
+    if hasattr(statement, "statement"):
+        statement = statement.statement
+    compiled = statement.compile(dialect=bind.dialect, compile_kwargs={"render_postcompile": True})
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    with bind.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def get_db():
+    """
+        FastAPI dependency yielding one session per request.
+
+        The session is rolled back if the request handler raises and is always
+        closed afterwards, returning its connection to the pool.
+    """
+    yield from _session_scope(SessionLocal)
+
+
+def get_read_db():
+    """
+        Like `get_db`, with a session of the read-only engine, for the GET endpoints.
+        Its connections run with `PRAGMA query_only`, so any write fails.
+    """
+    yield from _session_scope(ReadSessionLocal)
+
+
+def _session_scope(Session):
+    session = Session()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
-from core import user_management
 
-def get_db(is_test=False):
-    engine = create_engine("sqlite:///mydatabase.db") if not is_test else create_engine("sqlite:///test_mydatabase.db")
-    user_management.create_tables(engine)
-    SessionMaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    return SessionMaker()
+def create_session(is_test=False):
+    """
+        Opens a standalone session outside of a request (scripts, tests).
+        The caller is responsible for closing it with `close_db`.
+    """
+    if is_test:
+        return sessionmaker(autocommit=False, autoflush=False, bind=get_test_engine())()
+    return SessionLocal()
 
 
 def close_db(session):
-    session.close()
\ No newline at end of file
+    session.close()
@@ -0,0 +1,48 @@
+"""
+    Weak ETags and `If-None-Match` handling for conditional GETs.
+
+    The ETags are derived from data versions rather than from the response body, so a handler
+    can answer 304 Not Modified before building the response at all.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+# Responses are per user: browsers may store them but must revalidate before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts) -> str:
+    """
+        Returns a weak ETag identifying `parts`, which must have a stable repr (ints, strings,
+        tuples and lists of those).
+    """
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+        Weak comparison of an `If-None-Match` header against an ETag (RFC 9110, 13.1.2).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
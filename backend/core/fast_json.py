@@ -0,0 +1,41 @@
+"""
+    JSON encoding of the large responses, with orjson when installed and the stdlib otherwise.
+
+    Responses built from plain dicts and returned as `FastJSONResponse` skip both the pydantic
+    model construction and FastAPI's `jsonable_encoder` pass over the result.
+"""
+import json
+from datetime import date
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    JSON_ENCODER = "orjson"
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default)
+else:
+    JSON_ENCODER = "json"
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,150 @@
+"""
+    In-memory index of integer intervals answering "which intervals overlap [start, end]".
+
+    The intervals are kept in three parallel arrays sorted by start (8 bytes per value), over
+    which a static tree of blocks is laid out: level 0 holds the largest end of every
+    `block_size` intervals, each next level the largest end of `block_size` blocks of the level
+    below. A query only descends into the blocks whose intervals start before the end of the
+    window and whose largest end reaches its start, so it costs about the number of overlapping
+    intervals rather than the number of intervals.
+
+    Changes go to an overlay (the added intervals and the hidden ids), which queries scan next to
+    the tree, and which is merged into a rebuilt tree once it holds `rebuild_threshold` changes.
+    The results of the last `cache_size` windows are cached until the next change. Results are
+    sorted by (start, end, id), the order of the arrays, so that they can be paginated with a
+    bisection.
+"""
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class IntervalIndex:
+    def __init__(self, block_size: int = 64, rebuild_threshold: int = 4096, cache_size: int = 64):
+        self.block_size = block_size
+        self.rebuild_threshold = rebuild_threshold
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self._starts = array("q")
+        self._ends = array("q")
+        self._ids = array("q")
+        # _levels[0] holds the largest end of each block of intervals, the next levels the
+        # largest end of each block of the level below
+        self._levels: List[array] = []
+        # id -> (start, end) of the intervals added or changed since the last build
+        self._added: Dict[int, Tuple[int, int]] = {}
+        # ids whose interval in the tree is removed or replaced by one of `_added`
+        self._hidden: Set[int] = set()
+        self._cache: "OrderedDict[Tuple[int, int], List[Tuple[int, int, int]]]" = OrderedDict()
+
+    def load(self, intervals: Iterable[Tuple[int, int, int]]) -> None:
+        """
+            Replaces the content of the index with the given (id, start, end) intervals.
+        """
+        staged = IntervalIndex(self.block_size, self.rebuild_threshold, self.cache_size)
+        staged._build(sorted((start, end, id_) for id_, start, end in intervals if start <= end))
+        with self._lock:
+            self._adopt(staged)
+
+    def add(self, id_: int, start: int, end: int) -> None:
+        """
+            Adds the interval of `id_`, replacing its previous one if any.
+        """
+        with self._lock:
+            self._hidden.add(id_)
+            if start <= end:
+                self._added[id_] = (start, end)
+            else:
+                self._added.pop(id_, None)
+            self._changed()
+
+    def remove(self, id_: int) -> None:
+        with self._lock:
+            self._hidden.add(id_)
+            self._added.pop(id_, None)
+            self._changed()
+
+    def overlapping(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """
+            Returns the (start, end, id) of the intervals overlapping [start, end], bounds
+            included, in that order. The list is shared with the cache, it must not be modified.
+        """
+        key = (start, end)
+        with self._lock:
+            intervals = self._cache.get(key)
+            if intervals is not None:
+                self._cache.move_to_end(key)
+                return intervals
+            intervals = self._tree_overlapping(start, end)
+            if self._hidden:
+                intervals = [interval for interval in intervals if interval[2] not in self._hidden]
+            added = [(first, last, id_) for id_, (first, last) in self._added.items() if first <= end and last >= start]
+            if added:
+                intervals.extend(added)
+                intervals.sort()
+            if self.cache_size:
+                self._cache[key] = intervals
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return intervals
+
+    def _changed(self) -> None:
+        self._cache.clear()
+        if len(self._hidden) + len(self._added) >= self.rebuild_threshold:
+            hidden = self._hidden
+            merged = [
+                (start, end, id_) for start, end, id_ in zip(self._starts, self._ends, self._ids)
+                if id_ not in hidden
+            ]
+            merged.extend((start, end, id_) for id_, (start, end) in self._added.items())
+            merged.sort()
+            staged = IntervalIndex(self.block_size, self.rebuild_threshold, self.cache_size)
+            staged._build(merged)
+            self._adopt(staged)
+
+    def _adopt(self, staged: "IntervalIndex") -> None:
+        self._starts, self._ends, self._ids, self._levels = staged._starts, staged._ends, staged._ids, staged._levels
+        self._added, self._hidden = {}, set()
+        self._cache.clear()
+
+    def _build(self, intervals: List[Tuple[int, int, int]]) -> None:
+        self._starts = array("q", (interval[0] for interval in intervals))
+        self._ends = array("q", (interval[1] for interval in intervals))
+        self._ids = array("q", (interval[2] for interval in intervals))
+        size = self.block_size
+        level = self._ends
+        self._levels = []
+        while len(level) > 1 or not self._levels:
+            level = array("q", (max(level[i:i + size]) for i in range(0, len(level), size)))
+            self._levels.append(level)
+            if len(level) <= size:
+                break
+
+    def _tree_overlapping(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        # Only the intervals before `limit` start before the end of the window
+        limit = bisect_right(self._starts, end)
+        if not limit:
+            return []
+        size = self.block_size
+        # Blocks of the top level, then of each level below, that may hold overlapping intervals
+        span = size ** len(self._levels)
+        blocks = [block for block in range((limit - 1) // span + 1) if self._levels[-1][block] >= start]
+        for level in reversed(self._levels[:-1]):
+            span //= size
+            last = (limit - 1) // span
+            blocks = [
+                child for block in blocks
+                for child in range(block * size, min(block * size + size, last + 1))
+                if level[child] >= start
+            ]
+        starts, ends, ids = self._starts, self._ends, self._ids
+        return [
+            (starts[i], ends[i], ids[i]) for block in blocks
+            for i in range(block * size, min(block * size + size, limit))
+            if ends[i] >= start
+        ]
@@ -0,0 +1,223 @@
+"""
+    Per-route request metrics in the Prometheus text format, without external dependencies.
+
+    `MetricsMiddleware` is a pure ASGI middleware. For every HTTP request it records the latency
+    histogram, status code, database time and query count under the path template of the route
+    that served it (e.g. "/trip/{trip_id}"), not the handler name, which several routes share.
+    The route is resolved after the request from the endpoint the router stored in the scope.
+
+    Database time is collected by SQLAlchemy cursor events on every engine, into the
+    `RequestStats` of the current request. The stats object is held in a context variable,
+    which sync handlers see as well since the threadpool runs them in a copy of the context.
+    Requests repeating a statement shape too often are logged as possible N+1 patterns
+    (see `core.queries`), except on the routes marked with `allow_repeated_statements`.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.queries import warn_repeated_statements
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Label of the requests that matched no route, so that unknown paths do not create new series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestStats:
+    __slots__ = ("db_time", "queries", "statements")
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.queries = 0
+        # Executions of each statement, fingerprinted only when checked for N+1 patterns
+        self.statements: Dict[str, int] = {}
+
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, which is discarded with the statement even when it raises
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = context._metrics_start
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.db_time += time.perf_counter() - start
+        stats.queries += 1
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+def instrument_engines():
+    """
+        Times the queries of every engine, existing or future. Safe to call more than once.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def allow_repeated_statements(endpoint: Callable) -> Callable:
+    """
+        Marks a route handler that repeats statements by design, e.g. once per chunk of a
+        streamed export, so that its requests are not logged as N+1 patterns.
+    """
+    endpoint.allow_repeated_statements = True
+    return endpoint
+
+
+class _RouteMetrics:
+    __slots__ = ("buckets", "latency_sum", "count", "statuses", "db_time", "queries")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.count = 0
+        self.statuses: Dict[int, int] = {}
+        self.db_time = 0.0
+        self.queries = 0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+        The metrics of all the routes. `collectors` are called on every render and return extra
+        (name, type, help, value) gauges or counters, e.g. the token cache statistics.
+    """
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.collectors: List[Callable[[], List[Tuple[str, str, str, float]]]] = []
+
+    def observe(self, method: str, route: str, status: int, latency: float, stats: RequestStats):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.latency_sum += latency
+            metrics.count += 1
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.db_time += stats.db_time
+            metrics.queries += stats.queries
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        """
+            Returns all the metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            routes = sorted(self._routes.items())
+            snapshot = [
+                (method, route, list(m.buckets), m.latency_sum, m.count, sorted(m.statuses.items()), m.db_time, m.queries)
+                for (method, route), m in routes
+            ]
+            in_flight = self.in_flight
+        lines = [
+            "# HELP http_request_duration_seconds Latency of the HTTP requests by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for method, route, buckets, latency_sum, count, _, _, _ in snapshot:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {_format(latency_sum)}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {count}")
+        lines += ["# HELP http_requests_total HTTP requests by route and status code.", "# TYPE http_requests_total counter"]
+        for method, route, _, _, _, statuses, _, _ in snapshot:
+            for status, count in statuses:
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+        lines += ["# HELP http_request_db_seconds_total Time spent in database queries by route.", "# TYPE http_request_db_seconds_total counter"]
+        for method, route, _, _, _, _, db_time, _ in snapshot:
+            lines.append(f'http_request_db_seconds_total{{method="{method}",route="{_escape(route)}"}} {_format(db_time)}')
+        lines += ["# HELP http_request_db_queries_total Database queries by route.", "# TYPE http_request_db_queries_total counter"]
+        for method, route, _, _, _, _, _, queries in snapshot:
+            lines.append(f'http_request_db_queries_total{{method="{method}",route="{_escape(route)}"}} {queries}')
+        lines += [
+            "# HELP http_requests_in_flight HTTP requests being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {in_flight}",
+        ]
+        for collector in self.collectors:
+            for name, kind, help_text, value in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_format(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+        Pure ASGI middleware recording the metrics of every HTTP request in a MetricsRegistry.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = registry, repeat_threshold: int = 0):
+        self.app = app
+        self.registry = registry
+        # Requests running a statement shape more than this many times log a warning, 0 disables
+        self.repeat_threshold = repeat_threshold
+        self._route_paths: Dict[Callable, str] = {}
+
+    def route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            # Built on first use and on unknown endpoints, routes can be added after the middleware
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+            path = self._route_paths.get(endpoint, UNMATCHED_ROUTE)
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        registry = self.registry
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            registry.in_flight -= 1
+            current_request_stats.reset(token)
+            route = self.route_path(scope)
+            registry.observe(scope["method"], route, status, time.perf_counter() - start, stats)
+            if (self.repeat_threshold and stats.queries > self.repeat_threshold
+                    and not getattr(scope.get("endpoint"), "allow_repeated_statements", False)):
+                warn_repeated_statements(stats.statements, self.repeat_threshold, f"{scope['method']} {route}")
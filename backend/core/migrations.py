@@ -0,0 +1,203 @@
+"""
+    Versioned schema migrations for existing databases.
+
+    `Base.metadata.create_all` only creates missing tables, it never changes existing ones.
+    Every change to an existing table is therefore also added here as a migration. Migrations
+    run in order at startup (see `core.db.init_db`). Each one is recorded in the
+    `schema_migrations` table once applied. They are written to be idempotent, so a fresh
+    database, whose tables `create_all` already built in their latest shape, goes through them
+    without changes.
+"""
+import logging
+import time
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Date, inspect
+
+from core.config import settings
+from models.search import create_trip_search, create_trip_search_triggers
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+
+
+def _table_exists(conn, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def _column_names(conn, table: str) -> List[str]:
+    return [column["name"] for column in inspect(conn).get_columns(table)]
+
+
+def _add_expenses_primary_key(conn):
+    if not _table_exists(conn, "expenses") or "id" in _column_names(conn, "expenses"):
+        return
+    # SQLite cannot add a primary key to an existing table, rebuild it instead
+    conn.exec_driver_sql(
+        "CREATE TABLE expenses_new ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "owe_user_id INTEGER REFERENCES users (id), "
+        "amount INTEGER, "
+        "expense_id INTEGER REFERENCES expenses_meta (id))"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO expenses_new (owe_user_id, amount, expense_id) "
+        "SELECT owe_user_id, amount, expense_id FROM expenses ORDER BY rowid"
+    )
+    conn.exec_driver_sql("DROP TABLE expenses")
+    conn.exec_driver_sql("ALTER TABLE expenses_new RENAME TO expenses")
+
+
+SECONDARY_INDEXES = [
+    ("users", "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)"),
+    ("trips", "CREATE INDEX IF NOT EXISTS ix_trips_user_id ON trips (user_id)"),
+    ("trip_users", "CREATE INDEX IF NOT EXISTS ix_trip_users_trip_id ON trip_users (trip_id)"),
+    ("trip_users", "CREATE INDEX IF NOT EXISTS ix_trip_users_user_id ON trip_users (user_id)"),
+    ("trip_event", "CREATE INDEX IF NOT EXISTS ix_trip_event_trip_id_time ON trip_event (trip_id, time)"),
+    ("expenses_meta", "CREATE INDEX IF NOT EXISTS ix_expenses_meta_trip_id ON expenses_meta (trip_id)"),
+    ("expenses", "CREATE INDEX IF NOT EXISTS ix_expenses_expense_id ON expenses (expense_id)"),
+]
+
+
+def _add_secondary_indexes(conn):
+    for table, statement in SECONDARY_INDEXES:
+        if _table_exists(conn, table):
+            conn.exec_driver_sql(statement)
+
+
+def _backfill_trip_balances(conn):
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS trip_balances ("
+        "trip_id INTEGER NOT NULL REFERENCES trips (id), "
+        "creditor_id INTEGER NOT NULL REFERENCES users (id), "
+        "debtor_id INTEGER NOT NULL REFERENCES users (id), "
+        "amount INTEGER NOT NULL, "
+        "PRIMARY KEY (trip_id, creditor_id, debtor_id))"
+    )
+    if not _table_exists(conn, "expenses") or not _table_exists(conn, "expenses_meta"):
+        return
+    conn.exec_driver_sql("DELETE FROM trip_balances")
+    conn.exec_driver_sql(
+        "INSERT INTO trip_balances (trip_id, creditor_id, debtor_id, amount) "
+        "SELECT m.trip_id, m.paid_user_id, e.owe_user_id, SUM(e.amount) "
+        "FROM expenses_meta m JOIN expenses e ON e.expense_id = m.id "
+        "GROUP BY m.trip_id, m.paid_user_id, e.owe_user_id "
+        "HAVING SUM(e.amount) != 0"
+    )
+
+
+def _add_trip_versions(conn):
+    if _table_exists(conn, "trips") and "version" not in _column_names(conn, "trips"):
+        conn.exec_driver_sql("ALTER TABLE trips ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _add_trip_search(conn):
+    if _table_exists(conn, "trips") and _table_exists(conn, "trip_event"):
+        create_trip_search(conn)
+
+
+def _add_trip_date_indexes(conn):
+    if _table_exists(conn, "trips"):
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_trips_start_date_end_date ON trips (start_date, end_date)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_trips_duration ON trips (julianday(end_date) - julianday(start_date))")
+
+
+def _convert_trip_event_times(conn):
+    if not _table_exists(conn, "trip_event"):
+        return
+    columns = {column["name"]: column["type"] for column in inspect(conn).get_columns("trip_event")}
+    if isinstance(columns["time"], Date):
+        return
+    # SQLite cannot change the type of a column, rebuild the table instead. It is copied aside and
+    # recreated under its own name rather than renamed: renaming a table checks the triggers of
+    # `trips`, which read `trip_event`. Dropping it drops its search triggers, which are only
+    # created again after the copy: the descriptions are unchanged, `trip_search` is up to date.
+    conn.exec_driver_sql("CREATE TEMP TABLE trip_event_old AS SELECT id, description, time, trip_id FROM trip_event")
+    conn.exec_driver_sql("DROP TABLE trip_event")
+    conn.exec_driver_sql(
+        "CREATE TABLE trip_event ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "description VARCHAR, "
+        "time DATE, "
+        "trip_id INTEGER REFERENCES trips (id) ON DELETE CASCADE)"
+    )
+    # /trip/add-event always stored YYYY-MM-DD, date() normalizes any other valid time string and
+    # turns the invalid ones, which the Date column could not load, into NULL: the event is kept
+    invalid = conn.exec_driver_sql(
+        "SELECT id, time FROM temp.trip_event_old WHERE time IS NOT NULL AND date(time) IS NULL ORDER BY id"
+    ).fetchall()
+    if invalid:
+        logger.warning(
+            "Cleared the time of %d trip events, which was not a date: %s",
+            len(invalid), ", ".join(f"{event_id} ({event_time!r})" for event_id, event_time in invalid),
+        )
+    conn.exec_driver_sql(
+        "INSERT INTO trip_event (id, description, time, trip_id) "
+        "SELECT id, description, date(time), trip_id FROM temp.trip_event_old ORDER BY id"
+    )
+    conn.exec_driver_sql("DROP TABLE temp.trip_event_old")
+    conn.exec_driver_sql("CREATE INDEX ix_trip_event_trip_id_time ON trip_event (trip_id, time)")
+    if _table_exists(conn, "trip_search"):
+        create_trip_search_triggers(conn)
+
+
+MIGRATIONS = [
+    Migration(1, "add primary key to expenses", _add_expenses_primary_key),
+    Migration(2, "add secondary indexes", _add_secondary_indexes),
+    Migration(3, "backfill trip balances", _backfill_trip_balances),
+    Migration(4, "add trip versions", _add_trip_versions),
+    Migration(5, "add trip search index", _add_trip_search),
+    Migration(6, "add trip date indexes", _add_trip_date_indexes),
+    Migration(7, "convert trip event times to dates", _convert_trip_event_times),
+]
+
+
+def applied_versions(conn) -> List[int]:
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER NOT NULL PRIMARY KEY, name VARCHAR, applied_at INTEGER)"
+    )
+    return [row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations")]
+
+
+def run_migrations(engine, migrations: List[Migration] = None) -> List[int]:
+    """
+        Applies the migrations that were not applied to the database yet, in version order.
+
+        Args:
+        - engine: The engine of the database to upgrade.
+        - migrations: The migrations to consider, `MIGRATIONS` by default.
+
+        Returns:
+        - The versions applied by this call.
+
+        Raises:
+        SQLAlchemyError: If a migration fails, e.g. `ix_users_username` cannot be created
+        because the `users` table holds duplicated usernames. Later migrations are not run.
+    """
+    with engine.begin() as conn:
+        done = set(applied_versions(conn))
+    applied = []
+    with engine.connect() as conn:
+        # Table rebuilds must not trip over rows orphaned while foreign keys were not enforced.
+        # The pragma is a no-op inside a transaction, so it is set before each one starts.
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            for migration in sorted(migrations if migrations is not None else MIGRATIONS):
+                if migration.version in done:
+                    continue
+                with conn.begin():
+                    migration.upgrade(conn)
+                    conn.exec_driver_sql(
+                        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                        (migration.version, migration.name, int(time.time())),
+                    )
+                applied.append(migration.version)
+        finally:
+            conn.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if settings.sqlite_foreign_keys else 'OFF'}")
+    return applied
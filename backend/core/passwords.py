@@ -0,0 +1,152 @@
+"""
+    Password hashing with PBKDF2-HMAC-SHA256.
+
+    Hashes are stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>". Rows written before
+    passwords were hashed hold the plaintext password, which `verify_password` still accepts so
+    that `UserManagement.authenticate_user` can rehash it on the next successful login.
+
+    Hashing is CPU bound on purpose. `PasswordHasher` runs it in a process pool, off the
+    threadpool and the GIL shared by the other requests. The pool is bounded: once
+    `settings.password_max_pending` hashes are queued or running, new ones are rejected
+    straight away with `PasswordHasherBusy` instead of piling up.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from core.config import settings
+
+ALGORITHM = "pbkdf2_sha256"
+
+
+class PasswordHasherBusy(Exception):
+    """
+        Raised when the password hasher already has `max_pending` hashes in flight.
+    """
+
+
+def hash_password(password: str, iterations: int = None, salt: bytes = None) -> str:
+    iterations = iterations or settings.password_hash_iterations
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((
+        ALGORITHM,
+        str(iterations),
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(digest).decode("ascii"),
+    ))
+
+
+@lru_cache(maxsize=None)
+def _dummy_hash(iterations: int) -> str:
+    return hash_password(os.urandom(16).hex(), iterations)
+
+
+def dummy_hash() -> str:
+    """
+        A hash of a random password at the configured cost, verified in place of the password of
+        an unknown user so that a login takes as long whether the username exists or not.
+    """
+    return _dummy_hash(settings.password_hash_iterations)
+
+
+def is_hashed(stored: str) -> bool:
+    return stored is not None and stored.startswith(ALGORITHM + "$")
+
+
+def _parse_hash(stored: str) -> Optional[Tuple[int, bytes, bytes]]:
+    """
+        Returns the iterations, salt and digest of a stored hash, or None if it is malformed.
+    """
+    fields = stored.split("$")
+    if len(fields) != 4:
+        return None
+    try:
+        iterations = int(fields[1])
+        salt = base64.b64decode(fields[2], validate=True)
+        digest = base64.b64decode(fields[3], validate=True)
+    except ValueError:
+        return None
+    if iterations <= 0:
+        return None
+    return iterations, salt, digest
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+        Checks a password against a stored hash, or against a legacy plaintext password. A
+        malformed hash matches no password.
+    """
+    if stored is None:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    parsed = _parse_hash(stored)
+    if parsed is None:
+        return False
+    iterations, salt, expected = parsed
+    return hmac.compare_digest(hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations), expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+        True for plaintext passwords, malformed hashes and hashes made with fewer iterations
+        than configured.
+    """
+    if not is_hashed(stored):
+        return True
+    parsed = _parse_hash(stored)
+    return parsed is None or parsed[0] < settings.password_hash_iterations
+
+
+class PasswordHasher:
+    """
+        Runs `hash_password` and `verify_password` in a bounded process pool.
+
+        The methods block the calling thread (a request handler of the threadpool) until the
+        result is ready, but not the GIL. The pool is created on first use.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or settings.password_workers or os.cpu_count()
+        self.max_pending = max_pending or settings.password_max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy()
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password: str) -> str:
+        return self._run(hash_password, password)
+
+    def verify(self, password: str, stored: str) -> bool:
+        if not is_hashed(stored):
+            # Legacy plaintext rows: nothing expensive to offload
+            return verify_password(password, stored)
+        return self._run(verify_password, password, stored)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,169 @@
+"""
+    In-memory, frequency-ranked prefix index for autocompletion.
+
+    Names are normalized (accents removed, case folded, spaces collapsed) into keys, and kept in
+    three parallel sequences sorted by key: the keys, the names as first seen, and their counts
+    (an `array`, 8 bytes per entry). A prefix is located with two bisections, and its completions
+    are the slice between them.
+
+    The most frequent completions of the broad prefixes, whose slice holds more than
+    `cache_threshold` keys, are computed by `load` and cached: each from the cached lists of its
+    one character longer prefixes, so that no lookup scans more than `cache_threshold` keys. The
+    cached lists are updated in place when a count increases; a decrease drops the cached lists
+    that hold the key, which are recomputed from their longer prefixes on the next lookup.
+"""
+import heapq
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+# Sorts after any character, so that `prefix + _LAST` bounds the keys starting with `prefix`
+_LAST = chr(0x10FFFF)
+
+
+def normalize(name: str) -> str:
+    if name.isascii():
+        return " ".join(name.casefold().split())
+    decomposed = unicodedata.normalize("NFKD", name)
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self, max_results: int = 20, cache_threshold: int = 64):
+        self.max_results = max_results
+        self.cache_threshold = cache_threshold
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._counts = array("q")
+        # prefix -> up to max_results (-count, key, name) tuples, best first
+        self._top: Dict[str, List[Tuple[int, str, str]]] = {}
+
+    def load(self, counted_names: Iterable[Tuple[str, int]]) -> None:
+        """
+            Replaces the content of the index with the given (name, count) pairs. Names with the
+            same key are merged, under the spelling of the most frequent one.
+        """
+        merged: Dict[str, List] = {}
+        for name, count in counted_names:
+            key = normalize(name or "")
+            if not key or count <= 0:
+                continue
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = [name, count, count]
+            else:
+                if count > entry[2]:
+                    entry[0], entry[2] = name, count
+                entry[1] += count
+        keys = sorted(merged)
+        names = [merged[key][0] for key in keys]
+        # Names already in their normalized form share the string of their key
+        names = [key if name == key else name for key, name in zip(keys, names)]
+        # Built aside, the current content keeps being served meanwhile
+        staged = PrefixIndex(self.max_results, self.cache_threshold)
+        staged._keys, staged._names = keys, names
+        staged._counts = array("q", (merged[key][1] for key in keys))
+        staged._top_of("", 0, len(keys))
+        with self._lock:
+            self._keys, self._names, self._counts, self._top = staged._keys, staged._names, staged._counts, staged._top
+
+    def add(self, name: str, count: int = 1) -> None:
+        self._change(name, count)
+
+    def remove(self, name: str, count: int = 1) -> None:
+        self._change(name, -count)
+
+    def _change(self, name: str, delta: int) -> None:
+        key = normalize(name or "")
+        if not key or not delta:
+            return
+        with self._lock:
+            keys = self._keys
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                count = self._counts[i] + delta
+                name = self._names[i]
+                if count > 0:
+                    self._counts[i] = count
+                else:
+                    del keys[i], self._names[i], self._counts[i]
+            elif delta > 0:
+                count = delta
+                keys.insert(i, key)
+                self._names.insert(i, key if name == key else name)
+                self._counts.insert(i, count)
+            else:
+                return
+            for length in range(1, len(key) + 1):
+                prefix = key[:length]
+                top = self._top.get(prefix)
+                if top is None:
+                    continue
+                others = [entry for entry in top if entry[1] != key]
+                if delta < 0:
+                    if len(others) != len(top):
+                        # A completion outside of the list may now rank above this one
+                        del self._top[prefix]
+                    continue
+                others.append((-count, key, name))
+                others.sort()
+                self._top[prefix] = others[:self.max_results]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """
+            Returns up to `limit` (capped at `max_results`) (name, count) pairs of the names starting
+            with `prefix`, most frequent first and in key order for equal counts.
+        """
+        key = normalize(prefix)
+        limit = min(limit, self.max_results)
+        if not key or limit <= 0:
+            return []
+        with self._lock:
+            top = self._top.get(key)
+            if top is None:
+                lo = bisect_left(self._keys, key)
+                hi = bisect_left(self._keys, key + _LAST, lo)
+                if hi - lo > self.cache_threshold:
+                    top = self._top_of(key, lo, hi)
+                else:
+                    top = heapq.nsmallest(limit, self._entries(lo, hi))
+            return [(name, -negative_count) for negative_count, _, name in top[:limit]]
+
+    def _entries(self, lo: int, hi: int):
+        keys, names, counts = self._keys, self._names, self._counts
+        return ((-counts[i], keys[i], names[i]) for i in range(lo, hi))
+
+    def _top_of(self, prefix: str, lo: int, hi: int) -> List[Tuple[int, str, str]]:
+        """
+            Returns the best completions of `prefix`, whose keys are `_keys[lo:hi]`, and caches
+            them when the slice is larger than `cache_threshold`.
+        """
+        top = self._top.get(prefix)
+        if top is not None:
+            return top
+        if hi - lo <= self.cache_threshold:
+            return heapq.nsmallest(self.max_results, self._entries(lo, hi))
+        keys, depth = self._keys, len(prefix)
+        candidates = []
+        if len(keys[lo]) == depth:
+            # The prefix is a key itself, sorted before its completions
+            candidates.extend(self._entries(lo, lo + 1))
+            lo += 1
+        while lo < hi:
+            child = keys[lo][:depth + 1]
+            end = bisect_left(keys, child + _LAST, lo, hi)
+            candidates.extend(self._top_of(child, lo, end))
+            lo = end
+        top = heapq.nsmallest(self.max_results, candidates)
+        if prefix:
+            self._top[prefix] = top
+        return top
+
+    def __len__(self) -> int:
+        return len(self._keys)
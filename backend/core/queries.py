@@ -0,0 +1,117 @@
+"""
+    Statement counting and fingerprinting, to catch N+1 query patterns.
+
+    A fingerprint is the shape of a statement: literals and placeholders become "?" and
+    expanded IN lists collapse to "(?...)", so the per-item queries of a loop like
+    `convert_expense` share one fingerprint whatever the ids and list lengths.
+
+    `MetricsMiddleware` counts the statements of every request (see `core.metrics`) and calls
+    `warn_repeated_statements` when one shape ran more than `settings.query_repeat_threshold`
+    times. Tests wrap endpoint calls in `assert_max_queries` instead.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s|:\w+|\$\d+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """
+        Returns the shape of a SQL statement, e.g. "SELECT * FROM trips WHERE id IN (1, 2)"
+        and "SELECT * FROM trips WHERE id IN (?)" both give "SELECT * FROM trips WHERE id IN (?...)".
+    """
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _LIST.sub("(?...)", shape)
+    shape = shape.replace("(?)", "(?...)")
+    return _SPACE.sub(" ", shape).strip()
+
+
+def repeated_statements(statements: Dict[str, int], threshold: int) -> List[Tuple[str, int]]:
+    """
+        Returns the fingerprints run more than `threshold` times, most repeated first, from
+        the number of executions of each statement.
+    """
+    shapes = Counter()
+    for statement, count in statements.items():
+        shapes[fingerprint(statement)] += count
+    return [(shape, count) for shape, count in shapes.most_common() if count > threshold]
+
+
+def warn_repeated_statements(statements: Dict[str, int], threshold: int, where: str) -> List[Tuple[str, int]]:
+    repeated = repeated_statements(statements, threshold)
+    for shape, count in repeated:
+        logger.warning("Possible N+1 query in %s: statement ran %d times: %s", where, count, shape)
+    return repeated
+
+
+class QueryRecorder:
+    """
+        Records the statements executed by an engine (or by every engine when given the
+        `sqlalchemy.engine.Engine` class) while started.
+    """
+
+    def __init__(self, engine):
+        # The events of an AsyncEngine are those of its sync engine
+        self.engine = getattr(engine, "sync_engine", engine)
+        self.statements: List[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def start(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def stop(self):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def fingerprints(self) -> Counter:
+        return Counter(fingerprint(statement) for statement in self.statements)
+
+    def report(self) -> str:
+        return "\n".join(f"{count:5d} x {shape}" for shape, count in self.fingerprints().most_common())
+
+
+@contextmanager
+def assert_max_queries(engine, limit: int, repeat_limit: int = None) -> Iterator[QueryRecorder]:
+    """
+        Fails with an AssertionError listing the statements run when the block runs more than
+        `limit` statements on `engine`, or the same statement shape more than `repeat_limit` times.
+
+        Usage:
+            with assert_max_queries(engine, 5):
+                client.get("/my-trips", headers=headers)
+    """
+    with QueryRecorder(engine) as recorder:
+        yield recorder
+    if recorder.count > limit:
+        raise AssertionError(f"{recorder.count} queries run, expected at most {limit}:\n{recorder.report()}")
+    if repeat_limit is not None:
+        shape, count = recorder.fingerprints().most_common(1)[0] if recorder.statements else ("", 0)
+        if count > repeat_limit:
+            raise AssertionError(f"Statement ran {count} times, expected at most {repeat_limit}: {shape}\n{recorder.report()}")
@@ -0,0 +1,202 @@
+"""
+    Synthetic dataset generation, for reproducing production-size problems locally
+    (see the `seed` command of `main.py`).
+
+    Rows are generated trip by trip with a seeded RNG, so the same options always build the same
+    database. Sizes are skewed like real usage: trip sizes follow a Pareto distribution (most
+    trips have a handful of participants, a few have thousands), a few users own many trips,
+    and events and expenses grow with the duration and size of the trip.
+
+    Rows are written with executemany of the tables' Core INSERT statements, compiled once, in
+    batches of `batch_size` rows per table, and `trip_balances` is filled as the expenses are
+    generated. Ids are assigned explicitly after the largest existing ones, so a database can be
+    seeded more than once. The search index is rebuilt once at the end rather than maintained
+    by its triggers row by row.
+"""
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+from core.config import settings
+from core.passwords import hash_password
+from models.expenses import Expense, ExpenseMeta, TripBalance
+from models.search import create_trip_search_triggers, drop_trip_search_triggers, rebuild_trip_search
+from models.trips import Trip, TripEvent, TripUsers
+from models.user_base import User
+
+# The password of every generated user
+SEED_PASSWORD = "password"
+
+DESTINATIONS = [
+    "Paris", "London", "New York", "Tokyo", "Barcelona", "Rome", "Lisbon", "Berlin", "Amsterdam", "Prague",
+    "Vienna", "Budapest", "Istanbul", "Dubai", "Bangkok", "Bali", "Sydney", "Cape Town", "Rio de Janeiro",
+    "Mexico City", "Toronto", "Vancouver", "Reykjavik", "Marrakesh", "Seoul", "Singapore", "Hanoi", "Lima",
+]
+EVENT_KINDS = ["Flight", "Hotel check-in", "Museum", "Dinner", "Hike", "Concert", "Tour", "Beach", "Market"]
+EXPENSE_KINDS = ["Dinner", "Groceries", "Taxi", "Hotel", "Tickets", "Drinks", "Fuel", "Souvenirs"]
+
+# Columns of each table, in the order of the generated tuples
+TABLES = [
+    (User.__table__, ["id", "username", "password", "full_name"]),
+    (Trip.__table__, ["id", "start_date", "end_date", "origin", "destination", "user_id"]),
+    (TripUsers.__table__, ["id", "user_id", "trip_id"]),
+    (TripEvent.__table__, ["id", "description", "time", "trip_id"]),
+    (ExpenseMeta.__table__, ["id", "trip_id", "paid_user_id", "description"]),
+    (Expense.__table__, ["id", "owe_user_id", "amount", "expense_id"]),
+    (TripBalance.__table__, ["trip_id", "creditor_id", "debtor_id", "amount"]),
+]
+
+
+class BatchWriter:
+    """
+        Buffers the rows of each table and writes them with one executemany per full batch.
+    """
+
+    def __init__(self, conn, batch_size: int):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.statements = {
+            table.name: str(table.insert().compile(dialect=conn.dialect, column_keys=columns))
+            for table, columns in TABLES
+        }
+        self.rows: Dict[str, List[tuple]] = {table.name: [] for table, _ in TABLES}
+        self.counts: Dict[str, int] = {table.name: 0 for table, _ in TABLES}
+
+    def flush_full(self):
+        # Called once per generated trip rather than per row, the batches overshoot by one trip at most
+        for name, rows in self.rows.items():
+            if len(rows) >= self.batch_size:
+                self.flush(name)
+
+    def flush(self, table: str = None):
+        for name in [table] if table is not None else list(self.rows):
+            rows = self.rows[name]
+            if rows:
+                self.conn.exec_driver_sql(self.statements[name], rows)
+                self.counts[name] += len(rows)
+                # Cleared in place, the generator holds references to these lists
+                rows.clear()
+
+
+def next_id(conn, table: str) -> int:
+    return conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").scalar()
+
+
+def seed_database(
+    engine,
+    users: int = 100000,
+    trips: int = 100000,
+    max_trip_size: int = 2000,
+    expenses_per_participant: float = 3.0,
+    seed: int = 42,
+    batch_size: int = 50000,
+) -> Dict[str, int]:
+    """
+        Fills a database with a synthetic dataset.
+
+        Args:
+        - engine: The engine of the database, whose tables must exist (see `core.db.init_db`).
+        - users: The number of users to create.
+        - trips: The number of trips to create.
+        - max_trip_size: The largest number of participants of a trip.
+        - expenses_per_participant: The average number of expenses per participant of a trip.
+        - seed: The seed of the RNG.
+        - batch_size: The rows written per executemany.
+
+        Returns:
+        - The number of rows written per table.
+    """
+    rng = random.Random(seed)
+    stored_password = hash_password(SEED_PASSWORD)
+    first_day = date(2020, 1, 1)
+
+    with engine.connect() as conn:
+        # Generated rows are consistent by construction: skip the per-row foreign key lookups,
+        # which also lets the tables be written in any order
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            with conn.begin():
+                # Indexing trip by trip and event by event is much slower than one rebuild at the end
+                drop_trip_search_triggers(conn)
+                writer = BatchWriter(conn, batch_size)
+                rows = writer.rows
+                # rng.random() arithmetic rather than randint/choice, which dominate the generation time
+                random_ = rng.random
+                user_id = next_id(conn, "users")
+                first_user_id = user_id
+                for _ in range(users):
+                    rows["users"].append((user_id, f"user{user_id}", stored_password, f"User {user_id}"))
+                    user_id += 1
+                    if user_id % batch_size == 0:
+                        writer.flush_full()
+
+                trip_id = next_id(conn, "trips")
+                trip_user_id = next_id(conn, "trip_users")
+                event_id = next_id(conn, "trip_event")
+                expense_id = next_id(conn, "expenses_meta")
+                line_id = next_id(conn, "expenses")
+                trip_users, trip_events, metas, lines = rows["trip_users"], rows["trip_event"], rows["expenses_meta"], rows["expenses"]
+                for _ in range(trips):
+                    # Skewed owners: the first 1% of the users own about a fifth of the trips
+                    owner = first_user_id + int(users * random_() ** 3)
+                    size = min(int(rng.paretovariate(1.3)), max_trip_size, users)
+                    start = first_day + timedelta(days=int(random_() * 2000))
+                    duration = min(int(rng.expovariate(1 / 6)) + 1, 90)
+                    rows["trips"].append((
+                        trip_id, start.isoformat(), (start + timedelta(days=duration)).isoformat(),
+                        DESTINATIONS[int(random_() * len(DESTINATIONS))], DESTINATIONS[int(random_() * len(DESTINATIONS))], owner,
+                    ))
+
+                    participants = {owner}
+                    while len(participants) < size:
+                        participants.add(first_user_id + int(random_() * users))
+                    participants = sorted(participants)
+                    for participant in participants:
+                        trip_users.append((trip_user_id, participant, trip_id))
+                        trip_user_id += 1
+
+                    for _ in range(int(random_() * (2 * duration + 1))):
+                        day = start + timedelta(days=int(random_() * (duration + 1)))
+                        trip_events.append((event_id, EVENT_KINDS[int(random_() * len(EVENT_KINDS))], day.isoformat(), trip_id))
+                        event_id += 1
+
+                    balances: Dict[tuple, int] = {}
+                    if size > 1:
+                        for _ in range(int(rng.expovariate(1 / expenses_per_participant) * size)):
+                            payer = participants[int(random_() * size)]
+                            metas.append((expense_id, trip_id, payer, EXPENSE_KINDS[int(random_() * len(EXPENSE_KINDS))]))
+                            owers = []
+                            for _ in range(min(1 + int(random_() * 5), size - 1)):
+                                ower = payer
+                                while ower == payer or ower in owers:
+                                    ower = participants[int(random_() * size)]
+                                owers.append(ower)
+                            for ower in owers:
+                                amount = 100 + int(random_() * 19900)
+                                lines.append((line_id, ower, amount, expense_id))
+                                balances[(payer, ower)] = balances.get((payer, ower), 0) + amount
+                                line_id += 1
+                            expense_id += 1
+                    rows["trip_balances"].extend(
+                        (trip_id, creditor, debtor, amount) for (creditor, debtor), amount in balances.items()
+                    )
+                    trip_id += 1
+                    writer.flush_full()
+                writer.flush()
+                create_trip_search_triggers(conn)
+                rebuild_trip_search(conn)
+        finally:
+            conn.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if settings.sqlite_foreign_keys else 'OFF'}")
+    return writer.counts
+
+
+def seed_and_report(engine, echo=print, **options) -> Dict[str, int]:
+    start = time.perf_counter()
+    counts = seed_database(engine, **options)
+    elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        echo(f"{table:>14}: {count:10d} rows")
+    total = sum(counts.values())
+    echo(f"{total} rows in {elapsed:.1f} s ({total / elapsed:.0f} rows/s)")
+    return counts
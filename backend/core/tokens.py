@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from core.config import settings
+from models.user_base import RevokedToken
+
+# Signed tokens look like "v1.<payload>.<signature>", legacy tokens are sha256 hex digests
+SIGNED_TOKEN_PREFIX = "v1."
+
+_secret = (settings.token_secret or os.urandom(32).hex()).encode("utf-8")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(message: str) -> str:
+    return _b64encode(hmac.new(_secret, message.encode("ascii"), hashlib.sha256).digest())
+
+
+def is_signed_token(token: str) -> bool:
+    return token.startswith(SIGNED_TOKEN_PREFIX)
+
+
+def create_signed_token(user_id: int, ttl: int = None, now: float = None) -> str:
+    """
+        Creates an HMAC-SHA256 signed access token.
+
+        Args:
+        - user_id: The id of the user the token is issued to (`sub` claim).
+        - ttl: The lifetime of the token in seconds, `settings.access_token_ttl` by default.
+        - now: The issue time, the current time by default.
+
+        Returns:
+        - The encoded token.
+    """
+    issued_at = int(now if now is not None else time.time())
+    claims = {
+        "sub": user_id,
+        "exp": issued_at + (ttl if ttl is not None else settings.access_token_ttl),
+        "jti": os.urandom(12).hex(),
+    }
+    message = SIGNED_TOKEN_PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{message}.{_sign(message)}"
+
+
+def decode_signed_token(token: str, now: float = None) -> Optional[Dict]:
+    """
+        Verifies the signature and expiry of a signed token, without any database access.
+
+        Returns:
+        - The claims of the token, or None if the token is malformed, forged or expired.
+    """
+    message, _, signature = token.rpartition(".")
+    try:
+        if not is_signed_token(message) or not hmac.compare_digest(signature.encode("ascii"), _sign(message).encode("ascii")):
+            return None
+        claims = json.loads(_b64decode(message[len(SIGNED_TOKEN_PREFIX):]))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) <= (now if now is not None else time.time()):
+        return None
+    return claims
+
+
+class TokenDenylist:
+    """
+        The `jti` of the signed tokens revoked before their expiry.
+
+        Lookups are served from memory. Revocations are written to the `revoked_tokens` table
+        so they survive restarts and reach the other workers, which reload the table at most
+        every `settings.token_denylist_refresh` seconds.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, int] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, session, jti: str, expires_at: int):
+        # Expired tokens are rejected anyway, their denylist entries can go
+        session.query(RevokedToken).filter(RevokedToken.expires_at <= int(time.time())).delete()
+        session.merge(RevokedToken(jti=jti, expires_at=expires_at))
+        session.commit()
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def load(self, session):
+        now = int(time.time())
+        revoked = dict(
+            session.query(RevokedToken.jti, RevokedToken.expires_at)
+            .filter(RevokedToken.expires_at > now)
+            .all()
+        )
+        with self._lock:
+            # Revocations are never undone, keep the ones made by this process while loading
+            revoked.update((jti, exp) for jti, exp in self._revoked.items() if exp > now)
+            self._revoked = revoked
+            self._loaded_at = time.monotonic()
+
+    def refresh_if_stale(self, session):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.token_denylist_refresh:
+            self.load(session)
+
+
+denylist = TokenDenylist()
+
+
+def verify_signed_token(session, token: str) -> Optional[Dict]:
+    """
+        Returns the claims of a valid, unexpired and unrevoked signed token, or None.
+    """
+    claims = decode_signed_token(token)
+    if claims is None:
+        return None
+    denylist.refresh_if_stale(session)
+    if claims["jti"] in denylist:
+        return None
+    return claims
@@ -1,12 +1,18 @@
 import os
 from hashlib import sha256
+from core.cache import TTLCache
+from core.config import settings
+from core import tokens
+from core.passwords import dummy_hash, hasher, needs_rehash
 from models.user_base import *
 
 class UserManagement:
-    
+    # Resolved users by access token, see get_current_user
+    token_cache = TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl)
+
     @staticmethod
     def create_user(session, username: str, password: str, fullname: str):
-        user = User(username=username, password=password, full_name=fullname)
+        user = User(username=username, password=hasher.hash(password), full_name=fullname)
         session.add(user)
         session.commit()
         return user
@@ -21,6 +27,8 @@ class UserManagement:
 
     @staticmethod
     def create_access_token(session, user):
+        if settings.token_mode == "signed":
+            return tokens.create_signed_token(user.id)
         token = UserManagement.generate_token(user.username)
         session.add(Token(token=token, user_id=user.id))
         session.commit()
@@ -28,13 +36,96 @@ class UserManagement:
 
     @staticmethod
     def get_current_user(session, token: str):
-        token_obj = session.query(Token).filter(Token.token == token).first()
-        if not token_obj:
+        """
+            Resolves an access token to a CurrentUser snapshot.
+
+            Signed tokens are verified (signature, expiry, denylist) on every call without touching
+            the database. Resolved users are kept in `token_cache` for `settings.token_cache_ttl`
+            seconds, so repeated requests with the same token do not query the database. On a cache
+            miss the user is loaded with a single query: by primary key for signed tokens, joined
+            with the `tokens` table for legacy ones.
+        """
+        if tokens.is_signed_token(token):
+            claims = tokens.verify_signed_token(session, token)
+            if claims is None:
+                return None
+        elif settings.token_mode == "signed" and not settings.accept_legacy_tokens:
+            return None
+        current_user = UserManagement.token_cache.get(token)
+        if current_user is not None:
+            return current_user
+        if tokens.is_signed_token(token):
+            user = session.query(User).filter(User.id == claims["sub"]).first()
+        else:
+            user = (
+                session.query(User)
+                .join(Token, Token.user_id == User.id)
+                .filter(Token.token == token)
+                .first()
+            )
+        if not user:
             return None
-        return session.query(User).filter(User.id == token_obj.user_id).first()
+        current_user = CurrentUser(id=user.id, username=user.username, full_name=user.full_name)
+        UserManagement.token_cache.set(token, current_user)
+        return current_user
+
+    @staticmethod
+    def revoke_token(session, token: str):
+        """
+            Revokes an access token (e.g. on logout) and drops it from the token cache.
+            Legacy tokens are deleted, signed tokens are added to the denylist until they expire.
+        """
+        if tokens.is_signed_token(token):
+            claims = tokens.decode_signed_token(token)
+            if claims is not None:
+                tokens.denylist.revoke(session, claims["jti"], claims["exp"])
+        else:
+            session.query(Token).filter(Token.token == token).delete()
+            session.commit()
+        UserManagement.invalidate_token(token)
+
+    @staticmethod
+    def update_user(session, user, full_name: str = None, password: str = None):
+        """
+            Updates and commits a user, hashing the new password, and drops the cached tokens of
+            the user. Every change to a user row goes through here.
+        """
+        if full_name is not None:
+            user.full_name = full_name
+        if password is not None:
+            user.password = hasher.hash(password)
+        session.commit()
+        UserManagement.invalidate_user(user.id)
+        return user
+
+    @staticmethod
+    def invalidate_token(token: str):
+        UserManagement.token_cache.pop(token)
+
+    @staticmethod
+    def invalidate_user(user_id: int):
+        """
+            Drops every cached token of a user, to be called whenever the user is updated.
+        """
+        UserManagement.token_cache.pop_where(lambda current_user: current_user.id == user_id)
 
     @staticmethod
     def authenticate_user(session, username: str, password: str):
-        return session.query(User).filter(User.username == username, User.password == password).first()
+        """
+            Returns the user with these credentials, or None.
+
+            Plaintext passwords, and hashes weaker than the configured ones, are rehashed on
+            success. May raise PasswordHasherBusy (see `core.passwords`).
+        """
+        user = UserManagement.get_user(session, username)
+        if user is None:
+            # As slow as a wrong password: the response time must not tell which usernames exist
+            hasher.verify(password, dummy_hash())
+            return None
+        if not hasher.verify(password, user.password):
+            return None
+        if needs_rehash(user.password):
+            UserManagement.update_user(session, user, password=password)
+        return user
 
     
\ No newline at end of file
@@ -3,15 +3,34 @@ import click
 import uvicorn
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from core.user_management import UserManagement
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-
-from datetime import datetime
-
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+import json
+from datetime import date, datetime
+from typing import List, Optional
+
+from core.config import settings
+from core.etags import etag_matches, not_modified, set_etag
+from core.fast_json import FastJSONResponse
+from core.metrics import MetricsMiddleware, allow_repeated_statements, instrument_engines, registry as metrics_registry
+from core.passwords import PasswordHasherBusy, hasher
+from core.seeding import seed_and_report
 from core.db import *
 
 from models.trips import *
+from models.expenses import *
+from models.settlement import *
+from models.search import rebuild_trip_search, search_trip_ids
+from models.places import PlaceSuggestions, suggest_places
+from models.calendar import CalendarOut, calendar_page
+import operations
+from operations import BatchIn, BatchOut, run_batch
+from models.trip_dates import overlapping_trips_page, overlapping_trips_page_from_index
 from models.user_base import *
 from models.basic_models import *
 
@@ -27,6 +46,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.gzip_minimum_size > 0:
+    # Compresses the responses of at least gzip_minimum_size bytes for the clients accepting gzip
+    app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=settings.gzip_level)
+
+if settings.metrics_enabled:
+    # Added last so it wraps the other middlewares and measures the whole request
+    app.add_middleware(MetricsMiddleware, registry=metrics_registry, repeat_threshold=settings.query_repeat_threshold)
+    instrument_engines()
+
+
+if settings.db_mode == "async":
+    from async_routes import router as async_router
+    from core.async_db import dispose_async_engine
+    # Registered before the routes below, so the async handlers take precedence
+    app.include_router(async_router)
+    app.add_event_handler("shutdown", dispose_async_engine)
+
+
+@app.on_event("startup")
+def on_startup():
+    init_db()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    hasher.shutdown()
+
 
 @app.post("/signup")
 def signup(user: UserIn, session=Depends(get_db)) -> ActionSuccessResponse:
@@ -44,17 +90,21 @@ def signup(user: UserIn, session=Depends(get_db)) -> ActionSuccessResponse:
 
         Raises:
         HTTPException: If the provided username is already taken.
+        HTTPException(503): If the password hasher is saturated.
     """
     existing_user = UserManagement.get_user(session, user.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
-    UserManagement.create_user(
-        session, user.username, user.password, user.full_name)
+    try:
+        UserManagement.create_user(
+            session, user.username, user.password, user.full_name)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
     return ActionSuccessResponse(success=True)
 
 
-def authenticate_user(session, username: str, password: str):
-    return session.query(User).filter(User.username == username, User.password == password).first()
+def password_hasher_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Too many concurrent logins, retry later", headers={"Retry-After": "1"})
 
 
 @app.post("/login")
@@ -64,6 +114,7 @@ def login(credentials: HTTPBasicCredentials = Depends(security), session=Depends
 
         This function authenticates a user by checking their username and password against the records in the `users` table.
         If the credentials are valid, it generates and returns a new access token.
+        The password is checked in the process pool of `core.passwords`, and legacy plaintext passwords are rehashed.
 
         Args:
         - credentials (HTTPBasicCredentials): The username and password provided by the user.
@@ -74,9 +125,13 @@ def login(credentials: HTTPBasicCredentials = Depends(security), session=Depends
 
         Raises:
         HTTPException: If the credentials are invalid.
+        HTTPException(503): If the password hasher is saturated.
     """
-    user = authenticate_user(
-        session, credentials.username, credentials.password)
+    try:
+        user = UserManagement.authenticate_user(
+            session, credentials.username, credentials.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
     if not user:
         raise HTTPException(
             status_code=401, detail="Incorrect username or password")
@@ -84,8 +139,51 @@ def login(credentials: HTTPBasicCredentials = Depends(security), session=Depends
     return TokenOut(access_token=token, token_type="bearer")
 
 
+@app.post("/logout")
+def logout(credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)) -> ActionSuccessResponse:
+    """
+        Revoke the access token used for the request.
+
+        Args:
+        - credentials (HTTPAuthorizationCredentials): The bearer token to revoke.
+        - session (sqlalchemy.orm.session.Session): The SQLAlchemy database session.
+
+        Returns:
+        ActionSuccessResponse: A response indicating whether the action was successful.
+
+        Raises:
+        HTTPException: If the authorization type is incorrect.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    UserManagement.revoke_token(session, credentials.credentials)
+    return ActionSuccessResponse(success=True)
+
+
+def token_cache_metrics():
+    stats = UserManagement.token_cache.stats()
+    return [
+        ("token_cache_hits_total", "counter", "Token cache hits.", stats["hits"]),
+        ("token_cache_misses_total", "counter", "Token cache misses.", stats["misses"]),
+        ("token_cache_evictions_total", "counter", "Token cache evictions.", stats["evictions"]),
+        ("token_cache_size", "gauge", "Tokens in the token cache.", stats["size"]),
+    ]
+
+
+metrics_registry.collectors.append(token_cache_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+        Returns the per-route request metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/users/me")
-def read_current_user(session=Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_security)):
+def read_current_user(session=Depends(get_read_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_security)):
     """
         Retrieve the current user's username.
 
@@ -109,7 +207,7 @@ def read_current_user(session=Depends(get_db), credentials: HTTPAuthorizationCre
     return UserOut(username=user.username, fullName=user.full_name)
 
 @app.get("/user/{username}")
-def read_current_user(username: str, session=Depends(get_db)):
+def read_current_user(username: str, session=Depends(get_read_db)):
     """
         Retrieve the current user's username.
 
@@ -153,45 +251,35 @@ def create_trip(tripIn: TripIn, credentials: HTTPAuthorizationCredentials = Depe
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    # Create the trip object and add it to the database
-    trip = Trip(
-        start_date=datetime.strptime(tripIn.startDate, "%Y-%m-%d").date(),
-        end_date=datetime.strptime(tripIn.endDate, "%Y-%m-%d").date(),
-        origin=tripIn.origin,
-        destination=tripIn.destination,
-        user_id=user.id
-    )
-
-    session.add(trip)
-    session.commit()
-
-    user_trip_assoc = TripUsers(
-        user_id=user.id,
-        trip_id=trip.id
-    )
-
-    session.add(user_trip_assoc)
+    # The trip and its first participant, in one transaction
+    operations.create_trip(session, user, tripIn)
     session.commit()
 
     return ActionSuccessResponse(success=True)
 
 
-@app.get("/my-trips")
-def get_trips(credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)):
+@app.get("/my-trips", response_model=TripsOut)
+def get_trips(limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
     """
         Retrieve trips for the authenticated user.
 
         This endpoint returns a list of trips associated with the authenticated user. The user is authenticated using a Bearer token, and if the authentication fails, the function raises an HTTPException with status code 400 and the detail message "Incorrect authorization type" or "User not found" if the user is not present in the database.
 
+        The trips are paginated by id. A page holds at most `limit` trips (capped, and defaulting to, `settings.trips_page_size_max`) and the `next_cursor` of the response is passed as `after` to fetch the next page.
+
         Args:
+        - limit (int, optional): the maximum number of trips to return.
+        - after (str, optional): the `next_cursor` of the previous page.
+        - if_none_match (str, optional): the ETag of a previously fetched copy of the page.
         - credentials (HTTPAuthorizationCredentials): the authentication credentials provided by the client.
         - session (Session): the SQLAlchemy session object used to interact with the database.
         
         Returns:
         - TripsOut: A Pydantic model object containing a list of trips associated with the authenticated user. Each trip is represented as a TripOut object, which contains details about the trip including the participants and events associated with it.
+        - An empty 304 response instead, when `If-None-Match` holds the current ETag of the page.
         
         Raises:
-        HTTPException(400): If the authentication fails, the user is not found in the database or the user is not associated with any trips.
+        HTTPException(400): If the authentication fails, the user is not found in the database, the user is not associated with any trips or the cursor is invalid.
     """
     if credentials.scheme.lower() != "bearer":
         raise HTTPException(
@@ -202,24 +290,29 @@ def get_trips(credentials: HTTPAuthorizationCredentials = Depends(bearer_securit
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    trips = session.query(Trip).filter(Trip.user_id == user.id)
-    return TripsOut(trips=[convert_trip(session, trip) for trip in trips])
+    return get_trips_page(session, session.query(Trip).filter(Trip.user_id == user.id), limit, after, if_none_match)
 
 
-@app.get("/all-trips")
-def get_trips(credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)):
+@app.get("/all-trips", response_model=TripsOut)
+def get_trips(limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
     """
         Retrieves all trips from the database.
 
+        The trips are paginated by id. A page holds at most `limit` trips (capped, and defaulting to, `settings.trips_page_size_max`) and the `next_cursor` of the response is passed as `after` to fetch the next page.
+
         Args:
+        - limit (int, optional): The maximum number of trips to return.
+        - after (str, optional): The `next_cursor` of the previous page.
+        - if_none_match (str, optional): The ETag of a previously fetched copy of the page.
         - credentials (HTTPAuthorizationCredentials, optional): The authorization credentials of the user. Defaults to Depends(bearer_security).
         - session (Session, optional): The database session. Defaults to Depends(get_db).
         
         Raises:
-        HTTPException: If the credentials scheme is not 'bearer' or the user is not found in the database.
+        HTTPException: If the credentials scheme is not 'bearer', the user is not found in the database or the cursor is invalid.
         
         Returns:
-        TripsOut: A response model containing a list of TripOut objects representing the retrieved trips.
+        TripsOut: A response model containing a list of TripOut objects representing the retrieved trips,
+        or an empty 304 response when `If-None-Match` holds the current ETag of the page.
     """
     if credentials.scheme.lower() != "bearer":
         raise HTTPException(
@@ -230,22 +323,243 @@ def get_trips(credentials: HTTPAuthorizationCredentials = Depends(bearer_securit
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    trips = session.query(Trip)
-    return TripsOut(trips=[convert_trip(session, trip) for trip in trips])
+    return get_trips_page(session, session.query(Trip), limit, after, if_none_match)
+
+
+@app.get("/all-trips/export")
+# Participants and events are loaded once per chunk of trips
+@allow_repeated_statements
+def export_trips(credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
+    """
+        Streams all trips as NDJSON, one TripOut object per line.
+
+        Meant for admin exports and data pipelines: unlike `/all-trips`, the whole listing is never
+        built in memory. The trips are read from the database in chunks of `settings.trips_export_chunk_size`.
+
+        Args:
+        - credentials (HTTPAuthorizationCredentials): The authorization credentials of the user.
+        - session (Session): The database session, kept open until the stream is exhausted.
+
+        Returns:
+        StreamingResponse: An `application/x-ndjson` stream of TripOut objects.
+
+        Raises:
+        HTTPException: If the credentials scheme is not 'bearer' or the user is not found in the database.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+
+    return StreamingResponse(
+        iter_trips_ndjson(session, settings.trips_export_chunk_size),
+        media_type="application/x-ndjson",
+    )
+
+
+def get_trips_page(session, query, limit: Optional[int], after: Optional[str], if_none_match: Optional[str]) -> Response:
+    page_size = min(limit or settings.trips_page_size_max, settings.trips_page_size_max)
+    try:
+        trips, next_cursor = paginate_trips(query, page_size, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return trips_page_response(session, trips, next_cursor, if_none_match)
+
+
+def trips_page_response(session, trips: List[Trip], next_cursor: Optional[str], if_none_match: Optional[str]) -> Response:
+    # Compared before the participants and events are loaded and the trips converted
+    etag = trips_page_etag(trips, next_cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    # The JSON of TripsOut built as plain dicts, see convert_trips_to_dicts
+    response = FastJSONResponse({"trips": convert_trips_to_dicts(session, trips), "next_cursor": next_cursor})
+    set_etag(response, etag)
+    return response
+
+
+@app.get("/trips", response_model=TripsOut)
+def get_overlapping_trips(overlaps_from: date, overlaps_to: date, limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
+    """
+        Retrieves the trips overlapping a date window: starting on or before `overlaps_to` and ending on or after `overlaps_from`.
+
+        The trips are found through the `(start_date, end_date)` index of the trips table, or in the in-memory interval
+        index when `settings.trip_interval_index` is set (see models.trip_dates). They are returned in chronological
+        order, by start date, end date and id. A page holds at most `limit` trips (capped, and defaulting to,
+        `settings.trips_page_size_max`) and the `next_cursor` of the response is passed as `after` to fetch the next page.
+
+        Args:
+        - overlaps_from (date): The first day of the window, as YYYY-MM-DD.
+        - overlaps_to (date): The last day of the window, as YYYY-MM-DD.
+        - limit (int, optional): The maximum number of trips to return.
+        - after (str, optional): The `next_cursor` of the previous page.
+        - if_none_match (str, optional): The ETag of a previously fetched copy of the page.
+        - credentials (HTTPAuthorizationCredentials): The authorization credentials of the user.
+        - session (Session): The database session.
+
+        Returns:
+        TripsOut: The trips overlapping the window, in chronological order, or an empty 304 response when `If-None-Match` holds the current ETag of the page.
+
+        Raises:
+        HTTPException(400): If the credentials scheme is not 'bearer', the user is not found in the database, the window ends before it starts or the cursor is invalid.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if overlaps_to < overlaps_from:
+        raise HTTPException(status_code=400, detail="overlaps_to is before overlaps_from")
+
+    page_size = min(limit or settings.trips_page_size_max, settings.trips_page_size_max)
+    page = overlapping_trips_page_from_index if settings.trip_interval_index else overlapping_trips_page
+    try:
+        trips, next_cursor = page(session, overlaps_from, overlaps_to, page_size, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return trips_page_response(session, trips, next_cursor, if_none_match)
+
+
+@app.get("/calendar", response_model=CalendarOut)
+def get_calendar(start: date = Query(..., alias="from"), end: date = Query(..., alias="to"), limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
+    """
+        Retrieves the events of all the trips the user created or participates in, between two dates, in time order.
+
+        The events of each trip are read in order from the `(trip_id, time)` index of the events and merged as they
+        are read (see models.calendar). They are ordered by time, trip id and id. A page holds at most `limit` events
+        (capped, and defaulting to, `settings.calendar_page_size_max`) and the `next_cursor` of the response is passed
+        as `after` to fetch the next page.
+
+        Args:
+        - start (date): The first day of the calendar, as YYYY-MM-DD, passed as `from`.
+        - end (date): The last day of the calendar, as YYYY-MM-DD, passed as `to`.
+        - limit (int, optional): The maximum number of events to return.
+        - after (str, optional): The `next_cursor` of the previous page.
+        - credentials (HTTPAuthorizationCredentials): The authorization credentials of the user.
+        - session (Session): The database session.
+
+        Returns:
+        CalendarOut: The events of the user's trips between the two dates, each with the id of its trip.
+
+        Raises:
+        HTTPException(400): If the credentials scheme is not 'bearer', the user is not found in the database, `to` is before `from` or the cursor is invalid.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if end < start:
+        raise HTTPException(status_code=400, detail="to is before from")
+
+    page_size = min(limit or settings.calendar_page_size_max, settings.calendar_page_size_max)
+    try:
+        events, next_cursor = calendar_page(session, user.id, start, end, page_size, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return FastJSONResponse({"events": events, "next_cursor": next_cursor})
+
+
+@app.get("/trips/search", response_model=TripsOut)
+def search_trips(q: str = Query(..., min_length=1, max_length=200), limit: Optional[int] = Query(None, ge=1), after: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
+    """
+        Searches the trips by origin, destination and event descriptions.
+
+        Every word of `q` must appear in the trip, the last one possibly as a prefix. The trips are served from
+        the `trip_search` full text index (see models.search), best match first, origin and destination matches
+        ranking above event matches. A page holds at most `limit` trips (capped, and defaulting to,
+        `settings.trips_page_size_max`) and the `next_cursor` of the response is passed as `after` to fetch the next page.
+        Only the `settings.search_max_candidates` best matches are served: the pages of a search that matches more
+        trips stop there. The next pages follow the ranking computed for the first one, unaffected by later writes.
+
+        Args:
+        - q (str): The searched text.
+        - limit (int, optional): The maximum number of trips to return.
+        - after (str, optional): The `next_cursor` of the previous page.
+        - credentials (HTTPAuthorizationCredentials): The authorization credentials of the user.
+        - session (Session): The database session.
+
+        Returns:
+        TripsOut: The matching trips, in rank order.
+
+        Raises:
+        HTTPException(400): If the credentials scheme is not 'bearer', the user is not found in the database or the cursor is invalid.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+
+    page_size = min(limit or settings.trips_page_size_max, settings.trips_page_size_max)
+    try:
+        trip_ids, next_cursor = search_trip_ids(session, q, page_size, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    trips_by_id = {trip.id: trip for trip in session.query(Trip).filter(Trip.id.in_(trip_ids))} if trip_ids else {}
+    # A trip deleted since the search is skipped
+    trips = [trips_by_id[trip_id] for trip_id in trip_ids if trip_id in trips_by_id]
+    return FastJSONResponse({"trips": convert_trips_to_dicts(session, trips, user), "next_cursor": next_cursor})
+
+
+@app.get("/destinations/suggest", response_model=PlaceSuggestions)
+def suggest_destinations(prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=20), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
+    """
+        Suggests the places starting with `prefix` among the origins and destinations of the existing trips.
+
+        Served from the in-memory `place_index` (see models.places), the places used by the most trips first.
+        Accents and case are ignored, e.g. "zur" suggests "Zürich".
+
+        Args:
+        - prefix (str): The beginning of the place typed by the user.
+        - limit (int, optional): The maximum number of suggestions, 10 by default.
+        - credentials (HTTPAuthorizationCredentials): The authorization credentials of the user.
+        - session (Session): The database session, used to load the index on the first call.
+
+        Returns:
+        PlaceSuggestions: The suggested places, with the number of trips using each of them.
+
+        Raises:
+        HTTPException(400): If the credentials scheme is not 'bearer' or the user is not found in the database.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+
+    return FastJSONResponse({"suggestions": [suggestion.dict() for suggestion in suggest_places(session, prefix, limit)]})
 
 
 @app.get("/trip/{trip_id}")
-def get_trips(trip_id: int, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)):
+def get_trips(trip_id: int, response: Response, if_none_match: Optional[str] = Header(None), credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)):
     """
         This function handles GET requests to retrieve details of a specific trip by its ID.
 
         Args:
         - trip_id (int): ID of the trip to retrieve details for.
+        - if_none_match (str, optional): The ETag of a previously fetched copy of the trip.
         - credentials (HTTPAuthorizationCredentials, optional): HTTP authorization credentials required for authentication.
         - session (sqlalchemy.orm.Session, optional): Database session object.
         
         Returns:
-        TripOut: TripOut object containing the details of the trip, including its participants, events, and basic information.
+        TripOut: TripOut object containing the details of the trip, including its participants, events, and basic information,
+        or an empty 304 response when `If-None-Match` holds the current ETag of the trip.
         
         Raises:
         HTTPException(400): If the authorization type is incorrect or the user is not found.
@@ -265,7 +579,11 @@ def get_trips(trip_id: int, credentials: HTTPAuthorizationCredentials = Depends(
     if trip is None:
         raise HTTPException(status_code=404, detail="Trip not found")
 
-    return convert_trip(session, trip, user)
+    etag = trip_etag(trip, user)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return convert_trips(session, [trip], user)[0]
 
 
 @app.post("/trip/add-participant")
@@ -283,6 +601,7 @@ def create_trip(participantData: AddTripParticipantPostData, credentials: HTTPAu
 
         Raises:
         HTTPException(400): If the authorization type is incorrect or the user is not found.
+        HTTPException(404): If the trip is not found.
     """
     if credentials.scheme.lower() != "bearer":
         raise HTTPException(
@@ -293,12 +612,7 @@ def create_trip(participantData: AddTripParticipantPostData, credentials: HTTPAu
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    user_trip_assoc = TripUsers(
-        user_id=user.id,
-        trip_id=participantData.trip_id
-    )
-
-    session.add(user_trip_assoc)
+    operations.add_participant(session, user, participantData)
     session.commit()
 
     return ActionSuccessResponse(success=True)
@@ -329,20 +643,7 @@ def create_trip(participantData: RemoveTripParticipantPostData, credentials: HTT
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    allTripUserAssocs = session.query(TripUsers).all()
-
-    user_trip_assocs = (
-        session
-        .query(TripUsers)
-        .filter(
-            (TripUsers.user_id == user.id) and
-            (TripUsers.trip_id == participantData.trip_id)
-        )
-        .all()
-    )
-
-    for assoc in user_trip_assocs:
-        session.delete(assoc)
+    operations.remove_participant(session, user, participantData)
     session.commit()
 
     return ActionSuccessResponse(success=True)
@@ -363,6 +664,7 @@ def create_trip(newEventData: AddTripEventPostData, credentials: HTTPAuthorizati
         
         Raises:
         HTTPException: If the user is not authorized or is not found in the database.
+        HTTPException(404): If the trip is not found.
     """
     if credentials.scheme.lower() != "bearer":
         raise HTTPException(
@@ -373,13 +675,7 @@ def create_trip(newEventData: AddTripEventPostData, credentials: HTTPAuthorizati
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    event = TripEvent(
-        description=newEventData.description,
-        time=datetime.strptime(newEventData.time, "%Y-%m-%d").date(),
-        trip_id=newEventData.trip_id,
-    )
-
-    session.add(event)
+    operations.add_event(session, user, newEventData)
     session.commit()
 
     return ActionSuccessResponse(success=True)
@@ -410,21 +706,56 @@ def create_trip(eventData: RemoveTripEventPostData, credentials: HTTPAuthorizati
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    event = (
-        session
-        .query(TripEvent)
-        .filter(
-            TripEvent.id == eventData.event_id
-        )
-        .one()
-    )
-
-    session.delete(event)
+    operations.remove_event(session, user, eventData)
     session.commit()
 
     return ActionSuccessResponse(success=True)
 
 
+@app.post("/batch", response_model=BatchOut)
+def apply_batch(batch: BatchIn, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)):
+    """
+        Applies an ordered list of write operations in a single transaction: all of them, or none if one fails.
+
+        Each operation is one of "create_trip", "add_participant", "remove_participant", "add_event", "remove_event"
+        and "create_expense", with as `args` the JSON body of its endpoint. The user is authenticated once for the
+        whole batch and the transaction is committed once. A `trip_id` or `event_id` argument "$N" stands for the id of
+        the row created by operation N of the batch, counting from 0: e.g. `{"op": "add_event", "args": {"trip_id": "$0", ...}}` adds
+        an event to the trip created by a first "create_trip" operation (see operations.py).
+
+        Args:
+        - batch (BatchIn): The operations to apply, at most `settings.batch_max_operations`.
+        - credentials (HTTPAuthorizationCredentials): The bearer token for authenticating the user.
+        - session (Session): The database session.
+
+        Returns:
+        BatchOut: The result of each operation, in order, with the id of the trip, participant, event or expense it created.
+
+        Raises:
+        HTTPException(400): If the authorization type is incorrect, the user is not found or the batch holds too many operations.
+        HTTPException: The error of the first failing operation, whose detail holds the index of the operation and its error. Nothing is written then.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if len(batch.operations) > settings.batch_max_operations:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {settings.batch_max_operations} operations")
+
+    try:
+        results = run_batch(session, user, batch.operations)
+    except HTTPException:
+        session.rollback()
+        raise
+    session.commit()
+
+    return BatchOut(success=True, results=results)
+
+
 @app.delete("/trips/{trip_id}")
 def delete_trip(trip_id: int, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)):
     """
@@ -452,16 +783,304 @@ def delete_trip(trip_id: int, credentials: HTTPAuthorizationCredentials = Depend
     trip = session.query(Trip).filter(Trip.id == trip_id).first()
     if trip is None:
         raise HTTPException(status_code=404, detail="Trip not found")
+    # Participants and events go with the trip (ON DELETE CASCADE), expenses must go first
+    delete_trip_expenses(session, trip_id)
     session.delete(trip)
     session.commit()
 
     return ActionSuccessResponse(success=True)
 
 
-@click.command()
+@app.post("/trip/{trip_id}/expenses")
+def create_trip_expense(trip_id: int, request: CreateExpenseRequest, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)) -> CreateExpenseResponse:
+    """
+        Creates an expense of a trip.
+
+        Args:
+        - trip_id (int): ID of the trip the expense belongs to.
+        - request (CreateExpenseRequest): The paying user and the amounts owed by each user. Its `trip_id` must match the path.
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        CreateExpenseResponse: The id of the created expense.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or not found, or if the expense is invalid (e.g. a user is not a participant of the trip).
+        HTTPException(404): If the trip is not found.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if request.trip_id != trip_id:
+        raise HTTPException(status_code=400, detail="Trip id mismatch")
+
+    expense = operations.create_expense(session, user, request)
+    session.commit()
+    return CreateExpenseResponse(expense_id=expense.id)
+
+
+@app.get("/trip/{trip_id}/expenses")
+def get_trip_expenses(trip_id: int, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)) -> GetExpenses:
+    """
+        Retrieves the expenses of a trip along with the summary of who owes what to whom.
+
+        Both are loaded with a constant number of queries, however many expenses the trip has.
+
+        Args:
+        - trip_id (int): ID of the trip.
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        GetExpenses: The expenses of the trip and the BALANCES[payer][ower] summary.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or is not found in the database.
+        HTTPException(404): If the trip is not found.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if session.query(Trip.id).filter(Trip.id == trip_id).first() is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+    return load_expenses_with_summary_for_trip(session, trip_id)
+
+
+@app.post("/trip/{trip_id}/expenses/import")
+async def import_trip_expenses(trip_id: int, request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)) -> BulkExpenseImportResponse:
+    """
+        Imports many expenses of a trip at once, in a single transaction.
+
+        The body is either a JSON list of CreateExpenseRequest objects, or, with a `text/csv` content type, a CSV file of owed amounts (see `parse_expenses_csv`).
+        Every expense is validated first: if any of them is invalid, nothing is imported and the errors of each invalid row are returned.
+
+        Args:
+        - trip_id (int): ID of the trip the expenses belong to.
+        - request (Request): The raw request, whose body holds the expenses.
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        BulkExpenseImportResponse: The ids of the created expenses and the number of imported owed amounts.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or is not found in the database.
+        HTTPException(404): If the trip is not found.
+        HTTPException(422): If some rows are invalid, with the list of ExpenseImportRowError as detail.
+    """
+    body = await request.body()
+    is_csv = request.headers.get("content-type", "").startswith("text/csv")
+    # The parsing and the database work are blocking, keep them off the event loop
+    return await run_in_threadpool(import_expenses, session, credentials, trip_id, body, is_csv)
+
+
+def import_expenses(session, credentials: HTTPAuthorizationCredentials, trip_id: int, body: bytes, is_csv: bool) -> BulkExpenseImportResponse:
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if session.query(Trip.id).filter(Trip.id == trip_id).first() is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+    try:
+        text = body.decode("utf-8")
+        if is_csv:
+            expenses, errors = parse_expenses_csv(trip_id, text)
+        else:
+            expenses, errors = parse_expenses_json(trip_id, json.loads(text))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=[ExpenseImportRowError(row=0, errors=["Malformed body"]).dict()])
+    participant_ids = get_trip_participant_ids(session, trip_id)
+    for row, expense in expenses:
+        row_errors = validate_expense_request(expense, participant_ids)
+        if row_errors:
+            errors.append(ExpenseImportRowError(row=row, errors=row_errors))
+    if errors:
+        raise HTTPException(status_code=422, detail=[error.dict() for error in sorted(errors, key=lambda e: e.row)])
+
+    expense_ids = bulk_create_expenses(session, trip_id, [expense for _, expense in expenses])
+    return BulkExpenseImportResponse(
+        expense_ids=expense_ids,
+        imported_lines=sum(len(expense.details) for _, expense in expenses),
+    )
+
+
+@app.put("/trip/{trip_id}/expenses/{expense_id}")
+def update_trip_expense(trip_id: int, expense_id: int, request: CreateExpenseRequest, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)) -> CreateExpenseResponse:
+    """
+        Replaces the content of an expense of a trip.
+
+        Args:
+        - trip_id (int): ID of the trip the expense belongs to.
+        - expense_id (int): ID of the expense.
+        - request (CreateExpenseRequest): The new payer, description and owed amounts. Its `trip_id` must match the path.
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        CreateExpenseResponse: The id of the updated expense.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or not found, or if the expense is invalid.
+        HTTPException(404): If the expense is not found in this trip.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if request.trip_id != trip_id:
+        raise HTTPException(status_code=400, detail="Trip id mismatch")
+    errors = validate_expense_request(request, get_trip_participant_ids(session, trip_id))
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    response = update_expense(session, expense_id, request)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return response
+
+
+@app.delete("/trip/{trip_id}/expenses/{expense_id}")
+def delete_trip_expense(trip_id: int, expense_id: int, credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_db)) -> ActionSuccessResponse:
+    """
+        Deletes an expense of a trip.
+
+        Args:
+        - trip_id (int): ID of the trip the expense belongs to.
+        - expense_id (int): ID of the expense.
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        ActionSuccessResponse: An object containing a Boolean value indicating whether the action was successful or not.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or is not found in the database.
+        HTTPException(404): If the expense is not found in this trip.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+
+    if not delete_expense(session, trip_id, expense_id):
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return ActionSuccessResponse(success=True)
+
+
+@app.get("/trip/{trip_id}/settlement")
+def get_trip_settlement(trip_id: int, mode: str = "auto", credentials: HTTPAuthorizationCredentials = Depends(bearer_security), session=Depends(get_read_db)) -> SettlementOut:
+    """
+        Computes a short list of transfers settling all the expenses of a trip.
+
+        Args:
+        - trip_id (int): ID of the trip.
+        - mode (str): "greedy" (fast, at most one transfer less than the number of users), "exact" (minimal, small groups only) or "auto" (exact when the group is small enough).
+        - credentials (HTTPAuthorizationCredentials): HTTP authorization credentials
+        - session: SQLAlchemy session dependency
+
+        Returns:
+        SettlementOut: The mode used and the transfers, from the owing user to the owed one.
+
+        Raises:
+        HTTPException(400): If the user is not authorized or is not found in the database, or if the mode is not supported.
+        HTTPException(404): If the trip is not found.
+    """
+    if credentials.scheme.lower() != "bearer":
+        raise HTTPException(
+            status_code=400, detail="Incorrect authorization type")
+    # Look up the user associated with the token
+    user = UserManagement.get_current_user(session, credentials.credentials)
+    # Verify such user exists
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    if session.query(Trip.id).filter(Trip.id == trip_id).first() is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+    try:
+        return settle_balances(calculate_summary_for_trip_id(session, trip_id), mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@click.group(invoke_without_command=True)
 @click.option("--port", default=8000, help="Port to run the server on")
-def main(port):
-    uvicorn.run(app, port=port)
+@click.pass_context
+def main(ctx, port):
+    if ctx.invoked_subcommand is None:
+        uvicorn.run(app, port=port)
+
+
+@main.command("rebuild-balances")
+@click.option("--trip-id", type=int, default=None, help="Only process this trip")
+@click.option("--check", is_flag=True, help="Only report the inconsistent balances, do not rebuild them")
+def rebuild_balances(trip_id, check):
+    """
+        Checks or recomputes the trip_balances table from the raw expenses.
+    """
+    init_db()
+    session = create_session()
+    try:
+        mismatches = check_trip_balances(session, trip_id)
+        for mismatch_trip_id, creditor_id, debtor_id, stored, expected in mismatches:
+            click.echo(f"trip {mismatch_trip_id}: user {debtor_id} owes user {creditor_id} {expected}, stored {stored}")
+        click.echo(f"{len(mismatches)} inconsistent balances")
+        if not check:
+            click.echo(f"Rebuilt {rebuild_trip_balances(session, trip_id)} balances")
+    finally:
+        close_db(session)
+
+
+@main.command("rebuild-search-index")
+def rebuild_search_index():
+    """
+        Recomputes the trip_search full text index from the trips and their events.
+    """
+    init_db()
+    with engine.begin() as conn:
+        click.echo(f"Indexed {rebuild_trip_search(conn)} trips")
+
+
+@main.command("seed")
+@click.option("--users", default=100000, help="Users to create")
+@click.option("--trips", default=100000, help="Trips to create")
+@click.option("--max-trip-size", default=2000, help="Largest number of participants of a trip")
+@click.option("--expenses-per-participant", default=3.0, help="Average number of expenses per participant of a trip")
+@click.option("--seed", "rng_seed", default=42, help="Seed of the random generator")
+@click.option("--batch-size", default=50000, help="Rows written per batch")
+def seed_database_command(users, trips, max_trip_size, expenses_per_participant, rng_seed, batch_size):
+    """
+        Fills the database with a synthetic dataset (see core.seeding). Every user's password is "password".
+    """
+    init_db()
+    seed_and_report(
+        engine, echo=click.echo, users=users, trips=trips, max_trip_size=max_trip_size,
+        expenses_per_participant=expenses_per_participant, seed=rng_seed, batch_size=batch_size,
+    )
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
-from typing import List, Dict
+import csv
+import io
+from typing import Any, List, Dict, Optional, Set, Tuple
 from models.user_base import *
-from sqlalchemy import Column, Integer, String, ForeignKey
-from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, ForeignKey, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import aliased
+from pydantic import BaseModel, ValidationError
 
 class ExpenseMeta(Base):
     """
@@ -10,7 +14,7 @@ class ExpenseMeta(Base):
     """
     __tablename__ = "expenses_meta"
     id = Column(Integer, primary_key=True)
-    trip_id = Column(Integer, ForeignKey("trips.id"))
+    trip_id = Column(Integer, ForeignKey("trips.id"), index=True)
     paid_user_id = Column(Integer, ForeignKey("users.id"))
     description = Column(String)
 
@@ -24,9 +28,24 @@ class Expense(Base):
         at the moment the expense is created.
     """
     __tablename__ = "expenses"
+    id = Column(Integer, primary_key=True)
     owe_user_id = Column(Integer, ForeignKey("users.id"))
     amount = Column(Integer) # We are storing numbers multiplied by 100 (i.e. 100$ -> 10000, 100.23$ -> 10023)
-    expense_id = Column(Integer, ForeignKey("expenses_meta.id"))
+    expense_id = Column(Integer, ForeignKey("expenses_meta.id"), index=True)
+
+class TripBalance(Base):
+    """
+        This table / model materializes the summary of the expenses of a trip:
+        `amount` is the total `debtor` owes to `creditor` over all the expenses
+        of the trip. It is updated in the same transaction as every expense write
+        (see `apply_balance_deltas`), so reading a summary does not depend on the
+        number of expenses. `rebuild_trip_balances` recomputes it from the expenses.
+    """
+    __tablename__ = "trip_balances"
+    trip_id = Column(Integer, ForeignKey("trips.id"), primary_key=True)
+    creditor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    debtor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    amount = Column(Integer, nullable=False, default=0)
 
 class OweUserDetail(BaseModel):
     owe_user_id: int
@@ -47,7 +66,7 @@ class CreateExpenseResponse(BaseModel):
 
 class ExpenseDetails(BaseModel):
     expense_id: int
-    paid_user_name: int
+    paid_user_name: str
     total_paid: int
     details: List[OweUserDetailWithName]
 
@@ -55,6 +74,17 @@ class GetExpenses(BaseModel):
     expenses: List[ExpenseDetails]
     summary: Dict[str, Dict[str, int]]
 
+class ExpenseImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class BulkExpenseImportResponse(BaseModel):
+    expense_ids: List[int]
+    imported_lines: int
+
+# Lines sharing the same `ref` are the owed amounts of the same expense
+EXPENSES_CSV_COLUMNS = ["ref", "description", "paid_user_id", "owe_user_id", "amount"]
+
 def create_expenses(session, request: CreateExpenseRequest) -> CreateExpenseResponse:
     """
         This function creates an expense and adds its details to the database using the SQLAlchemy ORM.
@@ -75,28 +105,311 @@ def create_expenses(session, request: CreateExpenseRequest) -> CreateExpenseResp
         response = create_expenses(session, request)
         print(response.expense_id)
     """
-    meta = ExpenseMeta(trip_id=request.trip_id, paid_user_id=request.paid_user_id, description=request.description)
-    session.add(meta)
-    session.commit()
+    return CreateExpenseResponse(expense_id=bulk_create_expenses(session, request.trip_id, [request])[0])
+
+
+def bulk_create_expenses(session, trip_id: int, requests: List[CreateExpenseRequest]) -> List[int]:
+    """
+        Creates many expenses of a trip in a single transaction: `insert_expenses` followed by a
+        single commit.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The id of the trip the expenses belong to.
+        - requests: The expenses to be created.
+
+        Returns:
+        - The ids of the created expenses, in the order of the requests.
+    """
+    expense_ids = insert_expenses(session, trip_id, requests)
+    if expense_ids:
+        session.commit()
+    return expense_ids
 
-    created_meta = session.query(ExpenseMeta).filter(ExpenseMeta.trip_id == meta.trip_id).last()
 
+def insert_expenses(session, trip_id: int, requests: List[CreateExpenseRequest]) -> List[int]:
+    """
+        Writes many expenses of a trip in the current transaction, without committing it.
+
+        The first ExpenseMeta row is inserted on its own to obtain its id. That insert also takes
+        SQLite's write lock, which no other connection can take before our commit. The following ids
+        are therefore free and assigned explicitly, so the other ExpenseMeta rows and all the owed
+        amounts are written with one executemany INSERT each. The trip balances get one batched
+        upsert. The requests are expected to be validated already (see `validate_expense_request`).
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The id of the trip the expenses belong to.
+        - requests: The expenses to be created.
+
+        Returns:
+        - The ids of the created expenses, in the order of the requests.
+    """
+    if not requests:
+        return []
+    metas = [
+        {"trip_id": trip_id, "paid_user_id": request.paid_user_id, "description": request.description}
+        for request in requests
+    ]
+    first_id = session.execute(ExpenseMeta.__table__.insert(), metas[0]).inserted_primary_key[0]
+    expense_ids = list(range(first_id, first_id + len(requests)))
+    for expense_id, meta in zip(expense_ids[1:], metas[1:]):
+        meta["id"] = expense_id
+    if len(metas) > 1:
+        session.execute(ExpenseMeta.__table__.insert(), metas[1:])
+
+    lines = []
+    deltas: Dict[Tuple[int, int], int] = {}
+    for expense_id, request in zip(expense_ids, requests):
+        for detail in request.details:
+            lines.append({"expense_id": expense_id, "owe_user_id": detail.owe_user_id, "amount": detail.amount})
+            key = (request.paid_user_id, detail.owe_user_id)
+            deltas[key] = deltas.get(key, 0) + detail.amount
+    if lines:
+        session.execute(Expense.__table__.insert(), lines)
+    apply_balance_deltas(session, trip_id, deltas)
+
+    return expense_ids
+
+
+def update_expense(session, expense_id: int, request: CreateExpenseRequest) -> Optional[CreateExpenseResponse]:
+    """
+        Replaces the payer, description and owed amounts of an expense, and updates the trip balances accordingly.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - expense_id: The id of the expense to update.
+        - request: The new content of the expense. Its trip_id must be the one of the expense.
+
+        Returns:
+        - A CreateExpenseResponse object with the id of the expense, or None if the expense does not exist in this trip.
+    """
+    meta = session.query(ExpenseMeta).filter(ExpenseMeta.id == expense_id, ExpenseMeta.trip_id == request.trip_id).first()
+    if meta is None:
+        return None
+    old_lines = session.query(Expense).filter(Expense.expense_id == expense_id).all()
+    deltas = expense_balance_deltas(meta.paid_user_id, old_lines, sign=-1)
+    for creditor_and_debtor, amount in expense_balance_deltas(request.paid_user_id, request.details).items():
+        deltas[creditor_and_debtor] = deltas.get(creditor_and_debtor, 0) + amount
+
+    for line in old_lines:
+        session.delete(line)
+    meta.paid_user_id = request.paid_user_id
+    meta.description = request.description
     for detail in request.details:
-        session.add(Expense(
-            owe_user_id=detail.owe_user_id,
-            amount=detail.amount,
-            expense_id=created_meta.id,
-        ))
+        session.add(Expense(owe_user_id=detail.owe_user_id, amount=detail.amount, expense_id=meta.id))
+    apply_balance_deltas(session, meta.trip_id, deltas)
     session.commit()
 
-    return CreateExpenseResponse(expense_id=created_meta.id)
+    return CreateExpenseResponse(expense_id=meta.id)
+
+
+def delete_expense(session, trip_id: int, expense_id: int) -> bool:
+    """
+        Deletes an expense and its owed amounts, and removes them from the trip balances.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The id of the trip the expense belongs to.
+        - expense_id: The id of the expense to delete.
+
+        Returns:
+        - False if the expense does not exist in this trip, True otherwise.
+    """
+    meta = session.query(ExpenseMeta).filter(ExpenseMeta.id == expense_id, ExpenseMeta.trip_id == trip_id).first()
+    if meta is None:
+        return False
+    lines = session.query(Expense).filter(Expense.expense_id == expense_id).all()
+    apply_balance_deltas(session, trip_id, expense_balance_deltas(meta.paid_user_id, lines, sign=-1))
+    for line in lines:
+        session.delete(line)
+    session.delete(meta)
+    session.commit()
+    return True
+
+
+def delete_trip_expenses(session, trip_id: int):
+    """
+        Deletes all the expenses, owed amounts and balances of a trip, before the trip itself.
+        They reference the trip without ON DELETE CASCADE. The caller commits.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The id of the trip.
+    """
+    expense_ids = session.query(ExpenseMeta.id).filter(ExpenseMeta.trip_id == trip_id).scalar_subquery()
+    session.query(Expense).filter(Expense.expense_id.in_(expense_ids)).delete(synchronize_session=False)
+    session.query(ExpenseMeta).filter(ExpenseMeta.trip_id == trip_id).delete(synchronize_session=False)
+    session.query(TripBalance).filter(TripBalance.trip_id == trip_id).delete(synchronize_session=False)
+
+
+def expense_balance_deltas(paid_user_id: int, details, sign: int = 1) -> Dict[Tuple[int, int], int]:
+    """
+        Returns the change an expense brings to the trip balances, as {(creditor id, debtor id): amount}.
+
+        Args:
+        - paid_user_id: The id of the paying user.
+        - details: The owed amounts of the expense (OweUserDetail or Expense objects).
+        - sign: -1 to compute the change brought by removing the expense.
+    """
+    deltas: Dict[Tuple[int, int], int] = {}
+    for detail in details:
+        key = (paid_user_id, detail.owe_user_id)
+        deltas[key] = deltas.get(key, 0) + sign * detail.amount
+    return deltas
+
+
+def apply_balance_deltas(session, trip_id: int, deltas: Dict[Tuple[int, int], int]):
+    """
+        Adds amounts to the `trip_balances` rows of a trip with a single batched upsert.
+        The caller commits, so the balances change in the same transaction as the expenses.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The id of the trip.
+        - deltas: The amounts to add, as returned by `expense_balance_deltas`.
+    """
+    rows = [
+        {"trip_id": trip_id, "creditor_id": creditor_id, "debtor_id": debtor_id, "amount": amount}
+        for (creditor_id, debtor_id), amount in deltas.items()
+        if amount != 0
+    ]
+    if not rows:
+        return
+    statement = insert(TripBalance)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TripBalance.trip_id, TripBalance.creditor_id, TripBalance.debtor_id],
+            set_={"amount": TripBalance.amount + statement.excluded.amount},
+        ),
+        rows,
+    )
+    session.query(TripBalance).filter(TripBalance.trip_id == trip_id, TripBalance.amount == 0).delete()
+
+
+def validate_expense_request(request: CreateExpenseRequest, participant_ids: Set[int]) -> List[str]:
+    """
+        Checks an expense against the current participants of its trip.
+
+        Args:
+        - request: The expense to be created.
+        - participant_ids: The ids of the users currently taking part in the trip.
+
+        Returns:
+        - A list of error messages, empty if the expense is valid.
+    """
+    errors = []
+    if request.paid_user_id not in participant_ids:
+        errors.append(f"Paying user {request.paid_user_id} is not a participant of the trip")
+    if not request.details:
+        errors.append("An expense needs at least one owed amount")
+    for detail in request.details:
+        if detail.owe_user_id not in participant_ids:
+            errors.append(f"Owing user {detail.owe_user_id} is not a participant of the trip")
+        if detail.amount <= 0:
+            errors.append(f"Owed amount of user {detail.owe_user_id} must be positive")
+    return errors
+
+
+def parse_expenses_json(trip_id: int, items: Any) -> Tuple[List[Tuple[int, CreateExpenseRequest]], List[ExpenseImportRowError]]:
+    """
+        Parses a JSON list of CreateExpenseRequest objects for a bulk import.
+
+        Well-typed items are built with `construct()`, skipping pydantic validation. The
+        others go through regular validation, which coerces or reports them.
+
+        Args:
+        - trip_id: The id of the trip the expenses are imported into. Items must not name another trip.
+        - items: The decoded JSON body.
+
+        Returns:
+        - The (row, expense) pairs that could be parsed and the errors of the others, rows being indexes in the list.
+    """
+    if not isinstance(items, list):
+        return [], [ExpenseImportRowError(row=0, errors=["Expected a JSON list of expenses"])]
+    expenses, errors = [], []
+    for row, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(ExpenseImportRowError(row=row, errors=["Expected an object"]))
+            continue
+        if item.get("trip_id", trip_id) != trip_id:
+            errors.append(ExpenseImportRowError(row=row, errors=["Trip id mismatch"]))
+            continue
+        details = item.get("details")
+        if (
+            type(item.get("paid_user_id")) is int and type(item.get("description")) is str and type(details) is list
+            and all(type(d) is dict and type(d.get("owe_user_id")) is int and type(d.get("amount")) is int for d in details)
+        ):
+            expenses.append((row, CreateExpenseRequest.construct(
+                trip_id=trip_id,
+                description=item["description"],
+                paid_user_id=item["paid_user_id"],
+                details=[OweUserDetail.construct(owe_user_id=d["owe_user_id"], amount=d["amount"]) for d in details],
+            )))
+            continue
+        try:
+            expenses.append((row, CreateExpenseRequest.parse_obj({**item, "trip_id": trip_id})))
+        except ValidationError as e:
+            errors.append(ExpenseImportRowError(
+                row=row,
+                errors=[f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()],
+            ))
+    return expenses, errors
+
+
+def parse_expenses_csv(trip_id: int, text: str) -> Tuple[List[Tuple[int, CreateExpenseRequest]], List[ExpenseImportRowError]]:
+    """
+        Parses a CSV file of expense lines for a bulk import.
+
+        The file starts with a header naming the EXPENSES_CSV_COLUMNS, in any order. Each line is
+        one owed amount. Lines sharing the same `ref` belong to the same expense and must agree
+        on its description and paying user.
+
+        Args:
+        - trip_id: The id of the trip the expenses are imported into.
+        - text: The content of the file.
+
+        Returns:
+        - The (row, expense) pairs that could be parsed and the errors of the others. Rows are
+          1-based line numbers, an expense being reported at the line of its first owed amount.
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, [])
+    missing = [column for column in EXPENSES_CSV_COLUMNS if column not in header]
+    if missing:
+        return [], [ExpenseImportRowError(row=1, errors=[f"Missing columns: {', '.join(missing)}"])]
+    ref_i, description_i, paid_i, owe_i, amount_i = (header.index(column) for column in EXPENSES_CSV_COLUMNS)
+
+    expenses: Dict[str, Tuple[int, CreateExpenseRequest]] = {}
+    errors = []
+    for row, line in enumerate(reader, start=2):
+        if not line:
+            continue
+        try:
+            ref, description = line[ref_i], line[description_i]
+            paid_user_id, owe_user_id, amount = int(line[paid_i]), int(line[owe_i]), int(line[amount_i])
+        except (IndexError, ValueError):
+            errors.append(ExpenseImportRowError(row=row, errors=["Expected integer paid_user_id, owe_user_id and amount"]))
+            continue
+        detail = OweUserDetail.construct(owe_user_id=owe_user_id, amount=amount)
+        if ref not in expenses:
+            expenses[ref] = (row, CreateExpenseRequest.construct(
+                trip_id=trip_id, description=description, paid_user_id=paid_user_id, details=[detail],
+            ))
+            continue
+        request = expenses[ref][1]
+        if request.description != description or request.paid_user_id != paid_user_id:
+            errors.append(ExpenseImportRowError(row=row, errors=[f"Description or paying user differ from the other lines of {ref}"]))
+            continue
+        request.details.append(detail)
+    return list(expenses.values()), errors
 
 
 def convert_expense(session, e: ExpenseMeta) -> ExpenseDetails:
     """
         Convert ExpenseMeta object into ExpenseDetails object.
 
-        This function retrieves the relevant data from the ExpenseMeta object and queries the database to get the corresponding Expense and User objects. The retrieved data is then used to create an ExpenseDetails object that represents the expense in a user-friendly way.
+        This function queries the name of the paying user and the owed amounts (joined with the names of the owing users) of the expense. The retrieved data is then used to create an ExpenseDetails object that represents the expense in a user-friendly way.
 
         Args:
         - session: A SQLAlchemy session object that connects to a database.
@@ -112,37 +425,57 @@ def convert_expense(session, e: ExpenseMeta) -> ExpenseDetails:
         expense_meta = session.query(ExpenseMeta).first()
         expense_details = convert_expense(session, expense_meta)
     """
-    relevant_expenses: List[Expense] = session.query(Expense).filter(Expense.expense_id == e.id).all()
-    paid_user: User = session.query(User).filter(User.id == e.paid_user_id).first()
-    owe_users: List[User] = session.query(User).join(Expense).filter(Expense.id == e.id and User.id == Expense.owe_user_id).all()
-    user_id_to_name = {}
-    for user_detail in owe_users:
-        user_id_to_name[user_detail.id] = user_detail.username
-    owed_amounts = [exp.amount for exp in relevant_expenses]
-    return ExpenseDetails(
-        expense_id=e.id,
-        paid_user_name=paid_user.username,
-        total_paid=sum(owed_amounts),
-        details=[
-            OweUserDetailWithName(
-                owe_user_name=user_id_to_name[exp.owe_user_id],
-                amount=exp.amount,
-            ) for exp in relevant_expenses
-        ]
+    paid_user_name = session.query(User.username).filter(User.id == e.paid_user_id).scalar()
+    lines = (
+        session.query(Expense.expense_id, Expense.amount, User.username)
+        .join(User, User.id == Expense.owe_user_id)
+        .filter(Expense.expense_id == e.id)
+        .order_by(Expense.id)
+        .all()
     )
+    return build_expense_details([(e.id, paid_user_name)], lines)[0]
+
+
+def build_expense_details(payers: List[Tuple[int, str]], lines: List[Tuple[int, int, str]]) -> List[ExpenseDetails]:
+    """
+        Assembles ExpenseDetails objects from pre-loaded rows, without querying the database.
+
+        Args:
+        - payers: (expense id, paying user name) pairs, in the order of the returned expenses.
+        - lines: (expense id, amount, owing user name) rows of the owed amounts of these expenses.
+
+        Returns:
+        - A list of ExpenseDetails objects, one per payer row.
+    """
+    details_by_expense: Dict[int, List[OweUserDetailWithName]] = {}
+    for expense_id, amount, owe_user_name in lines:
+        details_by_expense.setdefault(expense_id, []).append(
+            OweUserDetailWithName(owe_user_name=owe_user_name, amount=amount)
+        )
+    expenses = []
+    for expense_id, paid_user_name in payers:
+        details = details_by_expense.get(expense_id, [])
+        expenses.append(ExpenseDetails(
+            expense_id=expense_id,
+            paid_user_name=paid_user_name,
+            total_paid=sum(detail.amount for detail in details),
+            details=details,
+        ))
+    return expenses
+
 
 def load_expenses_for_trip_id(session, trip_id: int) -> List[ExpenseDetails]:
     """
         Load expenses for a given trip_id and return a list of ExpenseDetails objects.
 
-        This function queries the database to retrieve all ExpenseMeta objects that are associated with the given trip_id. It then converts each ExpenseMeta object into an ExpenseDetails object by calling the convert_expense() function. The resulting ExpenseDetails objects are then returned as a list.
+        This function runs two queries no matter how many expenses the trip has: one for the ExpenseMeta rows of the trip joined with their paying user, and one for all their Expense rows joined with their owing user. The ExpenseDetails objects are then assembled in memory.
 
         Args:
         - session: A SQLAlchemy session object that connects to a database.
         - trip_id: An integer representing the trip_id for which expenses should be retrieved.
 
         Returns:
-        - A list of ExpenseDetails objects representing the expenses for the given trip_id.
+        - A list of ExpenseDetails objects representing the expenses for the given trip_id, ordered by id.
 
         Raises:
         SQLAlchemyError: If an error occurs while querying the database.
@@ -152,16 +485,28 @@ def load_expenses_for_trip_id(session, trip_id: int) -> List[ExpenseDetails]:
         expenses = load_expenses_for_trip_id(session, trip_id)
         print(expenses)
     """
-    expenses_meta = session.query(ExpenseMeta).filter(ExpenseMeta.trip_id == trip_id).all()
-    return [
-        convert_expense(exp_meta) for exp_meta in expenses_meta
-    ]
+    payers = (
+        session.query(ExpenseMeta.id, User.username)
+        .join(User, User.id == ExpenseMeta.paid_user_id)
+        .filter(ExpenseMeta.trip_id == trip_id)
+        .order_by(ExpenseMeta.id)
+        .all()
+    )
+    lines = (
+        session.query(Expense.expense_id, Expense.amount, User.username)
+        .join(ExpenseMeta, ExpenseMeta.id == Expense.expense_id)
+        .join(User, User.id == Expense.owe_user_id)
+        .filter(ExpenseMeta.trip_id == trip_id)
+        .order_by(Expense.expense_id, Expense.id)
+        .all()
+    )
+    return build_expense_details(payers, lines)
 
 def calculate_summary_for_trip_id(session, trip_id: int) -> Dict[str, Dict[str, int]]:
     """
         Calculate the summary for a given trip_id and return it as a dictionary.
 
-        This function calculates a summary of the expenses for the given trip_id by generating a matrix BALANCES[UserNameA][UserNameB], where each cell UserNameA, UserNameB represents how much UserNameB owes to the user UserNameA. The resulting balances are returned as a dictionary.
+        This function returns a matrix BALANCES[UserNameA][UserNameB], where each cell UserNameA, UserNameB represents how much UserNameB owes to the user UserNameA. It is read from the `trip_balances` table, which is kept up to date on every expense write, so the cost depends on the number of participants and not on the number of expenses.
 
         Args:
         - session: A SQLAlchemy session object that connects to a database.
@@ -177,18 +522,91 @@ def calculate_summary_for_trip_id(session, trip_id: int) -> Dict[str, Dict[str,
         trip_id = 1
         summary = calculate_summary_for_trip_id(session, trip_id)
     """
-    expenses = load_expenses_for_trip_id(session, trip_id)
+    creditor = aliased(User)
+    debtor = aliased(User)
+    rows = (
+        session.query(creditor.username, debtor.username, TripBalance.amount)
+        .select_from(TripBalance)
+        .join(creditor, creditor.id == TripBalance.creditor_id)
+        .join(debtor, debtor.id == TripBalance.debtor_id)
+        .filter(TripBalance.trip_id == trip_id, TripBalance.amount != 0)
+        .all()
+    )
     balances = {}
-    for expense in expenses:
-        paid_name = expense.paid_user_name
-        if paid_name not in balances:
-            balances[paid_name] = {}
-        for detail in expense.details:
-            if detail.owe_user_name not in balances[paid_name]:
-                balances[paid_name][detail.owe_user_name] = 0
-            balances[paid_name][detail.owe_user_name] += detail.amount
+    for paid_name, owe_name, amount in rows:
+        balances.setdefault(paid_name, {})[owe_name] = amount
     return balances
 
+def aggregate_balances_from_expenses(session, trip_id: Optional[int] = None) -> Dict[Tuple[int, int, int], int]:
+    """
+        Recomputes the trip balances from the raw expenses with a single GROUP BY query.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The trip to aggregate, or None for every trip.
+
+        Returns:
+        - A dictionary mapping (trip id, creditor id, debtor id) to the owed amount.
+    """
+    query = (
+        session.query(ExpenseMeta.trip_id, ExpenseMeta.paid_user_id, Expense.owe_user_id, func.sum(Expense.amount))
+        .join(Expense, Expense.expense_id == ExpenseMeta.id)
+        .group_by(ExpenseMeta.trip_id, ExpenseMeta.paid_user_id, Expense.owe_user_id)
+    )
+    if trip_id is not None:
+        query = query.filter(ExpenseMeta.trip_id == trip_id)
+    return {
+        (row_trip_id, creditor_id, debtor_id): amount
+        for row_trip_id, creditor_id, debtor_id, amount in query
+        if amount
+    }
+
+def check_trip_balances(session, trip_id: Optional[int] = None) -> List[Tuple[int, int, int, int, int]]:
+    """
+        Compares the `trip_balances` table with the balances recomputed from the raw expenses.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The trip to check, or None for every trip.
+
+        Returns:
+        - The inconsistent balances as (trip id, creditor id, debtor id, stored amount, expected amount) tuples.
+    """
+    query = session.query(TripBalance).filter(TripBalance.amount != 0)
+    if trip_id is not None:
+        query = query.filter(TripBalance.trip_id == trip_id)
+    stored = {(b.trip_id, b.creditor_id, b.debtor_id): b.amount for b in query}
+    expected = aggregate_balances_from_expenses(session, trip_id)
+    return sorted(
+        key + (stored.get(key, 0), expected.get(key, 0))
+        for key in stored.keys() | expected.keys()
+        if stored.get(key, 0) != expected.get(key, 0)
+    )
+
+def rebuild_trip_balances(session, trip_id: Optional[int] = None) -> int:
+    """
+        Recomputes the `trip_balances` rows from the raw expenses and commits.
+
+        Args:
+        - session: A SQLAlchemy session object that connects to a database.
+        - trip_id: The trip to rebuild, or None for every trip.
+
+        Returns:
+        - The number of balance rows written.
+    """
+    query = session.query(TripBalance)
+    if trip_id is not None:
+        query = query.filter(TripBalance.trip_id == trip_id)
+    query.delete()
+    rows = [
+        {"trip_id": row_trip_id, "creditor_id": creditor_id, "debtor_id": debtor_id, "amount": amount}
+        for (row_trip_id, creditor_id, debtor_id), amount in aggregate_balances_from_expenses(session, trip_id).items()
+    ]
+    if rows:
+        session.execute(TripBalance.__table__.insert(), rows)
+    session.commit()
+    return len(rows)
+
 def load_expenses_with_summary_for_trip(session, trip_id: int):
     """
         Loads expenses and their summary for a given trip_id and returns it as a GetExpenses object.
@@ -198,7 +616,7 @@ def load_expenses_with_summary_for_trip(session, trip_id: int):
         - trip_id: An integer representing the trip_id for which the expenses should be loaded.
 
         Returns:
-        - A GetExpenses object containing a list of expenses loaded by calling load_expenses_for_trip_id and a summary of expenses loaded by calling calculate_summary_for_trip_id.
+        - A GetExpenses object containing a list of expenses loaded by calling load_expenses_for_trip_id and a summary of expenses loaded by calling calculate_summary_for_trip_id (three queries in total).
 
         Raises:
         - SQLAlchemyError: If an error occurs while querying the database.
@@ -210,4 +628,4 @@ def load_expenses_with_summary_for_trip(session, trip_id: int):
     return GetExpenses(
         expenses=load_expenses_for_trip_id(session, trip_id),
         summary=calculate_summary_for_trip_id(session, trip_id),
-    )
\ No newline at end of file
+    )
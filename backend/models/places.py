@@ -0,0 +1,112 @@
+"""
+    Destination autocompletion from the places already used by the trips.
+
+    `place_index` holds every origin and destination of the `trips` table with the number of
+    trips using it (see `core.prefix_index`). It is loaded from the database on first use, then
+    kept up to date by session hooks: the places of the trips created, deleted or changed by a
+    flush are collected, and applied to the index once the transaction commits.
+
+    The index lives in the memory of each process: trips written by other processes, or with
+    Core statements (e.g. by the `seed` command), only show up after a restart or a
+    `reload_places` call.
+"""
+from itertools import chain
+from typing import List
+
+from pydantic import BaseModel
+from sqlalchemy import event, func, inspect, select, union_all
+from sqlalchemy.orm import Session
+
+from core.prefix_index import PrefixIndex
+from models.trips import Trip
+
+place_index = PrefixIndex()
+_loaded = False
+
+
+class PlaceSuggestion(BaseModel):
+    name: str
+    count: int
+
+
+class PlaceSuggestions(BaseModel):
+    suggestions: List[PlaceSuggestion]
+
+
+def reload_places(session) -> int:
+    """
+        Loads `place_index` from the origins and destinations of all the trips. Returns the
+        number of distinct places.
+    """
+    global _loaded
+    places = union_all(
+        select(Trip.origin.label("place")),
+        select(Trip.destination.label("place")),
+    ).subquery()
+    rows = session.execute(
+        select(places.c.place, func.count()).where(places.c.place.isnot(None)).group_by(places.c.place)
+    )
+    place_index.load(rows)
+    _loaded = True
+    return len(place_index)
+
+
+def reset_places():
+    """
+        Empties `place_index`, which is reloaded on the next suggestion.
+    """
+    global _loaded
+    place_index.clear()
+    _loaded = False
+
+
+def suggest_places(session, prefix: str, limit: int) -> List[PlaceSuggestion]:
+    if not _loaded:
+        reload_places(session)
+    return [PlaceSuggestion.construct(name=name, count=count) for name, count in place_index.suggest(prefix, limit)]
+
+
+def _record_place_changes(session, changes):
+    changes = [(place, delta) for place, delta in changes if place]
+    if changes:
+        session.info.setdefault("place_changes", []).extend(changes)
+
+
+@event.listens_for(Session, "before_flush")
+def collect_deleted_places(session, flush_context, instances):
+    # Before the flush, so that the places of an expired trip can still be loaded
+    _record_place_changes(session, [
+        (getattr(obj, attribute), -1)
+        for obj in session.deleted if isinstance(obj, Trip)
+        for attribute in ("origin", "destination")
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def collect_place_changes(session, flush_context):
+    changes = []
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Trip):
+            continue
+        state = inspect(obj)
+        for attribute in ("origin", "destination"):
+            history = state.attrs[attribute].history
+            changes.extend((place, 1) for place in history.added or ())
+            changes.extend((place, -1) for place in history.deleted or ())
+    _record_place_changes(session, changes)
+
+
+@event.listens_for(Session, "after_commit")
+def apply_place_changes(session):
+    changes = session.info.pop("place_changes", None)
+    if changes and _loaded:
+        for place, delta in changes:
+            if delta > 0:
+                place_index.add(place, delta)
+            else:
+                place_index.remove(place, -delta)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_place_changes(session):
+    session.info.pop("place_changes", None)
@@ -0,0 +1,184 @@
+"""
+    Full text search of the trips, backed by the SQLite FTS5 table `trip_search`.
+
+    The table holds one document per trip, whose rowid is the trip id, with the trip's origin,
+    destination and the descriptions of all its events. SQL triggers on `trips` and `trip_event`
+    keep it in sync with every write, including Core bulk inserts that bypass the ORM. The table
+    and triggers are created by a migration (see `core.migrations`), `rebuild_trip_search`
+    recomputes the whole index (see the `rebuild-search-index` command of `main.py`).
+
+    Results are ranked by FTS5 with bm25, origin and destination matches weighing more than event
+    matches. The first page of a search ranks all its matches in one statement and keeps the
+    `settings.search_max_candidates` best as a snapshot, which the next pages are sliced from:
+    their cursor holds the snapshot key and the (rank, trip id) of the last trip served, so pages
+    neither skip nor repeat trips while the index changes.
+"""
+import re
+import uuid
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from core.cache import TTLCache
+from core.config import settings
+from models.trips import decode_cursor, encode_cursor
+
+# bm25 weights of the origin, destination and events columns
+SEARCH_WEIGHTS = (4.0, 4.0, 1.0)
+# Query terms beyond this are ignored
+MAX_QUERY_TERMS = 8
+# Shorter last words are matched as whole words: a one letter prefix matches most of the trips.
+# Prefixes of 2 and 3 characters are served by the prefix indexes of the table.
+MIN_PREFIX_LENGTH = 2
+
+# Snapshot key -> (FTS5 query, ranked trip ids) of the searches being paged through
+search_snapshots = TTLCache(maxsize=settings.search_snapshot_cache_size, ttl=settings.search_snapshot_ttl)
+
+CREATE_TRIP_SEARCH = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS trip_search USING fts5("
+    "origin, destination, events, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+_EVENTS_OF_TRIP = "(SELECT group_concat(description, ' ') FROM trip_event WHERE trip_id = {trip_id})"
+
+TRIP_SEARCH_TRIGGERS = {
+    "trip_search_trip_insert": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_trip_insert AFTER INSERT ON trips BEGIN "
+        "INSERT INTO trip_search (rowid, origin, destination, events) "
+        f"VALUES (new.id, new.origin, new.destination, {_EVENTS_OF_TRIP.format(trip_id='new.id')}); "
+        "END"
+    ),
+    "trip_search_trip_update": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_trip_update AFTER UPDATE OF origin, destination ON trips BEGIN "
+        "UPDATE trip_search SET origin = new.origin, destination = new.destination WHERE rowid = new.id; "
+        "END"
+    ),
+    "trip_search_trip_delete": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_trip_delete AFTER DELETE ON trips BEGIN "
+        "DELETE FROM trip_search WHERE rowid = old.id; "
+        "END"
+    ),
+    "trip_search_event_insert": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_event_insert AFTER INSERT ON trip_event BEGIN "
+        f"UPDATE trip_search SET events = {_EVENTS_OF_TRIP.format(trip_id='new.trip_id')} WHERE rowid = new.trip_id; "
+        "END"
+    ),
+    "trip_search_event_update": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_event_update AFTER UPDATE OF description, trip_id ON trip_event BEGIN "
+        f"UPDATE trip_search SET events = {_EVENTS_OF_TRIP.format(trip_id='old.trip_id')} WHERE rowid = old.trip_id; "
+        f"UPDATE trip_search SET events = {_EVENTS_OF_TRIP.format(trip_id='new.trip_id')} WHERE rowid = new.trip_id; "
+        "END"
+    ),
+    "trip_search_event_delete": (
+        "CREATE TRIGGER IF NOT EXISTS trip_search_event_delete AFTER DELETE ON trip_event BEGIN "
+        f"UPDATE trip_search SET events = {_EVENTS_OF_TRIP.format(trip_id='old.trip_id')} WHERE rowid = old.trip_id; "
+        "END"
+    ),
+}
+
+
+def create_trip_search(conn):
+    """
+        Creates the `trip_search` table and its triggers, and fills it from the existing trips.
+    """
+    conn.exec_driver_sql(CREATE_TRIP_SEARCH)
+    create_trip_search_triggers(conn)
+    rebuild_trip_search(conn)
+
+
+def create_trip_search_triggers(conn):
+    for statement in TRIP_SEARCH_TRIGGERS.values():
+        conn.exec_driver_sql(statement)
+
+
+def drop_trip_search_triggers(conn):
+    """
+        Stops the index maintenance, e.g. for a bulk load followed by `rebuild_trip_search`.
+    """
+    for name in TRIP_SEARCH_TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_trip_search(conn) -> int:
+    """
+        Recomputes the whole `trip_search` index from the trips and events and merges its
+        segments. Returns the number of indexed trips.
+    """
+    conn.exec_driver_sql("DELETE FROM trip_search")
+    conn.exec_driver_sql(
+        "INSERT INTO trip_search (rowid, origin, destination, events) "
+        "SELECT t.id, t.origin, t.destination, e.events FROM trips t "
+        "LEFT JOIN (SELECT trip_id, group_concat(description, ' ') AS events FROM trip_event GROUP BY trip_id) e "
+        "ON e.trip_id = t.id"
+    )
+    conn.exec_driver_sql("INSERT INTO trip_search (trip_search) VALUES ('optimize')")
+    return conn.exec_driver_sql("SELECT COUNT(*) FROM trip_search").scalar()
+
+
+def fts_query(q: str) -> Optional[str]:
+    """
+        Turns free text into an FTS5 query matching the trips containing every word, the last
+        one as a prefix (of at least MIN_PREFIX_LENGTH characters) so that results show up while
+        typing. The words are quoted, the FTS5 syntax of the input is never interpreted.
+        Returns None when `q` has no word.
+    """
+    words = re.findall(r"\w+", q)[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def ranked_trip_ids(session, match: str) -> List[int]:
+    """
+        Returns the ids of the `settings.search_max_candidates` best matches of the FTS5 query
+        `match`, best first. FTS5 scores every match, the cap only truncates the ranking.
+    """
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    return session.execute(text(
+        "SELECT rowid FROM trip_search WHERE trip_search MATCH :match AND rank MATCH :rank "
+        "ORDER BY rank LIMIT :candidates"
+    ), {"match": match, "rank": f"bm25({weights})", "candidates": settings.search_max_candidates}).scalars().all()
+
+
+def search_trip_ids(session, q: str, limit: int, after: Optional[str] = None) -> Tuple[List[int], Optional[str]]:
+    """
+        Returns one page of the ids of the trips matching `q`, best match first, and the cursor
+        of the next page (None on the last page).
+
+        Only the `settings.search_max_candidates` best matches are paged through. A snapshot
+        evicted from `search_snapshots`, or ranked by another worker, is ranked again and the
+        search resumes after the last trip served, or at its rank if the trip fell out.
+
+        Raises:
+        ValueError: If `after` is not a valid cursor.
+    """
+    match = fts_query(q)
+    if match is None:
+        return [], None
+    if after is None:
+        key, start = uuid.uuid4().hex, 0
+        ranking = ranked_trip_ids(session, match)
+        search_snapshots.set(key, (match, ranking))
+    else:
+        values = decode_cursor(after)
+        if (len(values) != 3 or not isinstance(values[0], str) or not isinstance(values[1], int)
+                or values[1] < 0 or not isinstance(values[2], int)):
+            raise ValueError("Invalid cursor")
+        key, rank, trip_id = values
+        snapshot = search_snapshots.get(key)
+        if snapshot is not None:
+            if snapshot[0] != match or rank >= len(snapshot[1]) or snapshot[1][rank] != trip_id:
+                raise ValueError("Invalid cursor")
+            ranking = snapshot[1]
+            start = rank + 1
+        else:
+            ranking = ranked_trip_ids(session, match)
+            search_snapshots.set(key, (match, ranking))
+            start = ranking.index(trip_id) + 1 if trip_id in ranking else rank + 1
+    page = ranking[start:start + limit]
+    if start + limit >= len(ranking):
+        return page, None
+    return page, encode_cursor(key, start + limit - 1, page[-1])
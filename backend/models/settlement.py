@@ -0,0 +1,145 @@
+import heapq
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+# The exact solver explores every subset of the users with a non zero balance
+EXACT_SETTLEMENT_MAX_USERS = 12
+
+
+class Transfer(BaseModel):
+    from_user: str
+    to_user: str
+    amount: int
+
+
+class SettlementOut(BaseModel):
+    mode: str
+    transfers: List[Transfer]
+
+
+def net_balances(summary: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """
+        Nets a BALANCES[payer][ower] matrix (see `calculate_summary_for_trip_id`) per user.
+
+        Args:
+        - summary: A dictionary where summary[A][B] is the amount B owes to A.
+
+        Returns:
+        - A dictionary mapping each user with a non zero balance to it. Positive balances are
+          owed to the user (creditors), negative ones are owed by the user (debtors). They sum to 0.
+    """
+    net: Dict[str, int] = {}
+    for paid_name, owed in summary.items():
+        for owe_name, amount in owed.items():
+            net[paid_name] = net.get(paid_name, 0) + amount
+            net[owe_name] = net.get(owe_name, 0) - amount
+    return {name: balance for name, balance in net.items() if balance != 0}
+
+
+def settle_greedy(net: Dict[str, int]) -> List[Transfer]:
+    """
+        Settles net balances by repeatedly paying the largest creditor from the largest debtor.
+
+        Each step settles at least one user, so at most n - 1 transfers are produced for n users,
+        in O(n log n) time with two heaps.
+
+        Args:
+        - net: The net balance of each user, as returned by `net_balances`.
+
+        Returns:
+        - A list of transfers settling every balance.
+    """
+    creditors = [(-balance, name) for name, balance in net.items() if balance > 0]
+    debtors = [(balance, name) for name, balance in net.items() if balance < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append(Transfer(from_user=debtor, to_user=creditor, amount=amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+
+def settle_exact(net: Dict[str, int]) -> List[Transfer]:
+    """
+        Settles net balances with the minimum possible number of transfers.
+
+        A group of k users whose balances sum to 0 can always be settled with k - 1 transfers,
+        so the minimum is n minus the largest number of disjoint zero-sum groups the users can be
+        split into. That number is found with a dynamic program over all the subsets of users,
+        which is exponential: only use it for at most EXACT_SETTLEMENT_MAX_USERS users.
+
+        Args:
+        - net: The net balance of each user, as returned by `net_balances`.
+
+        Returns:
+        - A minimal list of transfers settling every balance.
+
+        Raises:
+        ValueError: If there are more than EXACT_SETTLEMENT_MAX_USERS users with a non zero balance.
+    """
+    names = sorted(name for name, balance in net.items() if balance != 0)
+    if len(names) > EXACT_SETTLEMENT_MAX_USERS:
+        raise ValueError(f"Exact settlement supports at most {EXACT_SETTLEMENT_MAX_USERS} users")
+    size = 1 << len(names)
+    sums = [0] * size
+    for mask in range(1, size):
+        lowest = mask & -mask
+        sums[mask] = sums[mask ^ lowest] + net[names[lowest.bit_length() - 1]]
+    # groups[mask]: the largest number of disjoint zero-sum groups the users of mask split into
+    groups = [0] * size
+    for mask in range(1, size):
+        best = 0
+        remaining = mask
+        while remaining:
+            lowest = remaining & -remaining
+            best = max(best, groups[mask ^ lowest])
+            remaining ^= lowest
+        groups[mask] = best + (1 if sums[mask] == 0 else 0)
+
+    transfers = []
+    mask = size - 1
+    while mask:
+        # Peel off a zero-sum group that keeps the rest optimal and settle it greedily
+        group = mask
+        submask = (mask - 1) & mask
+        while submask:
+            if sums[submask] == 0 and groups[mask ^ submask] == groups[mask] - 1:
+                group = submask
+            submask = (submask - 1) & mask
+        transfers.extend(settle_greedy({
+            names[i]: net[names[i]] for i in range(len(names)) if group >> i & 1
+        }))
+        mask ^= group
+    return transfers
+
+
+def settle_balances(summary: Dict[str, Dict[str, int]], mode: str = "auto") -> SettlementOut:
+    """
+        Computes the transfers that settle a trip.
+
+        Args:
+        - summary: The BALANCES[payer][ower] matrix of the trip.
+        - mode: "exact", "greedy", or "auto" to use the exact solver when the group is small enough.
+
+        Returns:
+        - A SettlementOut object with the mode used and the transfers.
+
+        Raises:
+        ValueError: If the mode is unknown, or "exact" for too large a group.
+    """
+    net = net_balances(summary)
+    if mode == "auto":
+        mode = "exact" if len(net) <= EXACT_SETTLEMENT_MAX_USERS else "greedy"
+    if mode == "exact":
+        return SettlementOut(mode=mode, transfers=settle_exact(net))
+    if mode == "greedy":
+        return SettlementOut(mode=mode, transfers=settle_greedy(net))
+    raise ValueError(f"Unknown settlement mode {mode}")
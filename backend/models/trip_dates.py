@@ -0,0 +1,173 @@
+"""
+    Trips overlapping a date window, i.e. starting before its end and ending after its start,
+    paginated in chronological order: by start date, end date and id.
+
+    In the trips table, `start_date <= end AND end_date >= start` alone reads the index of
+    `(start_date, end_date)` from its first entry up to `end`: most of the table for a recent
+    window. A trip overlapping the window cannot start more than the longest trip duration before
+    it though, so the range read is bounded by `start - longest duration`. The longest duration is
+    a single seek in the `trip_duration` expression index. The index also holds the trips in the
+    order of the pages, so a page reads the index from its cursor until it holds `limit` trips,
+    whatever the width of the window and the depth of the page.
+
+    With `settings.trip_interval_index`, the windows are served from `trip_intervals` instead, an
+    in-memory `IntervalIndex` of all the trips, which caches the results of the hottest windows.
+    It is loaded on first use, then kept up to date like `models.places.place_index`: by session
+    hooks, applying the dates of the trips written by this process once their transaction commits.
+    Trips written by other processes, or with Core statements, only show up after a restart or a
+    `reload_trip_intervals` call.
+"""
+import math
+from bisect import bisect_right
+from datetime import date, timedelta
+from itertools import chain
+from typing import List, Optional, Tuple
+
+from sqlalchemy import String, event, func, inspect, select, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.interval_tree import IntervalIndex
+from models.trips import Trip, decode_cursor, encode_cursor, trip_duration
+
+trip_intervals = IntervalIndex(cache_size=settings.trip_interval_cache_size)
+_loaded = False
+
+
+def longest_trip_days(session) -> int:
+    """
+        Returns the duration in days of the longest trip, 0 without trips.
+    """
+    return math.ceil(session.query(func.max(trip_duration)).scalar() or 0)
+
+
+def decode_window_cursor(after: Optional[str]) -> Optional[Tuple[date, date, int]]:
+    """
+        Returns the (start date, end date, id) of the last trip of the previous page, None for
+        the first page.
+
+        Raises:
+        ValueError: If `after` is not a valid cursor.
+    """
+    if after is None:
+        return None
+    values = decode_cursor(after)
+    if len(values) != 3 or not all(isinstance(value, str) for value in values[:2]) or not isinstance(values[2], int):
+        raise ValueError("Invalid cursor")
+    return date.fromisoformat(values[0]), date.fromisoformat(values[1]), values[2]
+
+
+def _window_page(trips: List[Trip], limit: int) -> Tuple[List[Trip], Optional[str]]:
+    if len(trips) <= limit:
+        return trips, None
+    trips = trips[:limit]
+    last = trips[-1]
+    return trips, encode_cursor(last.start_date.isoformat(), last.end_date.isoformat(), last.id)
+
+
+def overlapping_trips(session, start: date, end: date, seek: Optional[Tuple[date, date, int]] = None):
+    """
+        Returns the query of the trips overlapping the [start, end] window, bounds included, in
+        chronological order, starting after the (start date, end date, id) of `seek` if given.
+    """
+    earliest_start = start - timedelta(days=longest_trip_days(session))
+    query = session.query(Trip).filter(Trip.start_date <= end, Trip.end_date >= start)
+    if seek is None:
+        query = query.filter(Trip.start_date >= earliest_start)
+    else:
+        # A single lower bound on start_date, the one SQLite seeks the index to
+        query = query.filter(
+            Trip.start_date >= max(earliest_start, seek[0]),
+            tuple_(Trip.start_date, Trip.end_date, Trip.id) > tuple_(*seek),
+        )
+    return query.order_by(Trip.start_date, Trip.end_date, Trip.id)
+
+
+def overlapping_trips_page(session, start: date, end: date, limit: int, after: Optional[str] = None) -> Tuple[List[Trip], Optional[str]]:
+    """
+        Returns one page of the trips overlapping the [start, end] window, bounds included, and
+        the cursor of the next page (None on the last page).
+
+        Raises:
+        ValueError: If `after` is not a valid cursor.
+    """
+    seek = decode_window_cursor(after)
+    return _window_page(overlapping_trips(session, start, end, seek).limit(limit + 1).all(), limit)
+
+
+def reload_trip_intervals(session) -> int:
+    """
+        Loads `trip_intervals` from the dates of all the trips. Returns the number of trips.
+    """
+    global _loaded
+    # Plain rows of the dates as stored, parsed by date.fromisoformat: less than half the time of
+    # an ORM select of Date columns
+    rows = session.connection().execute(
+        select(Trip.id, type_coerce(Trip.start_date, String), type_coerce(Trip.end_date, String))
+        .where(Trip.start_date.isnot(None), Trip.end_date.isnot(None))
+    ).all()
+    parse = date.fromisoformat
+    trip_intervals.load((trip_id, parse(start).toordinal(), parse(end).toordinal()) for trip_id, start, end in rows)
+    _loaded = True
+    return len(rows)
+
+
+def reset_trip_intervals():
+    """
+        Empties `trip_intervals`, which is reloaded on the next window query.
+    """
+    global _loaded
+    trip_intervals.clear()
+    _loaded = False
+
+
+def overlapping_trips_page_from_index(session, start: date, end: date, limit: int, after: Optional[str] = None) -> Tuple[List[Trip], Optional[str]]:
+    """
+        Same as `overlapping_trips_page`, with the overlapping trips found in `trip_intervals`
+        rather than in the trips table, which is only read for the trips of the page.
+
+        Raises:
+        ValueError: If `after` is not a valid cursor.
+    """
+    seek = decode_window_cursor(after)
+    if not _loaded:
+        reload_trip_intervals(session)
+    intervals = trip_intervals.overlapping(start.toordinal(), end.toordinal())
+    first = bisect_right(intervals, (seek[0].toordinal(), seek[1].toordinal(), seek[2])) if seek is not None else 0
+    trip_ids = [trip_id for _, _, trip_id in intervals[first:first + limit + 1]]
+    if not trip_ids:
+        return [], None
+    trips = session.query(Trip).filter(Trip.id.in_(trip_ids)).order_by(Trip.start_date, Trip.end_date, Trip.id).all()
+    return _window_page(trips, limit)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_trip_dates(session, flush_context):
+    trips = {}
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Trip):
+            continue
+        state = inspect(obj)
+        if obj in session.new or state.attrs.start_date.history.has_changes() or state.attrs.end_date.history.has_changes():
+            trips[obj.id] = (obj.start_date, obj.end_date)
+    for obj in session.deleted:
+        if isinstance(obj, Trip):
+            trips[obj.id] = None
+    if trips:
+        session.info.setdefault("trip_dates", {}).update(trips)
+
+
+@event.listens_for(Session, "after_commit")
+def apply_trip_dates(session):
+    trips = session.info.pop("trip_dates", None)
+    if trips and _loaded:
+        for trip_id, dates in trips.items():
+            if dates is None or None in dates:
+                trip_intervals.remove(trip_id)
+            else:
+                trip_intervals.add(trip_id, dates[0].toordinal(), dates[1].toordinal())
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_trip_dates(session):
+    session.info.pop("trip_dates", None)
@@ -1,7 +1,12 @@
-from typing import List, Optional
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
-from sqlalchemy.orm import relationship
+import base64
+import json
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Index, event, func, inspect, select, update
+from sqlalchemy.orm import Session, relationship
 from models.user_base import *
+from core.etags import weak_etag
+from core.fast_json import dumps
 from pydantic import BaseModel
 from datetime import date
 
@@ -11,12 +16,24 @@ class Trip(Base):
         storing basic trip metadata about a trip.
     """
     __tablename__ = "trips"
+    __table_args__ = (
+        Index("ix_trips_start_date_end_date", "start_date", "end_date"),
+    )
     id = Column(Integer, primary_key=True)
     start_date = Column(Date)
     end_date = Column(Date)
     origin = Column(String)
     destination = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # Bumped by every write to the trip, its participants or its events, and by renames of
+    # its participants (see `bump_trip_versions`). The ETags of the trip reads derive from it.
+    version = Column(Integer, nullable=False, server_default="1")
+
+
+# Length of a trip in days. Its index answers MAX() with one seek, see `models.trip_dates`.
+# Queries must spell the expression exactly like this to use the index.
+trip_duration = func.julianday(Trip.end_date) - func.julianday(Trip.start_date)
+Index("ix_trips_duration", trip_duration)
 
 
 class TripUsers(Base):
@@ -27,15 +44,19 @@ class TripUsers(Base):
     """
     __tablename__ = "trip_users"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    trip_id = Column(Integer, ForeignKey("trips.id", ondelete='CASCADE'))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete='CASCADE'), index=True)
 
 
 class TripEvent(Base):
     __tablename__ = 'trip_event'
+    __table_args__ = (
+        Index("ix_trip_event_trip_id_time", "trip_id", "time"),
+    )
     id = Column(Integer, primary_key=True)
     description = Column(String)
-    time = Column(String)
+    # Stored as YYYY-MM-DD, which sorts chronologically: the index serves time ranges and order
+    time = Column(Date)
     trip_id = Column(Integer, ForeignKey('trips.id', ondelete='CASCADE'))
 
 class AddTripEventPostData(BaseModel): 
@@ -48,14 +69,15 @@ class RemoveTripEventPostData(BaseModel):
 
 class TripEventGetData(BaseModel):
     description: str 
-    time: str 
+    # None for the legacy events whose time was not a date (see core.migrations)
+    time: Optional[date] 
     id: int
 
 class AddTripParticipantPostData(BaseModel):
-    trip_id: str 
+    trip_id: int 
 
 class RemoveTripParticipantPostData(BaseModel):
-    trip_id: str 
+    trip_id: int 
 
 class TripIn(BaseModel):
     startDate: str
@@ -77,6 +99,62 @@ class TripOut(BaseModel):
 
 class TripsOut(BaseModel):
     trips: List[TripOut]
+    next_cursor: Optional[str] = None
+
+
+def _changed_trip_ids(obj) -> Set[int]:
+    # Old and new trip_id, in case a participant or event is moved to another trip
+    # As ints: an id set from a string would not sort next to the others, nor match them in a set
+    history = inspect(obj).attrs.trip_id.history
+    return {int(trip_id) for trip_id in chain(history.added, history.unchanged, history.deleted) if trip_id is not None}
+
+
+@event.listens_for(Session, "after_flush")
+def bump_trip_versions(session, flush_context):
+    """
+        Increments `Trip.version` of every trip whose TripOut representation the flush changed:
+        updated trips, trips whose participants or events were added, changed or removed, and
+        the trips of the users whose username or full name changed.
+
+        Runs as plain UPDATE statements in the flush transaction. The `version` of the Trip objects
+        already loaded in the session is only refreshed once the commit expires them.
+    """
+    trip_ids: Set[int] = set()
+    user_ids: Set[int] = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (TripUsers, TripEvent)):
+            if obj in session.new or obj in session.deleted or session.is_modified(obj):
+                trip_ids |= _changed_trip_ids(obj)
+        elif isinstance(obj, Trip):
+            if obj in session.dirty and obj.id is not None and session.is_modified(obj):
+                trip_ids.add(obj.id)
+        elif isinstance(obj, User) and obj in session.dirty:
+            state = inspect(obj)
+            if state.attrs.username.history.has_changes() or state.attrs.full_name.history.has_changes():
+                user_ids.add(obj.id)
+    if not trip_ids and not user_ids:
+        return
+    conn = session.connection()
+    if trip_ids:
+        conn.execute(update(Trip.__table__).where(Trip.__table__.c.id.in_(sorted(trip_ids))).values(version=Trip.__table__.c.version + 1))
+    if user_ids:
+        participated = select(TripUsers.__table__.c.trip_id).where(TripUsers.__table__.c.user_id.in_(sorted(user_ids)))
+        conn.execute(update(Trip.__table__).where(Trip.__table__.c.id.in_(participated)).values(version=Trip.__table__.c.version + 1))
+
+
+def trip_etag(trip: Trip, currentUser: Optional[User] = None) -> str:
+    """
+        Returns the ETag of the TripOut of `trip` as seen by `currentUser`, without building it.
+    """
+    return weak_etag("trip", trip.id, trip.version, currentUser.id if currentUser is not None else None)
+
+
+def trips_page_etag(trips: List[Trip], next_cursor: Optional[str]) -> str:
+    """
+        Returns the ETag of a TripsOut page, without building it. Adding or removing a trip
+        of the page changes the ids, any other change to one of its trips the versions.
+    """
+    return weak_etag("trips", [(trip.id, trip.version) for trip in trips], next_cursor)
 
 
 def convert_trip(session, trip: Trip, currentUser: Optional[User] = None) -> TripOut:
@@ -91,20 +169,7 @@ def convert_trip(session, trip: Trip, currentUser: Optional[User] = None) -> Tri
         Returns:
         A TripOut object with the trip details and its associated participants and events.
     """
-    participants = convert_trip_participants(session, trip)
-    return TripOut(
-        users=participants,
-        events=convert_trip_events(session, trip),
-        isCurrentUserInParticipants=any(
-            participant.username == (currentUser.username if currentUser is not None else None) 
-            for participant in participants
-        ),
-        id=trip.id,
-        startDate=trip.start_date,
-        endDate=trip.end_date,
-        origin=trip.origin,
-        destination=trip.destination,
-    )
+    return convert_trips(session, [trip], currentUser)[0]
 
 
 def convert_trip_participants(session, trip: Trip) -> List[UserOut]:
@@ -165,4 +230,266 @@ def convert_trip_events(session, trip: Trip) -> List[TripEventGetData]:
         .all()
     )
 
-    return [convert_trip_event(trip_event) for trip_event in trip_events]
\ No newline at end of file
+    return [convert_trip_event(trip_event) for trip_event in trip_events]
+
+
+# SQLite limits the number of bound parameters of a single statement
+TRIP_IDS_CHUNK_SIZE = 500
+
+
+def convert_trips(session, trips: List[Trip], currentUser: Optional[User] = None) -> List[TripOut]:
+    """
+        Converts a list of Trip objects to TripOut objects in a fixed number of queries.
+
+        Instead of querying participants and events once per trip (as `convert_trip` does),
+        the participants and events of all the given trips are loaded with one query each
+        (per chunk of TRIP_IDS_CHUNK_SIZE trips) and grouped in memory.
+
+        Args:
+        session: SQLAlchemy session object.
+        trips: The Trip objects to be converted.
+        currentUser: An optional User object representing the current user. If provided, it is used to determine if the current user is in the list of participants.
+
+        Returns:
+        A list of TripOut objects, in the same order as the given trips.
+    """
+    trips = list(trips)
+    trip_ids = [trip.id for trip in trips]
+    participants_by_trip = load_trips_participants(session, trip_ids)
+    events_by_trip = load_trips_events(session, trip_ids)
+    current_username = currentUser.username if currentUser is not None else None
+
+    return [
+        TripOut(
+            users=participants_by_trip.get(trip.id, []),
+            events=events_by_trip.get(trip.id, []),
+            isCurrentUserInParticipants=any(
+                participant.username == current_username
+                for participant in participants_by_trip.get(trip.id, [])
+            ),
+            id=trip.id,
+            startDate=trip.start_date,
+            endDate=trip.end_date,
+            origin=trip.origin,
+            destination=trip.destination,
+        )
+        for trip in trips
+    ]
+
+
+def load_trips_participants(session, trip_ids: List[int]) -> Dict[int, List[UserOut]]:
+    """
+        Loads the participants of several trips at once.
+
+        Args:
+        session: A SQLAlchemy session object used for database operations.
+        trip_ids: The ids of the trips for which to retrieve participants.
+
+        Returns:
+        A dictionary mapping a trip id to the list of UserOut objects of its participants.
+    """
+    participants: Dict[int, List[UserOut]] = {}
+    for start in range(0, len(trip_ids), TRIP_IDS_CHUNK_SIZE):
+        rows = (
+            session.query(TripUsers.trip_id, User)
+            .join(User, User.id == TripUsers.user_id)
+            .filter(TripUsers.trip_id.in_(trip_ids[start:start + TRIP_IDS_CHUNK_SIZE]))
+            .all()
+        )
+        for trip_id, user in rows:
+            participants.setdefault(trip_id, []).append(convert_user(user))
+    return participants
+
+
+def load_trips_events(session, trip_ids: List[int]) -> Dict[int, List[TripEventGetData]]:
+    """
+        Loads the events of several trips at once.
+
+        Args:
+        session: A SQLAlchemy session object.
+        trip_ids: The ids of the trips for which to retrieve events.
+
+        Returns:
+        A dictionary mapping a trip id to the list of its TripEventGetData objects, ordered by time.
+    """
+    events: Dict[int, List[TripEventGetData]] = {}
+    for start in range(0, len(trip_ids), TRIP_IDS_CHUNK_SIZE):
+        trip_events = (
+            session.query(TripEvent)
+            .filter(TripEvent.trip_id.in_(trip_ids[start:start + TRIP_IDS_CHUNK_SIZE]))
+            .order_by(TripEvent.trip_id, TripEvent.time.asc())
+            .all()
+        )
+        for trip_event in trip_events:
+            events.setdefault(trip_event.trip_id, []).append(convert_trip_event(trip_event))
+    return events
+
+
+def load_trips_participant_dicts(session, trip_ids: List[int]) -> Dict[int, List[dict]]:
+    """
+        Same as `load_trips_participants`, with the participants as the plain dicts of their UserOut
+        JSON. Only the needed columns are selected, no User object is loaded.
+    """
+    participants: Dict[int, List[dict]] = {}
+    for start in range(0, len(trip_ids), TRIP_IDS_CHUNK_SIZE):
+        rows = session.execute(
+            select(TripUsers.trip_id, User.username, User.full_name)
+            .join(User, User.id == TripUsers.user_id)
+            .where(TripUsers.trip_id.in_(trip_ids[start:start + TRIP_IDS_CHUNK_SIZE]))
+        )
+        for trip_id, username, full_name in rows:
+            participant = {"username": username, "fullName": full_name}
+            if trip_id in participants:
+                participants[trip_id].append(participant)
+            else:
+                participants[trip_id] = [participant]
+    return participants
+
+
+def load_trips_event_dicts(session, trip_ids: List[int]) -> Dict[int, List[dict]]:
+    """
+        Same as `load_trips_events`, with the events as the plain dicts of their TripEventGetData JSON.
+    """
+    events: Dict[int, List[dict]] = {}
+    for start in range(0, len(trip_ids), TRIP_IDS_CHUNK_SIZE):
+        rows = session.execute(
+            select(TripEvent.trip_id, TripEvent.description, TripEvent.time, TripEvent.id)
+            .where(TripEvent.trip_id.in_(trip_ids[start:start + TRIP_IDS_CHUNK_SIZE]))
+            .order_by(TripEvent.trip_id, TripEvent.time.asc())
+        )
+        for trip_id, description, time, event_id in rows:
+            trip_event = {"description": description, "time": time, "id": event_id}
+            if trip_id in events:
+                events[trip_id].append(trip_event)
+            else:
+                events[trip_id] = [trip_event]
+    return events
+
+
+def convert_trips_to_dicts(session, trips: List[Trip], currentUser: Optional[User] = None) -> List[dict]:
+    """
+        Fast path of `convert_trips` for the large listings: returns the trips as the plain dicts
+        that `TripOut.dict()` would give, without constructing or validating any pydantic model.
+        Dates are left as `date` objects for the JSON encoder (see `core.fast_json`).
+
+        Args:
+        session: SQLAlchemy session object.
+        trips: The Trip objects (or rows with the same attributes) to be converted.
+        currentUser: An optional User object used to compute `isCurrentUserInParticipants`.
+
+        Returns:
+        A list of dicts with the keys of TripOut, in the same order as the given trips.
+    """
+    trips = list(trips)
+    trip_ids = [trip.id for trip in trips]
+    participants_by_trip = load_trips_participant_dicts(session, trip_ids)
+    events_by_trip = load_trips_event_dicts(session, trip_ids)
+    current_username = currentUser.username if currentUser is not None else None
+    no_items: List[dict] = []
+
+    converted = []
+    for trip in trips:
+        participants = participants_by_trip.get(trip.id, no_items)
+        converted.append({
+            "id": trip.id,
+            "users": participants,
+            "events": events_by_trip.get(trip.id, no_items),
+            "isCurrentUserInParticipants": current_username is not None and any(
+                participant["username"] == current_username for participant in participants
+            ),
+            "startDate": trip.start_date,
+            "endDate": trip.end_date,
+            "origin": trip.origin,
+            "destination": trip.destination,
+        })
+    return converted
+
+
+def encode_cursor(*values) -> str:
+    """
+        Encodes the sort key of the last returned row into an opaque pagination cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+        Decodes a cursor created by `encode_cursor`.
+
+        Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeEncodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def paginate_trips(query, limit: int, after: Optional[str] = None) -> Tuple[List[Trip], Optional[str]]:
+    """
+        Returns one page of the trips matched by `query`, using keyset pagination on Trip.id.
+
+        Unlike OFFSET, the page is located by seeking the primary key index past the last id
+        of the previous page, so deep pages cost the same as the first one.
+
+        Args:
+        query: A query over Trip objects, possibly already filtered.
+        limit: The maximum number of trips to return.
+        after: The `next_cursor` returned with the previous page, if any.
+
+        Returns:
+        A tuple of the trips of the page and the cursor of the next page (None on the last page).
+
+        Raises:
+        ValueError: If `after` is not a valid cursor.
+    """
+    if after is not None:
+        values = decode_cursor(after)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise ValueError("Invalid cursor")
+        query = query.filter(Trip.id > values[0])
+    trips = query.order_by(Trip.id).limit(limit + 1).all()
+    if len(trips) <= limit:
+        return trips, None
+    trips = trips[:limit]
+    return trips, encode_cursor(trips[-1].id)
+
+
+def iter_trips_ndjson(session, chunk_size: int, currentUser: Optional[User] = None) -> Iterator[bytes]:
+    """
+        Streams all trips as newline delimited JSON, one serialized TripOut per line, one chunk
+        of lines at a time.
+
+        Trips are read through a server-side cursor (`yield_per`) in chunks of `chunk_size` rows.
+        Only plain rows are selected, so nothing accumulates in the session, and the participants
+        and events are loaded once per chunk with `convert_trips_to_dicts`. Peak memory therefore depends
+        on the chunk size, not on the number of trips.
+
+        Args:
+        session: A SQLAlchemy session object.
+        chunk_size: The number of trips fetched and converted at a time.
+        currentUser: An optional User object used to compute `isCurrentUserInParticipants`.
+
+        Returns:
+        An iterator of encoded NDJSON chunks.
+    """
+    result = session.execute(
+        select(Trip.id, Trip.start_date, Trip.end_date, Trip.origin, Trip.destination)
+        .order_by(Trip.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in result.partitions():
+        yield b"".join(dumps(trip) + b"\n" for trip in convert_trips_to_dicts(session, chunk, currentUser))
+
+
+def get_trip_participant_ids(session, trip_id: int) -> Set[int]:
+    """
+        Returns the ids of the users currently taking part in a trip.
+    """
+    return {
+        user_id for (user_id,) in
+        session.query(TripUsers.user_id).filter(TripUsers.trip_id == trip_id)
+    }
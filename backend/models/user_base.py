@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from sqlalchemy import Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
@@ -9,7 +9,7 @@ Base = declarative_base()
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
-    username = Column(String)
+    username = Column(String, unique=True, index=True)
     password = Column(String)
     full_name = Column(String)
 
@@ -20,6 +20,16 @@ class Token(Base):
     user_id = Column(Integer)
 
 
+class RevokedToken(Base):
+    """
+        Denylist of signed access tokens revoked before their expiry,
+        identified by their `jti` claim. Rows are purged once expired.
+    """
+    __tablename__ = "revoked_tokens"
+    jti = Column(String, primary_key=True)
+    expires_at = Column(Integer)
+
+
 class UserIn(BaseModel):
     username: str
     password: str
@@ -31,6 +41,15 @@ class UserOut(BaseModel):
     fullName: str
 
 
+class CurrentUser(BaseModel):
+    """
+        Detached snapshot of the authenticated user, safe to share between sessions and threads.
+    """
+    id: int
+    username: str
+    full_name: Optional[str] = None
+
+
 class TokenOut(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,206 @@
+"""
+    The write operations of the trip endpoints, shared by their handlers in `main.py` and by
+    /batch, which runs many of them in a single transaction.
+
+    An operation takes the session, the authenticated user and the payload of its endpoint. It
+    raises the HTTPException of its endpoint when it cannot be applied, and never commits: the
+    handler commits once per request. It does not flush either, unless it needs the rows or ids
+    of the pending writes, so the events or participants added by a batch reach the database in
+    one flush, which bumps the version of each of their trips once (see `bump_trip_versions`).
+
+    In /batch, an id argument (see `REFERENCE_FIELDS`) of the form "$N" stands for the id of the
+    row created by operation N of the batch (counting from 0), e.g. "$0" as the `trip_id` of the
+    events of the trip created by the first operation. Other arguments, such as descriptions, are
+    never resolved.
+"""
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Literal, NamedTuple, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from models.expenses import CreateExpenseRequest, insert_expenses, validate_expense_request
+from models.trips import (
+    AddTripEventPostData, AddTripParticipantPostData, RemoveTripEventPostData, RemoveTripParticipantPostData, Trip,
+    TripEvent, TripIn, TripUsers, get_trip_participant_ids,
+)
+from models.user_base import CurrentUser
+
+_REFERENCE = re.compile(r"\$(\d+)")
+# The arguments holding the id of a trip or an event, which may reference a row of the batch
+REFERENCE_FIELDS = frozenset({"trip_id", "event_id"})
+
+
+class Created(NamedTuple):
+    """
+        A row written with a Core statement, whose id is known right away.
+    """
+    id: int
+
+
+def ensure_trip(session, trip_id) -> Trip:
+    # From the identity map, without a query, when the transaction already loaded or created it
+    trip = session.get(Trip, trip_id)
+    if trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip
+
+
+def parse_date(value: str, field: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}, expected YYYY-MM-DD")
+
+
+def create_trip(session, user: CurrentUser, trip_in: TripIn) -> Trip:
+    """
+        Creates a trip with the user as its first participant.
+    """
+    trip = Trip(
+        start_date=parse_date(trip_in.startDate, "startDate"),
+        end_date=parse_date(trip_in.endDate, "endDate"),
+        origin=trip_in.origin,
+        destination=trip_in.destination,
+        user_id=user.id
+    )
+    session.add(trip)
+    # The participant row needs the id of the trip
+    session.flush()
+    session.add(TripUsers(user_id=user.id, trip_id=trip.id))
+    return trip
+
+
+def add_participant(session, user: CurrentUser, data: AddTripParticipantPostData) -> TripUsers:
+    """
+        Adds the user to the participants of a trip.
+    """
+    ensure_trip(session, data.trip_id)
+    participant = TripUsers(user_id=user.id, trip_id=data.trip_id)
+    session.add(participant)
+    return participant
+
+
+def remove_participant(session, user: CurrentUser, data: RemoveTripParticipantPostData) -> None:
+    """
+        Removes the user from the participants of a trip.
+    """
+    # The session does not autoflush: the query must see the participants added by the batch
+    session.flush()
+    participants = session.query(TripUsers).filter(TripUsers.user_id == user.id, TripUsers.trip_id == data.trip_id).all()
+    for participant in participants:
+        session.delete(participant)
+
+
+def add_event(session, user: CurrentUser, data: AddTripEventPostData) -> TripEvent:
+    """
+        Adds an event to a trip.
+    """
+    ensure_trip(session, data.trip_id)
+    event = TripEvent(description=data.description, time=parse_date(data.time, "time"), trip_id=data.trip_id)
+    session.add(event)
+    return event
+
+
+def remove_event(session, user: CurrentUser, data: RemoveTripEventPostData) -> None:
+    """
+        Removes an event from its trip.
+    """
+    event = session.get(TripEvent, data.event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    session.delete(event)
+
+
+def create_expense(session, user: CurrentUser, request: CreateExpenseRequest) -> Created:
+    """
+        Creates an expense of a trip, between participants of the trip.
+    """
+    ensure_trip(session, request.trip_id)
+    # The expense rows are Core inserts, which must follow the pending trips and participants
+    session.flush()
+    errors = validate_expense_request(request, get_trip_participant_ids(session, request.trip_id))
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    return Created(insert_expenses(session, request.trip_id, [request])[0])
+
+
+# Name of each operation of /batch -> payload model and operation
+BATCH_OPERATIONS: Dict[str, Tuple[Type[BaseModel], Callable]] = {
+    "create_trip": (TripIn, create_trip),
+    "add_participant": (AddTripParticipantPostData, add_participant),
+    "remove_participant": (RemoveTripParticipantPostData, remove_participant),
+    "add_event": (AddTripEventPostData, add_event),
+    "remove_event": (RemoveTripEventPostData, remove_event),
+    "create_expense": (CreateExpenseRequest, create_expense),
+}
+
+
+class BatchOperation(BaseModel):
+    op: Literal["create_trip", "add_participant", "remove_participant", "add_event", "remove_event", "create_expense"]
+    # The JSON body of the endpoint of the operation
+    args: Dict[str, Any] = {}
+
+
+class BatchIn(BaseModel):
+    operations: List[BatchOperation]
+
+
+class BatchResult(BaseModel):
+    op: str
+    # Id of the row created by the operation: trip, participant, event or expense
+    id: Optional[int] = None
+
+
+class BatchOut(BaseModel):
+    success: bool
+    results: List[BatchResult]
+
+
+def resolve_references(session, args: Dict[str, Any], created: list) -> Dict[str, Any]:
+    """
+        Returns `args` with its "$N" ids (see `REFERENCE_FIELDS`) replaced by the id of the row
+        created by operation N.
+
+        Raises:
+        HTTPException(400): If N is not an earlier operation which created a row.
+    """
+    resolved = {}
+    for key, value in args.items():
+        match = _REFERENCE.fullmatch(value) if key in REFERENCE_FIELDS and isinstance(value, str) else None
+        if match is not None:
+            index = int(match.group(1))
+            if index >= len(created) or created[index] is None:
+                raise HTTPException(status_code=400, detail=f"{value} is not an earlier operation creating a row")
+            if created[index].id is None:
+                session.flush()
+            value = created[index].id
+        resolved[key] = value
+    return resolved
+
+
+def run_batch(session, user: CurrentUser, operations: List[BatchOperation]) -> List[BatchResult]:
+    """
+        Applies the operations in order in the current transaction, without committing it.
+
+        Raises:
+        HTTPException: The error of the first operation which cannot be applied, with its
+        status code, and as detail the index of the operation and its error.
+    """
+    created = []
+    for index, operation in enumerate(operations):
+        model, apply = BATCH_OPERATIONS[operation.op]
+        try:
+            payload = model.parse_obj(resolve_references(session, operation.args, created))
+            created.append(apply(session, user, payload))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={"operation": index, "detail": e.errors()})
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail={"operation": index, "detail": e.detail})
+    # The ids of the events and participants
+    session.flush()
+    return [
+        BatchResult(op=operation.op, id=row.id if row is not None else None)
+        for operation, row in zip(operations, created)
+    ]
@@ -0,0 +1,54 @@
+import unittest
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from core.db import build_engine, get_db, get_read_db, init_db
+from core.user_management import UserManagement
+from main import app
+from models.user_base import Token, User
+
+
+class ApiTestCase(unittest.TestCase):
+    """
+        Runs each test against its own empty database, which the sessions of the app are bound to.
+
+        `self.session` is a session of the test's own, for the rows a test sets up or checks, and
+        `self.client` a client of the app. `self.headers` authenticate as alice, once a test adds
+        her with `add_user("alice", token=True)`.
+    """
+    # In memory by default; a subclass sets a file database when another engine must share it
+    url = "sqlite://"
+
+    def setUp(self):
+        UserManagement.token_cache.clear()
+        self.engine = build_engine(self.url)
+        init_db(self.engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.session = self.Session()
+        app.dependency_overrides[get_db] = app.dependency_overrides[get_read_db] = self.override_get_db
+        self.client = TestClient(app)
+        self.headers = {"Authorization": "Bearer alice-token"}
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.session.close()
+        self.engine.dispose()
+
+    def override_get_db(self):
+        session = self.Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def add_user(self, username: str, token: bool = False) -> User:
+        """
+            Adds a user, flushed to have its id, with the token "<username>-token" if `token`.
+        """
+        user = User(username=username, password="pw", full_name=username.title())
+        self.session.add(user)
+        self.session.flush()
+        if token:
+            self.session.add(Token(token=f"{username}-token", user_id=user.id))
+        return user
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import httpx
+from fastapi import FastAPI
+
+from api_test_case import ApiTestCase
+from async_routes import router
+from core.async_db import async_sessionmaker, build_async_engine, get_async_db
+from core.user_management import UserManagement
+from main import app
+from models.expenses import CreateExpenseRequest, OweUserDetail, create_expenses
+from models.trips import Trip, TripEvent, TripUsers
+
+
+class TestAsyncRoutes(ApiTestCase, unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # A file database, which the async engine opens too
+        self.directory = tempfile.mkdtemp()
+        self.url = f"sqlite:///{os.path.join(self.directory, 'test.db')}"
+        super().setUp()
+        users = [self.add_user("alice", token=True), self.add_user("bob")]
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin="A", destination="B", user_id=users[0].id)
+        self.session.add(trip)
+        self.session.flush()
+        self.trip_id = trip.id
+        self.session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users])
+        self.session.add(TripEvent(description="Museum", time=date(2023, 4, 2), trip_id=trip.id))
+        self.session.commit()
+        create_expenses(self.session, CreateExpenseRequest(
+            trip_id=trip.id, description="Dinner", paid_user_id=users[0].id,
+            details=[OweUserDetail(owe_user_id=users[1].id, amount=1200)],
+        ))
+        self.session.close()
+
+    async def asyncSetUp(self):
+        self.async_engine = build_async_engine(self.url)
+        AsyncSession = async_sessionmaker(self.async_engine)
+
+        async def override_get_async_db():
+            async with AsyncSession() as session:
+                yield session
+        self.async_app = FastAPI()
+        self.async_app.include_router(router)
+        self.async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+    async def asyncTearDown(self):
+        await self.async_engine.dispose()
+
+    def tearDown(self):
+        super().tearDown()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    async def get_both(self, path):
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            sync_response = await client.get(path, headers=self.headers)
+        # Resolve the token again through the async session
+        UserManagement.token_cache.clear()
+        async with httpx.AsyncClient(app=self.async_app, base_url="http://test") as client:
+            async_response = await client.get(path, headers=self.headers)
+        return sync_response, async_response
+
+    async def test_responses_match_sync_endpoints(self):
+        for path in ("/users/me", "/my-trips", "/all-trips?limit=1", f"/trip/{self.trip_id}",
+                     f"/trip/{self.trip_id}/expenses", f"/trip/{self.trip_id}/settlement"):
+            sync_response, async_response = await self.get_both(path)
+            self.assertEqual(sync_response.status_code, 200, path)
+            self.assertEqual(async_response.status_code, 200, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+
+    async def test_errors_match_sync_endpoints(self):
+        for path in (f"/trip/{self.trip_id + 1}", f"/trip/{self.trip_id + 1}/expenses",
+                     f"/trip/{self.trip_id}/settlement?mode=fastest", "/my-trips?after=garbage"):
+            sync_response, async_response = await self.get_both(path)
+            self.assertEqual(async_response.status_code, sync_response.status_code, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+
+        self.headers = {"Authorization": "Bearer unknown"}
+        sync_response, async_response = await self.get_both("/my-trips")
+        self.assertEqual(async_response.status_code, 400)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    async def test_etags_match_sync_endpoints(self):
+        for path in ("/my-trips", "/all-trips?limit=1", f"/trip/{self.trip_id}"):
+            sync_response, async_response = await self.get_both(path)
+            self.assertEqual(async_response.headers["etag"], sync_response.headers["etag"], path)
+            self.headers["If-None-Match"] = sync_response.headers["etag"]
+            sync_response, async_response = await self.get_both(path)
+            self.assertEqual((sync_response.status_code, async_response.status_code), (304, 304), path)
+            del self.headers["If-None-Match"]
@@ -0,0 +1,238 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from models.expenses import ExpenseMeta, TripBalance
+from models.trips import Trip, TripEvent, TripUsers
+
+TRIP = {"startDate": "2023-04-01", "endDate": "2023-04-05", "origin": "Oslo", "destination": "Bergen"}
+# Every table a batch writes to
+TABLES = ["trips", "trip_users", "trip_event", "expenses_meta", "expenses", "trip_balances"]
+
+
+class TestBatch(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_user("alice", token=True)
+        self.bob = self.add_user("bob", token=True)
+        self.session.commit()
+        self.commits = 0
+
+        def count_commit(conn):
+            self.commits += 1
+        event.listen(self.engine, "commit", count_commit)
+
+    def batch(self, operations, headers=None):
+        self.commits = 0
+        return self.client.post("/batch", json={"operations": operations}, headers=headers or self.headers)
+
+    def snapshot(self):
+        with self.engine.connect() as conn:
+            return {table: conn.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall() for table in TABLES}
+
+    def participants(self, trip_id):
+        with self.engine.connect() as conn:
+            return sorted(row[0] for row in conn.exec_driver_sql("SELECT user_id FROM trip_users WHERE trip_id = ?", (trip_id,)))
+
+    def events(self, trip_id):
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.exec_driver_sql("SELECT description FROM trip_event WHERE trip_id = ? ORDER BY id", (trip_id,))]
+
+    def version(self, trip_id):
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT version FROM trips WHERE id = ?", (trip_id,)).scalar()
+
+    def test_itinerary_in_one_commit(self):
+        trip = {"startDate": "2023-04-01", "endDate": "2023-04-05", "origin": "Oslo", "destination": "Bergen"}
+        response = self.batch([
+            {"op": "create_trip", "args": trip},
+            {"op": "add_event", "args": {"description": "Train", "time": "2023-04-01", "trip_id": "$0"}},
+            {"op": "add_event", "args": {"description": "Fjord cruise", "time": "2023-04-02", "trip_id": "$0"}},
+            {"op": "remove_event", "args": {"event_id": "$2"}},
+            {"op": "add_event", "args": {"description": "Fish market", "time": "2023-04-03", "trip_id": "$0"}},
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(self.commits, 1)
+        trip_id = self.session.query(Trip.id).filter(Trip.origin == "Oslo").scalar()
+        events = self.session.query(TripEvent).filter(TripEvent.trip_id == trip_id).order_by(TripEvent.time).all()
+        self.assertEqual([(e.description, e.time) for e in events], [("Train", date(2023, 4, 1)), ("Fish market", date(2023, 4, 3))])
+        self.assertEqual(response.json(), {"success": True, "results": [
+            {"op": "create_trip", "id": trip_id},
+            {"op": "add_event", "id": events[0].id},
+            {"op": "add_event", "id": events[0].id + 1},
+            {"op": "remove_event", "id": None},
+            {"op": "add_event", "id": events[1].id},
+        ]})
+        self.assertEqual(self.session.query(TripUsers.user_id).filter(TripUsers.trip_id == trip_id).all(), [(self.alice.id,)])
+
+        # Bob joins and shares the costs, then leaves a trip he is not part of
+        response = self.batch([
+            {"op": "add_participant", "args": {"trip_id": trip_id}},
+            {"op": "create_expense", "args": {
+                "trip_id": trip_id, "description": "Dinner", "paid_user_id": self.bob.id,
+                "details": [{"owe_user_id": self.alice.id, "amount": 3000}],
+            }},
+            {"op": "remove_participant", "args": {"trip_id": trip_id + 1}},
+        ], headers={"Authorization": "Bearer bob-token"})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(self.commits, 1)
+        self.session.expire_all()
+        expense_id = self.session.query(ExpenseMeta.id).filter(ExpenseMeta.trip_id == trip_id).scalar()
+        self.assertEqual(response.json()["results"][1], {"op": "create_expense", "id": expense_id})
+        self.assertEqual(
+            [(b.creditor_id, b.debtor_id, b.amount) for b in self.session.query(TripBalance).filter(TripBalance.trip_id == trip_id)],
+            [(self.bob.id, self.alice.id, 3000)],
+        )
+        self.assertEqual(len(self.session.query(TripUsers).filter(TripUsers.trip_id == trip_id).all()), 2)
+
+    def test_participant_and_event_of_the_same_trip(self):
+        self.assertEqual(self.batch([{"op": "create_trip", "args": TRIP}]).status_code, 200)
+        trip_id = self.session.query(Trip.id).scalar()
+        version = self.version(trip_id)
+        response = self.batch([
+            {"op": "add_participant", "args": {"trip_id": trip_id}},
+            {"op": "add_event", "args": {"description": "Train", "time": "2023-04-01", "trip_id": trip_id}},
+        ], headers={"Authorization": "Bearer bob-token"})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(self.participants(trip_id), [self.alice.id, self.bob.id])
+        self.assertEqual(self.events(trip_id), ["Train"])
+        # One flush for both writes, one version bump
+        self.assertEqual(self.version(trip_id), version + 1)
+
+        # The same on a trip created by the batch, with the ids of the participant ops as strings
+        response = self.batch([
+            {"op": "create_trip", "args": TRIP},
+            {"op": "add_participant", "args": {"trip_id": "$0"}},
+            {"op": "add_event", "args": {"description": "Fjord cruise", "time": "2023-04-02", "trip_id": "$0"}},
+            {"op": "remove_participant", "args": {"trip_id": str(trip_id)}},
+            {"op": "add_event", "args": {"description": "Dinner", "time": "2023-04-02", "trip_id": trip_id}},
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        new_trip_id = response.json()["results"][0]["id"]
+        self.assertEqual(set(self.participants(new_trip_id)), {self.alice.id})
+        self.assertEqual(self.events(new_trip_id), ["Fjord cruise"])
+        self.assertEqual(self.participants(trip_id), [self.bob.id])
+        self.assertEqual(self.events(trip_id), ["Train", "Dinner"])
+
+    def test_removes_participants_added_by_the_batch(self):
+        response = self.batch([
+            {"op": "create_trip", "args": TRIP},
+            {"op": "remove_participant", "args": {"trip_id": "$0"}},
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        trip_id = response.json()["results"][0]["id"]
+        self.assertEqual(self.participants(trip_id), [])
+
+        response = self.batch([
+            {"op": "add_participant", "args": {"trip_id": trip_id}},
+            {"op": "add_event", "args": {"description": "Train", "time": "2023-04-01", "trip_id": trip_id}},
+            {"op": "remove_participant", "args": {"trip_id": trip_id}},
+        ], headers={"Authorization": "Bearer bob-token"})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(self.participants(trip_id), [])
+        self.assertEqual(self.events(trip_id), ["Train"])
+
+    def test_failing_batches_leave_the_database_unchanged(self):
+        response = self.batch([
+            {"op": "create_trip", "args": TRIP},
+            {"op": "add_event", "args": {"description": "Train", "time": "2023-04-01", "trip_id": "$0"}},
+        ])
+        trip_id = response.json()["results"][0]["id"]
+        before = self.snapshot()
+        expense = {"trip_id": trip_id, "description": "Dinner", "paid_user_id": self.alice.id, "details": [{"owe_user_id": self.alice.id, "amount": 100}]}
+        writes = [
+            {"op": "create_trip", "args": TRIP},
+            {"op": "add_participant", "args": {"trip_id": trip_id}},
+            {"op": "add_event", "args": {"description": "Museum", "time": "2023-04-02", "trip_id": trip_id}},
+            {"op": "remove_event", "args": {"event_id": response.json()["results"][1]["id"]}},
+            {"op": "create_expense", "args": expense},
+            {"op": "remove_participant", "args": {"trip_id": trip_id}},
+        ]
+        for failing, status in [
+            ({"op": "add_event", "args": {"description": "Lost", "time": "2023-04-01", "trip_id": 404}}, 404),
+            ({"op": "add_event", "args": {"description": "Lost", "time": "soon", "trip_id": trip_id}}, 400),
+            ({"op": "add_participant", "args": {"trip_id": "Oslo"}}, 422),
+            ({"op": "remove_event", "args": {"event_id": 404}}, 404),
+            ({"op": "create_expense", "args": dict(expense, paid_user_id=self.bob.id)}, 400),
+        ]:
+            response = self.batch(writes + [failing])
+            self.assertEqual(response.status_code, status, response.text)
+            self.assertEqual(response.json()["detail"]["operation"], len(writes))
+            self.assertEqual(self.commits, 0)
+            self.assertEqual(self.snapshot(), before)
+
+    def test_failing_operation_writes_nothing(self):
+        trip = {"startDate": "2023-04-01", "endDate": "2023-04-05", "origin": "Oslo", "destination": "Bergen"}
+        response = self.batch([
+            {"op": "create_trip", "args": trip},
+            {"op": "add_event", "args": {"description": "Train", "time": "2023-04-01", "trip_id": "$0"}},
+            {"op": "add_event", "args": {"description": "Lost", "time": "2023-04-01", "trip_id": 404}},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["detail"], {"operation": 2, "detail": "Trip not found"})
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(self.session.query(Trip).count(), 0)
+        self.assertEqual(self.session.query(TripEvent).count(), 0)
+        self.assertEqual(self.session.query(TripUsers).count(), 0)
+
+    def test_only_ids_are_references(self):
+        response = self.batch([
+            {"op": "create_trip", "args": TRIP},
+            {"op": "add_event", "args": {"description": "$0", "time": "2023-04-01", "trip_id": "$0"}},
+            {"op": "add_event", "args": {"description": "$1", "time": "2023-04-02", "trip_id": "$0"}},
+            {"op": "add_event", "args": {"description": "$5", "time": "2023-04-03", "trip_id": "$0"}},
+            {"op": "create_expense", "args": {
+                "trip_id": "$0", "description": "$1", "paid_user_id": self.alice.id,
+                "details": [{"owe_user_id": self.alice.id, "amount": 100}],
+            }},
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        trip_id = response.json()["results"][0]["id"]
+        self.assertEqual(self.events(trip_id), ["$0", "$1", "$5"])
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT description FROM expenses_meta").scalars().all(), ["$1"])
+
+    def test_invalid_operations(self):
+        trip = {"startDate": "2023-04-01", "endDate": "2023-04-05", "origin": "Oslo", "destination": "Bergen"}
+        event = {"description": "Train", "time": "2023-04-01", "trip_id": "$1"}
+        for operations, status, index in [
+            ([{"op": "create_trip", "args": trip}, {"op": "add_event", "args": event}], 400, 1),
+            ([{"op": "create_trip", "args": trip}, {"op": "remove_event", "args": {}}], 422, 1),
+            ([{"op": "add_event", "args": dict(event, trip_id="$0")}], 400, 0),
+            ([{"op": "create_trip", "args": dict(trip, startDate="April")}], 400, 0),
+        ]:
+            response = self.batch(operations)
+            self.assertEqual(response.status_code, status, response.text)
+            self.assertEqual(response.json()["detail"]["operation"], index)
+            self.assertEqual(self.snapshot(), {table: [] for table in TABLES})
+        self.assertEqual(self.batch([{"op": "drop_tables", "args": {}}]).status_code, 422)
+        self.assertEqual(self.batch([]).json(), {"success": True, "results": []})
+        self.assertEqual(self.snapshot(), {table: [] for table in TABLES})
+
+        max_operations = settings.batch_max_operations
+        settings.batch_max_operations = 2
+        try:
+            self.assertEqual(self.batch([{"op": "create_trip", "args": trip}] * 3).status_code, 400)
+        finally:
+            settings.batch_max_operations = max_operations
+
+    def test_single_endpoints_commit_once(self):
+        trip = {"startDate": "2023-04-01", "endDate": "2023-04-05", "origin": "Oslo", "destination": "Bergen"}
+        self.commits = 0
+        self.assertEqual(self.client.post("/trip/create", json=trip, headers=self.headers).status_code, 200)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(self.client.post("/trip/create", json=trip, headers=self.headers).status_code, 200)
+        first, second = [trip_id for (trip_id,) in self.session.query(Trip.id).order_by(Trip.id)]
+
+        # Leaving a trip keeps the other trips of the user
+        response = self.client.post("/trip/remove-participant", json={"trip_id": str(first)}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.query(TripUsers.trip_id).filter(TripUsers.user_id == self.alice.id).all(), [(second,)])
+        self.assertEqual(self.client.post("/trip/remove-event", json={"event_id": 1}, headers=self.headers).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import random
+import unittest
+from datetime import date, timedelta
+
+from api_test_case import ApiTestCase
+from core.db import explain_query_plan
+from models.calendar import calendar_events
+from models.trips import Trip, TripEvent, TripUsers
+
+
+class TestCalendar(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.add_user("alice", token=True)
+        self.bob = self.add_user("bob")
+        self.session.commit()
+
+    def add_trips(self):
+        """
+            Returns the (time, trip id, id) of the events of the trips of alice: created by her,
+            or by bob with her as a participant. Bob's other trips must not show up.
+        """
+        rng = random.Random(3)
+        events = []
+        for number in range(30):
+            owner = self.alice if number % 3 else self.bob
+            trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 30), user_id=owner.id)
+            self.session.add(trip)
+            self.session.flush()
+            mine = owner is self.alice or number % 2
+            if number % 2:
+                self.session.add(TripUsers(user_id=self.alice.id, trip_id=trip.id))
+            for _ in range(rng.randint(0, 15)):
+                event = TripEvent(description="Event", time=date(2023, 4, 1) + timedelta(days=rng.randint(0, 40)), trip_id=trip.id)
+                self.session.add(event)
+                self.session.flush()
+                if mine:
+                    events.append((event.time, trip.id, event.id))
+        self.session.add(TripEvent(description="Someday", time=None, trip_id=trip.id))
+        self.session.commit()
+        return sorted(events)
+
+    def fetch(self, start, end, limit=None):
+        events, after = [], None
+        while True:
+            params = {"from": start.isoformat(), "to": end.isoformat(), "limit": limit, "after": after}
+            response = self.client.get("/calendar", params={k: v for k, v in params.items() if v is not None}, headers=self.headers)
+            self.assertEqual(response.status_code, 200, response.text)
+            body = response.json()
+            events.extend((date.fromisoformat(event["time"]), event["tripId"], event["id"]) for event in body["events"])
+            after = body["next_cursor"]
+            if after is None:
+                return events
+
+    def test_pages_match_a_sort(self):
+        events = self.add_trips()
+        for start, end in [(date(2023, 4, 1), date(2023, 5, 31)), (date(2023, 4, 10), date(2023, 4, 12)),
+                           (date(2023, 4, 7), date(2023, 4, 7)), (date(2024, 1, 1), date(2024, 1, 31))]:
+            expected = [event for event in events if start <= event[0] <= end]
+            self.assertEqual(self.fetch(start, end), expected)
+            self.assertEqual(self.fetch(start, end, limit=4), expected)
+
+    def test_event_fields(self):
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 3), user_id=self.alice.id)
+        self.session.add(trip)
+        self.session.commit()
+        event = {"description": "Museum", "time": "2023-04-02", "trip_id": trip.id}
+        self.assertEqual(self.client.post("/trip/add-event", json=event, headers=self.headers).status_code, 200)
+        response = self.client.get("/calendar", params={"from": "2023-04-01", "to": "2023-04-30"}, headers=self.headers)
+        self.assertEqual(response.json(), {
+            "events": [{"description": "Museum", "time": "2023-04-02", "id": 1, "tripId": trip.id}],
+            "next_cursor": None,
+        })
+
+    def test_pages_read_the_trips_index_ranges(self):
+        for seek in (None, (date(2023, 4, 5), 2, 7)):
+            query = calendar_events(self.alice.id, date(2023, 4, 1), date(2023, 4, 30), seek).limit(10)
+            plan = " | ".join(explain_query_plan(self.engine, query))
+            self.assertIn("SEARCH trip_event USING INDEX ix_trip_event_trip_id_time (trip_id=? AND time>? AND time<?)", plan)
+            self.assertNotIn("SCAN", plan)
+
+    def test_validation(self):
+        params = {"from": "2023-04-03", "to": "2023-04-01"}
+        self.assertEqual(self.client.get("/calendar", params=params, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get("/calendar", params={"from": "2023-04-03"}, headers=self.headers).status_code, 422)
+        params = {"from": "2023-04-01", "to": "2023-04-03", "after": "garbage"}
+        self.assertEqual(self.client.get("/calendar", params=params, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get("/calendar", params={"from": "2023-04-01", "to": "2023-04-03"}).status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
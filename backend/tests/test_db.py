@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from core import db
+from models.expenses import (
+    CreateExpenseRequest,
+    ExpenseMeta,
+    OweUserDetail,
+    TripBalance,
+    create_expenses,
+    delete_trip_expenses,
+)
+from models.trips import Trip, TripUsers
+from models.user_base import User
+
+
+class TestSessionLifecycle(unittest.TestCase):
+    def test_get_db_closes_session(self):
+        session = mock.MagicMock()
+        with mock.patch.object(db, "SessionLocal", return_value=session):
+            dependency = db.get_db()
+            self.assertIs(next(dependency), session)
+            with self.assertRaises(StopIteration):
+                next(dependency)
+        session.close.assert_called_once()
+        session.rollback.assert_not_called()
+
+    def test_get_db_rolls_back_on_error(self):
+        session = mock.MagicMock()
+        with mock.patch.object(db, "SessionLocal", return_value=session):
+            dependency = db.get_db()
+            next(dependency)
+            with self.assertRaises(ValueError):
+                dependency.throw(ValueError("handler failed"))
+        session.rollback.assert_called_once()
+        session.close.assert_called_once()
+
+    def test_engine_is_shared(self):
+        first = db.SessionLocal()
+        second = db.SessionLocal()
+        self.assertIs(first.get_bind(), second.get_bind())
+        first.close()
+        second.close()
+
+
+class TestSqliteProfile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = f"sqlite:///{os.path.join(self.directory, 'test.db')}"
+        self.engine = db.build_engine(self.url)
+        db.init_db(self.engine)
+        self.read_engine = db.build_engine(self.url, read_only=True)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.read_engine.dispose()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def pragma(self, engine, name):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+    def test_pragmas_are_applied_on_connect(self):
+        self.assertEqual(self.pragma(self.engine, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(self.engine, "synchronous"), 1)
+        self.assertEqual(self.pragma(self.engine, "foreign_keys"), 1)
+        self.assertEqual(self.pragma(self.engine, "busy_timeout"), 5000)
+        self.assertEqual(self.pragma(self.engine, "query_only"), 0)
+        self.assertEqual(self.pragma(self.read_engine, "query_only"), 1)
+
+    def test_read_only_engine_rejects_writes(self):
+        with self.read_engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM users").scalar(), 0)
+            with self.assertRaises(OperationalError):
+                conn.exec_driver_sql("INSERT INTO users (username) VALUES ('alice')")
+
+    def test_foreign_keys_are_enforced(self):
+        session = sessionmaker(bind=self.engine)()
+        session.add(TripUsers(user_id=1, trip_id=42))
+        with self.assertRaises(IntegrityError):
+            session.commit()
+        session.close()
+
+    def test_trip_deletion_removes_its_expenses_first(self):
+        session = sessionmaker(bind=self.engine)()
+        users = [User(username=name) for name in ("alice", "bob")]
+        session.add_all(users)
+        session.flush()
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), user_id=users[0].id)
+        session.add(trip)
+        session.flush()
+        session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users])
+        session.commit()
+        create_expenses(session, CreateExpenseRequest(
+            trip_id=trip.id, description="Dinner", paid_user_id=users[0].id,
+            details=[OweUserDetail(owe_user_id=users[1].id, amount=100)],
+        ))
+
+        delete_trip_expenses(session, trip.id)
+        session.delete(trip)
+        session.commit()
+        self.assertEqual(session.query(ExpenseMeta).count(), 0)
+        self.assertEqual(session.query(TripBalance).count(), 0)
+        self.assertEqual(session.query(TripUsers).count(), 0)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
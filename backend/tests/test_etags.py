@@ -0,0 +1,98 @@
+import unittest
+from datetime import date
+
+from api_test_case import ApiTestCase
+from core.etags import etag_matches
+from core.queries import QueryRecorder
+from core.user_management import UserManagement
+from models.trips import Trip, TripEvent, TripUsers
+from models.user_base import User
+
+
+class TestEtagMatches(unittest.TestCase):
+    def test_weak_comparison(self):
+        etag = 'W/"abc"'
+        for header in ('W/"abc"', '"abc"', 'W/"x", W/"abc"', "*"):
+            self.assertTrue(etag_matches(header, etag), header)
+        for header in (None, "", 'W/"abd"', "abc"):
+            self.assertFalse(etag_matches(header, etag), header)
+
+
+class TestConditionalTripReads(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        alice = self.add_user("alice", token=True)
+        bob = self.add_user("bob", token=True)
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin="A", destination="B", user_id=alice.id)
+        self.session.add(trip)
+        self.session.flush()
+        self.session.add_all([TripUsers(user_id=alice.id, trip_id=trip.id), TripEvent(description="Dinner", time=date(2023, 4, 2), trip_id=trip.id)])
+        self.session.commit()
+        self.trip_id, self.alice_id, self.bob_id = trip.id, alice.id, bob.id
+
+    def etag(self, path, token="alice-token"):
+        response = self.client.get(path, headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 200, path)
+        self.assertTrue(response.headers["etag"].startswith('W/"'))
+        return response.headers["etag"]
+
+    def revalidate(self, path, etag):
+        return self.client.get(path, headers={**self.headers, "If-None-Match": etag})
+
+    def version(self):
+        session = self.Session()
+        try:
+            return session.query(Trip.version).filter(Trip.id == self.trip_id).scalar()
+        finally:
+            session.close()
+
+    def test_not_modified_skips_building_the_response(self):
+        for path in ("/my-trips", "/all-trips", f"/trip/{self.trip_id}"):
+            etag = self.etag(path)
+            with QueryRecorder(self.engine) as recorder:
+                response = self.revalidate(path, etag)
+            self.assertEqual(response.status_code, 304, path)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["etag"], etag)
+            self.assertFalse([s for s in recorder.statements if "trip_event" in s or "trip_users" in s], path)
+
+    def test_writes_change_the_etags(self):
+        paths = ("/my-trips", "/all-trips", f"/trip/{self.trip_id}")
+        writes = [
+            ("POST", "/trip/add-event", {"description": "Museum", "time": "2023-04-03", "trip_id": self.trip_id}),
+            ("POST", "/trip/remove-event", {"event_id": 1}),
+            ("POST", "/trip/add-participant", {"trip_id": str(self.trip_id)}),
+            ("POST", "/trip/remove-participant", {"trip_id": str(self.trip_id)}),
+        ]
+        for method, path, body in writes:
+            before = {p: self.etag(p) for p in paths}
+            version = self.version()
+            token = "bob-token" if "participant" in path else "alice-token"
+            response = self.client.request(method, path, headers={"Authorization": f"Bearer {token}"}, json=body)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(self.version(), version + 1, path)
+            for p in paths:
+                self.assertEqual(self.revalidate(p, before[p]).status_code, 200, (path, p))
+
+    def test_creating_a_trip_changes_the_listings(self):
+        before = self.etag("/my-trips")
+        self.client.post("/trip/create", headers=self.headers, json={
+            "startDate": "2023-05-01", "endDate": "2023-05-08", "origin": "C", "destination": "D"})
+        self.assertEqual(self.revalidate("/my-trips", before).status_code, 200)
+
+    def test_renaming_a_participant_changes_the_trip(self):
+        path = f"/trip/{self.trip_id}"
+        before = self.etag(path)
+        session = self.Session()
+        UserManagement.update_user(session, session.get(User, self.alice_id), full_name="Alice Smith")
+        session.close()
+        self.assertEqual(self.revalidate(path, before).status_code, 200)
+        before = self.etag(path)
+        session = self.Session()
+        UserManagement.update_user(session, session.get(User, self.alice_id), password="secret")
+        session.close()
+        self.assertEqual(self.revalidate(path, before).status_code, 304)
+
+    def test_trip_etag_depends_on_the_reader(self):
+        path = f"/trip/{self.trip_id}"
+        self.assertNotEqual(self.etag(path), self.etag(path, "bob-token"))
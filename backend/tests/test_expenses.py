@@ -2,6 +2,7 @@ import unittest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models.user_base import Base, User
+from models.trips import Trip, TripUsers
 from models.expenses import (
     ExpenseMeta,
     ExpenseDetails,
@@ -19,20 +20,30 @@ from core.db import *
 class TestExpenseFunctions(unittest.TestCase):
 
     def setUp(self):
-        self.session = get_db(is_test=True)
+        # A fresh database per test: foreign keys are enforced, the rows referenced by the expenses must exist
+        self.engine = build_engine("sqlite://")
+        init_db(self.engine)
+        self.session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)()
 
         user1 = User(id=1, username="Alice")
         user2 = User(id=2, username="Bob")
         user3 = User(id=3, username="Charlie")
 
         self.session.add_all([user1, user2, user3])
+        self.session.flush()
+        self.session.add(Trip(id=1, origin="A", destination="B", user_id=1))
+        self.session.flush()
+        self.session.add_all([TripUsers(user_id=user_id, trip_id=1) for user_id in (1, 2, 3)])
         self.session.commit()
 
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
     def test_create_expenses(self):
-        request = CreateExpenseRequest(trip_id=1, description="Dinner", paid_user_id=1)
         detail1 = OweUserDetail(owe_user_id=2, amount=2000)
         detail2 = OweUserDetail(owe_user_id=3, amount=3000)
-        request.details = [detail1, detail2]
+        request = CreateExpenseRequest(trip_id=1, description="Dinner", paid_user_id=1, details=[detail1, detail2])
 
         response = create_expenses(self.session, request)
         self.assertIsNotNone(response.expense_id)
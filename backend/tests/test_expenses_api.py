@@ -0,0 +1,203 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+
+from api_test_case import ApiTestCase
+from models.expenses import (
+    TripBalance,
+    check_trip_balances,
+    load_expenses_with_summary_for_trip,
+    rebuild_trip_balances,
+)
+from models.trips import Trip, TripUsers
+from models.user_base import Token
+
+
+class ExpensesApiTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        users = [self.add_user(name) for name in ("alice", "bob", "carol", "dave")]
+        self.user_ids = {user.username: user.id for user in users}
+        self.session.add(Token(token="alice-token", user_id=users[0].id))
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin="A", destination="B", user_id=users[0].id)
+        self.session.add(trip)
+        self.session.flush()
+        self.trip_id = trip.id
+        self.session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users[:3]])
+        self.session.commit()
+
+    def create(self, payer, owed, trip_id=None):
+        return self.client.post(
+            f"/trip/{trip_id or self.trip_id}/expenses",
+            headers=self.headers,
+            json={
+                "trip_id": self.trip_id,
+                "description": "Dinner",
+                "paid_user_id": self.user_ids[payer],
+                "details": [{"owe_user_id": self.user_ids[name], "amount": amount} for name, amount in owed.items()],
+            },
+        )
+
+
+class TestExpensesApi(ExpensesApiTestCase):
+    def test_create_and_list(self):
+        first = self.create("alice", {"bob": 1000, "carol": 2000})
+        self.assertEqual(first.status_code, 200)
+        self.create("alice", {"bob": 500})
+        self.create("bob", {"alice": 300})
+
+        body = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()
+        self.assertEqual(body["expenses"][0], {
+            "expense_id": first.json()["expense_id"],
+            "paid_user_name": "alice",
+            "total_paid": 3000,
+            "details": [{"owe_user_name": "bob", "amount": 1000}, {"owe_user_name": "carol", "amount": 2000}],
+        })
+        self.assertEqual(body["summary"], {"alice": {"bob": 1500, "carol": 2000}, "bob": {"alice": 300}})
+
+    def test_balances_follow_updates_and_deletes(self):
+        first = self.create("alice", {"bob": 1000, "carol": 2000}).json()["expense_id"]
+        second = self.create("bob", {"alice": 300}).json()["expense_id"]
+        response = self.client.put(
+            f"/trip/{self.trip_id}/expenses/{first}",
+            headers=self.headers,
+            json={
+                "trip_id": self.trip_id,
+                "description": "Lunch",
+                "paid_user_id": self.user_ids["carol"],
+                "details": [{"owe_user_id": self.user_ids["bob"], "amount": 700}],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        summary = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()["summary"]
+        self.assertEqual(summary, {"carol": {"bob": 700}, "bob": {"alice": 300}})
+
+        self.assertEqual(self.client.delete(f"/trip/{self.trip_id}/expenses/{second}", headers=self.headers).status_code, 200)
+        self.assertEqual(self.client.delete(f"/trip/{self.trip_id}/expenses/{second}", headers=self.headers).status_code, 404)
+        summary = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()["summary"]
+        self.assertEqual(summary, {"carol": {"bob": 700}})
+
+        session = self.Session()
+        self.assertEqual(check_trip_balances(session), [])
+        self.assertEqual(session.query(TripBalance).count(), 1)
+        session.close()
+
+    def test_check_and_rebuild(self):
+        self.create("alice", {"bob": 1000})
+        session = self.Session()
+        session.query(TripBalance).update({"amount": 1})
+        session.commit()
+        alice, bob = self.user_ids["alice"], self.user_ids["bob"]
+        self.assertEqual(check_trip_balances(session, self.trip_id), [(self.trip_id, alice, bob, 1, 1000)])
+        self.assertEqual(rebuild_trip_balances(session, self.trip_id), 1)
+        self.assertEqual(check_trip_balances(session), [])
+        session.close()
+
+    def test_settlement(self):
+        self.create("alice", {"bob": 1000, "carol": 2000})
+        self.create("bob", {"carol": 1000})
+        body = self.client.get(f"/trip/{self.trip_id}/settlement", headers=self.headers).json()
+        self.assertEqual(body["mode"], "exact")
+        self.assertEqual(body["transfers"], [{"from_user": "carol", "to_user": "alice", "amount": 3000}])
+        response = self.client.get(f"/trip/{self.trip_id}/settlement", params={"mode": "bogus"}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_expenses(self):
+        self.assertEqual(self.create("alice", {"dave": 100}).status_code, 400)
+        self.assertEqual(self.create("alice", {"bob": -100}).status_code, 400)
+        self.assertEqual(self.create("alice", {"bob": 100}, trip_id=self.trip_id + 1).status_code, 400)
+        self.assertEqual(self.client.get("/trip/999/expenses", headers=self.headers).status_code, 404)
+
+    def test_query_count_does_not_depend_on_expense_count(self):
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        counts = []
+        for _ in range(2):
+            for _ in range(10):
+                self.create("bob", {"alice": 100, "carol": 200})
+            session = self.Session()
+            event.listen(self.engine, "before_cursor_execute", record)
+            try:
+                statements.clear()
+                load_expenses_with_summary_for_trip(session, self.trip_id)
+                counts.append(len(statements))
+            finally:
+                event.remove(self.engine, "before_cursor_execute", record)
+                session.close()
+        self.assertEqual(counts, [3, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestExpensesImport(ExpensesApiTestCase):
+    def import_json(self, expenses):
+        return self.client.post(f"/trip/{self.trip_id}/expenses/import", headers=self.headers, json=expenses)
+
+    def expense(self, payer, owed, **fields):
+        return {
+            "description": "Taxi",
+            "paid_user_id": self.user_ids[payer],
+            "details": [{"owe_user_id": self.user_ids[name], "amount": amount} for name, amount in owed.items()],
+            **fields,
+        }
+
+    def test_imports_json(self):
+        response = self.import_json([
+            self.expense("alice", {"bob": 1000, "carol": 2000}),
+            # Coerced by pydantic, like the single expense endpoint
+            self.expense("bob", {"alice": "300"}),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["expense_ids"]), 2)
+        self.assertEqual(response.json()["imported_lines"], 3)
+
+        body = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()
+        self.assertEqual([e["expense_id"] for e in body["expenses"]], response.json()["expense_ids"])
+        self.assertEqual(body["summary"], {"alice": {"bob": 1000, "carol": 2000}, "bob": {"alice": 300}})
+        session = self.Session()
+        self.assertEqual(check_trip_balances(session, self.trip_id), [])
+        session.close()
+
+    def test_imports_csv(self):
+        alice, bob, carol = (self.user_ids[name] for name in ("alice", "bob", "carol"))
+        csv = (
+            "ref,description,paid_user_id,owe_user_id,amount\n"
+            f"1,Dinner,{alice},{bob},1000\n"
+            f"2,Taxi,{bob},{alice},300\n"
+            f"1,Dinner,{alice},{carol},2000\n"
+        )
+        response = self.client.post(
+            f"/trip/{self.trip_id}/expenses/import",
+            headers={**self.headers, "Content-Type": "text/csv"},
+            content=csv,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["imported_lines"], 3)
+        body = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()
+        self.assertEqual([e["total_paid"] for e in body["expenses"]], [3000, 300])
+
+    def test_rejects_whole_batch_with_row_errors(self):
+        response = self.import_json([
+            self.expense("alice", {"bob": 1000}),
+            self.expense("alice", {"dave": 1000}),
+            self.expense("alice", {"bob": "a lot"}),
+            self.expense("alice", {"bob": 1000}, trip_id=self.trip_id + 1),
+        ])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error["row"] for error in response.json()["detail"]], [1, 2, 3])
+
+        body = self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).json()
+        self.assertEqual(body["expenses"], [])
+        self.assertEqual(body["summary"], {})
+
+    def test_rejects_malformed_csv(self):
+        response = self.client.post(
+            f"/trip/{self.trip_id}/expenses/import",
+            headers={**self.headers, "Content-Type": "text/csv"},
+            content="ref,description,paid_user_id\n1,Dinner,1\n",
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["detail"][0]["row"], 1)
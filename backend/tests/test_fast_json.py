@@ -0,0 +1,27 @@
+import importlib
+import json
+import sys
+import unittest
+from datetime import date
+from unittest import mock
+
+import core.fast_json
+
+
+class TestFastJson(unittest.TestCase):
+    value = {"id": 1, "startDate": date(2023, 4, 1), "origin": "Zürich", "events": [], "next_cursor": None}
+
+    def test_dumps(self):
+        self.assertEqual(json.loads(core.fast_json.dumps(self.value)), {**self.value, "startDate": "2023-04-01"})
+
+    def test_stdlib_fallback(self):
+        try:
+            with mock.patch.dict(sys.modules, {"orjson": None}):
+                fallback = importlib.reload(core.fast_json)
+            self.assertEqual(fallback.JSON_ENCODER, "json")
+            self.assertEqual(json.loads(fallback.dumps(self.value)), {**self.value, "startDate": "2023-04-01"})
+            with self.assertRaises(TypeError):
+                fallback.dumps({"x": object()})
+        finally:
+            # Other modules hold the functions of the first import, which use the module globals
+            importlib.reload(core.fast_json)
@@ -0,0 +1,41 @@
+import unittest
+
+from benchmarks.loadtest import compare_results, run_load_test
+from core.config import settings
+
+BASELINE = {
+    "GET /all-trips": {"count": 50, "errors": 0, "rps": 100.0, "p50_ms": 5.0, "p95_ms": 10.0, "p99_ms": 12.0},
+}
+
+
+def result(**overrides):
+    return {"GET /all-trips": {**BASELINE["GET /all-trips"], **overrides}}
+
+
+class TestCompareResults(unittest.TestCase):
+    def test_within_tolerance(self):
+        self.assertEqual(compare_results(BASELINE, result(p95_ms=11.9, rps=81.0), 0.2), [])
+
+    def test_regressions(self):
+        self.assertEqual(len(compare_results(BASELINE, result(p95_ms=12.5), 0.2)), 1)
+        self.assertEqual(len(compare_results(BASELINE, result(rps=70.0), 0.2)), 1)
+        self.assertEqual(len(compare_results(BASELINE, result(errors=1), 0.2)), 1)
+        self.assertEqual(compare_results(BASELINE, {}, 0.2), ["GET /all-trips: not measured"])
+
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.iterations = settings.password_hash_iterations
+        settings.password_hash_iterations = 1000
+
+    def tearDown(self):
+        settings.password_hash_iterations = self.iterations
+
+    def test_scenario_runs_without_errors(self):
+        results = run_load_test(users=2, iterations=2, seed_users=5, seed_trips=10, seed_events=1)
+        self.assertEqual(
+            sorted(results),
+            ["GET /all-trips", "GET /trip/{trip_id}", "POST /login", "POST /signup", "POST /trip/add-event", "POST /trip/create"],
+        )
+        self.assertEqual(results["GET /all-trips"]["count"], 4)
+        self.assertTrue(all(endpoint["errors"] == 0 for endpoint in results.values()), results)
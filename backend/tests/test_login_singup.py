@@ -10,7 +10,7 @@ class TestLoginAndSignUpFlows(unittest.TestCase):
 
     def tearDown(self):
         # Delete the record from the tokens table
-        session = get_db(is_test=True)
+        session = create_session(is_test=True)
         session.query(Token).delete()
         session.query(User).delete()
         session.commit()
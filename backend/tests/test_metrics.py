@@ -0,0 +1,150 @@
+import asyncio
+import re
+import unittest
+from datetime import date
+
+from fastapi import FastAPI
+from sqlalchemy.exc import OperationalError
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from core.db import build_engine
+from core.metrics import MetricsMiddleware, MetricsRegistry, RequestStats, UNMATCHED_ROUTE, current_request_stats, instrument_engines
+from core.metrics import registry as metrics_registry
+from models.trips import Trip, TripUsers
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{.*\})? (\S+)$')
+
+
+def samples(text):
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        values[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return values
+
+
+class TestMetricsEndpoint(ApiTestCase):
+    def setUp(self):
+        metrics_registry.clear()
+        super().setUp()
+        user = self.add_user("alice", token=True)
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin="A", destination="B", user_id=user.id)
+        self.session.add(trip)
+        self.session.flush()
+        self.trip_id = trip.id
+        self.session.add(TripUsers(user_id=user.id, trip_id=trip.id))
+        self.session.commit()
+
+    def tearDown(self):
+        super().tearDown()
+        metrics_registry.clear()
+
+    def test_routes_sharing_a_function_name(self):
+        # /my-trips, /all-trips and /trip/{trip_id} are all served by functions named get_trips
+        self.client.get("/my-trips", headers=self.headers)
+        self.client.get("/all-trips", headers=self.headers)
+        self.client.get(f"/trip/{self.trip_id}", headers=self.headers)
+        self.client.get("/trip/999999", headers=self.headers)
+        self.client.get("/no-such-route")
+        values = samples(self.client.get("/metrics").text)
+
+        for route in ("/my-trips", "/all-trips"):
+            self.assertEqual(values[f'http_requests_total{{method="GET",route="{route}",status="200"}}'], 1)
+        self.assertEqual(values['http_requests_total{method="GET",route="/trip/{trip_id}",status="200"}'], 1)
+        self.assertEqual(values['http_requests_total{method="GET",route="/trip/{trip_id}",status="404"}'], 1)
+        self.assertEqual(values[f'http_requests_total{{method="GET",route="{UNMATCHED_ROUTE}",status="404"}}'], 1)
+        self.assertEqual(values['http_request_duration_seconds_count{method="GET",route="/trip/{trip_id}"}'], 2)
+        self.assertEqual(values['http_request_duration_seconds_bucket{method="GET",route="/trip/{trip_id}",le="+Inf"}'], 2)
+        # The /metrics request itself is in flight while rendering
+        self.assertEqual(values["http_requests_in_flight"], 1)
+        self.assertIn("token_cache_hits_total", values)
+
+    def test_database_time_and_queries(self):
+        self.client.get(f"/trip/{self.trip_id}", headers=self.headers)
+        values = samples(self.client.get("/metrics").text)
+        self.assertGreater(values['http_request_db_queries_total{method="GET",route="/trip/{trip_id}"}'], 0)
+        self.assertGreater(values['http_request_db_seconds_total{method="GET",route="/trip/{trip_id}"}'], 0)
+
+    def test_chunked_export_is_not_an_n_plus_one(self):
+        user_id = self.session.query(Trip.user_id).scalar()
+        self.session.add_all([Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), user_id=user_id) for _ in range(100)])
+        self.session.commit()
+        previous = settings.trips_export_chunk_size
+        settings.trips_export_chunk_size = 2
+        try:
+            with self.assertNoLogs("core.queries", level="WARNING"):
+                response = self.client.get("/all-trips/export", headers=self.headers)
+        finally:
+            settings.trips_export_chunk_size = previous
+        self.assertEqual(len(response.text.splitlines()), 101)
+
+    def test_content_type(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.headers["content-type"], "text/plain; version=0.0.4; charset=utf-8")
+
+
+class TestQueryTiming(unittest.TestCase):
+    def test_failing_statements_leave_no_state_on_the_connection(self):
+        instrument_engines()
+        engine = build_engine("sqlite://")
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        try:
+            with engine.connect() as conn:
+                info = dict(conn.info)
+                for _ in range(3):
+                    with self.assertRaises(OperationalError):
+                        conn.exec_driver_sql("SELECT * FROM missing")
+                self.assertEqual(conn.info, info)
+                conn.exec_driver_sql("SELECT 1")
+        finally:
+            current_request_stats.reset(token)
+            engine.dispose()
+        self.assertEqual(stats.queries, 1)
+        self.assertLess(stats.db_time, 1)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        for latency in (0.0005, 0.003, 0.003, 20.0):
+            registry.observe("GET", "/x", 200, latency, RequestStats())
+        values = samples(registry.render())
+        self.assertEqual(values['http_request_duration_seconds_bucket{method="GET",route="/x",le="0.001"}'], 1)
+        self.assertEqual(values['http_request_duration_seconds_bucket{method="GET",route="/x",le="0.005"}'], 3)
+        self.assertEqual(values['http_request_duration_seconds_bucket{method="GET",route="/x",le="10.0"}'], 3)
+        self.assertEqual(values['http_request_duration_seconds_bucket{method="GET",route="/x",le="+Inf"}'], 4)
+        self.assertAlmostEqual(values['http_request_duration_seconds_sum{method="GET",route="/x"}'], 20.0065)
+
+    def test_label_escaping(self):
+        registry = MetricsRegistry()
+        registry.observe("GET", 'a"b\\c', 200, 0.1, RequestStats())
+        self.assertIn('route="a\\"b\\\\c"', registry.render())
+
+    def test_unhandled_exception_counts_as_500(self):
+        inner = FastAPI()
+
+        @inner.get("/boom")
+        def boom():
+            raise RuntimeError("boom")
+
+        registry = MetricsRegistry()
+        middleware = MetricsMiddleware(inner, registry=registry)
+        scope = {"type": "http", "method": "GET", "path": "/boom", "raw_path": b"/boom", "root_path": "",
+                 "query_string": b"", "headers": [], "app": inner}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(middleware(scope, receive, send))
+        values = samples(registry.render())
+        self.assertEqual(values['http_requests_total{method="GET",route="/boom",status="500"}'], 1)
+        self.assertEqual(values["http_requests_in_flight"], 0)
@@ -0,0 +1,156 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker
+
+from core.db import build_engine, explain_query_plan, init_db
+from core.migrations import MIGRATIONS, run_migrations
+from models.expenses import Expense, ExpenseMeta, TripBalance
+from models.trips import Trip, TripEvent, TripUsers, convert_trips
+from models.user_base import User
+
+# Schema of databases created before core.migrations existed
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, password VARCHAR, full_name VARCHAR, PRIMARY KEY (id))",
+    "CREATE TABLE tokens (token VARCHAR NOT NULL, user_id INTEGER, PRIMARY KEY (token))",
+    "CREATE TABLE trips (id INTEGER NOT NULL, start_date DATE, end_date DATE, origin VARCHAR, destination VARCHAR, "
+    "user_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+    "CREATE TABLE trip_users (id INTEGER NOT NULL, user_id INTEGER, trip_id INTEGER, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(trip_id) REFERENCES trips (id) ON DELETE CASCADE)",
+    "CREATE TABLE trip_event (id INTEGER NOT NULL, description VARCHAR, time VARCHAR, trip_id INTEGER, PRIMARY KEY (id), "
+    "FOREIGN KEY(trip_id) REFERENCES trips (id) ON DELETE CASCADE)",
+    "CREATE TABLE expenses_meta (id INTEGER NOT NULL, trip_id INTEGER, paid_user_id INTEGER, description VARCHAR, "
+    "PRIMARY KEY (id), FOREIGN KEY(trip_id) REFERENCES trips (id), FOREIGN KEY(paid_user_id) REFERENCES users (id))",
+    "CREATE TABLE expenses (owe_user_id INTEGER, amount INTEGER, expense_id INTEGER, "
+    "FOREIGN KEY(owe_user_id) REFERENCES users (id), FOREIGN KEY(expense_id) REFERENCES expenses_meta (id))",
+]
+
+
+def uses_index(plan, table):
+    return any(
+        line.startswith(f"SEARCH {table} ") and ("INDEX" in line or "PRIMARY KEY" in line)
+        for line in plan
+    )
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.engine = build_engine("sqlite://")
+        with self.engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql("INSERT INTO users (id, username) VALUES (1, 'alice'), (2, 'bob')")
+            conn.exec_driver_sql("INSERT INTO trips (id, user_id) VALUES (1, 1)")
+            conn.exec_driver_sql("INSERT INTO trip_event (id, description, time, trip_id) VALUES (1, 'Museum', '2023-04-02', 1)")
+            conn.exec_driver_sql("INSERT INTO expenses_meta (id, trip_id, paid_user_id) VALUES (1, 1, 1)")
+            conn.exec_driver_sql("INSERT INTO expenses VALUES (2, 500, 1), (2, 700, 1)")
+        init_db(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_upgrades_legacy_database_in_place(self):
+        self.assertIn("id", [column["name"] for column in inspect(self.engine).get_columns("expenses")])
+        self.assertEqual(
+            [(e.id, e.amount) for e in self.session.query(Expense).order_by(Expense.id)],
+            [(1, 500), (2, 700)],
+        )
+        self.assertEqual(
+            [(b.trip_id, b.creditor_id, b.debtor_id, b.amount) for b in self.session.query(TripBalance)],
+            [(1, 1, 2, 1200)],
+        )
+        unique_indexes = {index["name"]: index["unique"] for index in inspect(self.engine).get_indexes("users")}
+        self.assertTrue(unique_indexes["ix_users_username"])
+        self.assertEqual([trip.version for trip in self.session.query(Trip)], [1])
+        self.assertEqual([(event.id, event.time) for event in self.session.query(TripEvent)], [(1, date(2023, 4, 2))])
+        with self.engine.connect() as conn:
+            # Not through inspect(), which skips the expression indexes
+            trip_indexes = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE tbl_name = 'trips'")}
+            self.assertLessEqual({"ix_trips_start_date_end_date", "ix_trips_duration"}, trip_indexes)
+            self.assertEqual(conn.exec_driver_sql("SELECT rowid, events FROM trip_search").fetchall(), [(1, "Museum")])
+            # The search triggers of the rebuilt events table
+            conn.exec_driver_sql("INSERT INTO trip_event (description, time, trip_id) VALUES ('Dinner', '2023-04-03', 1)")
+            self.assertEqual(conn.exec_driver_sql("SELECT events FROM trip_search").scalar(), "Museum Dinner")
+
+    def test_migrations_are_applied_once(self):
+        self.assertEqual(run_migrations(self.engine), [])
+        fresh = build_engine("sqlite://")
+        init_db(fresh)
+        self.assertEqual(run_migrations(fresh), [])
+        with fresh.connect() as conn:
+            versions = [row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations")]
+        self.assertEqual(versions, [migration.version for migration in MIGRATIONS])
+        fresh.dispose()
+
+    def test_hot_queries_use_indexes(self):
+        queries = {
+            "users": [
+                self.session.query(User).filter(User.username == "alice"),
+            ],
+            "trips": [
+                self.session.query(Trip).filter(Trip.user_id == 1),
+                self.session.query(Trip).filter(
+                    Trip.start_date >= date(2023, 1, 1), Trip.start_date <= date(2023, 4, 7), Trip.end_date >= date(2023, 4, 1),
+                ).order_by(Trip.start_date, Trip.end_date, Trip.id),
+            ],
+            "trip_users": [
+                self.session.query(TripUsers.trip_id, User).join(User, User.id == TripUsers.user_id)
+                .filter(TripUsers.trip_id.in_([1, 2])),
+                self.session.query(TripUsers).filter(TripUsers.user_id == 1),
+            ],
+            "trip_event": [
+                self.session.query(TripEvent).filter(TripEvent.trip_id.in_([1, 2]))
+                .order_by(TripEvent.trip_id, TripEvent.time),
+            ],
+            "expenses_meta": [self.session.query(ExpenseMeta).filter(ExpenseMeta.trip_id == 1)],
+            "expenses": [self.session.query(Expense).filter(Expense.expense_id == 1)],
+        }
+        for table, table_queries in queries.items():
+            for query in table_queries:
+                plan = explain_query_plan(self.engine, query)
+                self.assertTrue(uses_index(plan, table), f"{table}: {plan}")
+                self.assertNotIn(f"SCAN {table}", " | ".join(plan))
+
+    def test_event_listing_needs_no_sort(self):
+        plan = explain_query_plan(
+            self.engine,
+            self.session.query(TripEvent).filter(TripEvent.trip_id == 1).order_by(TripEvent.time),
+        )
+        self.assertFalse(any("TEMP B-TREE" in line for line in plan), plan)
+
+
+class TestEventTimeMigration(unittest.TestCase):
+    def test_invalid_legacy_times_are_cleared(self):
+        engine = build_engine("sqlite://")
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql("INSERT INTO users (id, username) VALUES (1, 'alice')")
+            conn.exec_driver_sql(
+                "INSERT INTO trips (id, start_date, end_date, origin, destination, user_id) "
+                "VALUES (1, '2023-04-01', '2023-04-05', 'Oslo', 'Bergen', 1)"
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO trip_event (id, description, time, trip_id) "
+                "VALUES (1, 'Museum', '2023-04-02', 1), (2, 'Dinner', '2023-04-02 20:30', 1), (3, 'Hike', 'next tuesday', 1)"
+            )
+        with self.assertLogs("core.migrations", level="WARNING") as logs:
+            init_db(engine)
+        self.assertIn("1 trip events", logs.output[0])
+        self.assertIn("3 ('next tuesday')", logs.output[0])
+        session = sessionmaker(bind=engine)()
+        try:
+            events = session.query(TripEvent).order_by(TripEvent.id).all()
+            self.assertEqual([(event.id, event.time) for event in events], [(1, date(2023, 4, 2)), (2, date(2023, 4, 2)), (3, None)])
+            trips = convert_trips(session, session.query(Trip).all())
+            self.assertEqual([event.time for event in trips[0].events], [None, date(2023, 4, 2), date(2023, 4, 2)])
+        finally:
+            session.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
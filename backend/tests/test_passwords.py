@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from core.passwords import (
+    PasswordHasher,
+    PasswordHasherBusy,
+    dummy_hash,
+    hash_password,
+    hasher,
+    is_hashed,
+    needs_rehash,
+    verify_password,
+)
+from models.user_base import User
+
+
+class TestPasswordHashing(unittest.TestCase):
+    def test_hash_and_verify(self):
+        stored = hash_password("s3cret", iterations=1000)
+        self.assertTrue(is_hashed(stored))
+        self.assertNotIn("s3cret", stored)
+        self.assertTrue(verify_password("s3cret", stored))
+        self.assertFalse(verify_password("secret", stored))
+        self.assertNotEqual(stored, hash_password("s3cret", iterations=1000))
+
+    def test_legacy_plaintext(self):
+        self.assertTrue(verify_password("pw", "pw"))
+        self.assertFalse(verify_password("pw", "other"))
+        self.assertFalse(verify_password("pw", None))
+        self.assertTrue(needs_rehash("pw"))
+
+    def test_malformed_hashes_match_no_password(self):
+        stored = hash_password("pw", iterations=1000)
+        _, iterations, salt, digest = stored.split("$")
+        for malformed in (
+            "pbkdf2_sha256$", f"{stored}$extra", f"pbkdf2_sha256$many${salt}${digest}", f"pbkdf2_sha256$0${salt}${digest}",
+            f"pbkdf2_sha256${iterations}$not base64!${digest}", f"pbkdf2_sha256${iterations}${salt}$é",
+        ):
+            self.assertFalse(verify_password("pw", malformed), malformed)
+            self.assertTrue(needs_rehash(malformed), malformed)
+
+    def test_weaker_hashes_need_rehash(self):
+        self.assertTrue(needs_rehash(hash_password("pw", iterations=settings.password_hash_iterations - 1)))
+        self.assertFalse(needs_rehash(f"pbkdf2_sha256${settings.password_hash_iterations}$c2FsdA==$aGFzaA=="))
+
+    def test_rejects_when_saturated(self):
+        pool = PasswordHasher(workers=1, max_pending=1)
+        busy = threading.Thread(target=pool._run, args=(time.sleep, 0.5))
+        busy.start()
+        try:
+            while pool._pending == 0:
+                time.sleep(0.01)
+            with self.assertRaises(PasswordHasherBusy):
+                pool.hash("pw")
+        finally:
+            busy.join()
+            pool.shutdown()
+        self.assertEqual(pool._pending, 0)
+
+
+class TestLoginRehash(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.iterations = settings.password_hash_iterations
+        settings.password_hash_iterations = 1000
+        self.add_user("alice")
+        self.session.commit()
+
+    def tearDown(self):
+        settings.password_hash_iterations = self.iterations
+        super().tearDown()
+
+    def stored_password(self, username):
+        session = self.Session()
+        try:
+            return session.query(User.password).filter(User.username == username).scalar()
+        finally:
+            session.close()
+
+    def test_plaintext_password_is_rehashed_on_login(self):
+        self.assertEqual(self.client.post("/login", auth=("alice", "wrong")).status_code, 401)
+        self.assertEqual(self.stored_password("alice"), "pw")
+
+        self.assertEqual(self.client.post("/login", auth=("alice", "pw")).status_code, 200)
+        stored = self.stored_password("alice")
+        self.assertTrue(is_hashed(stored))
+        self.assertTrue(verify_password("pw", stored))
+
+        self.assertEqual(self.client.post("/login", auth=("alice", "pw")).status_code, 200)
+        self.assertEqual(self.stored_password("alice"), stored)
+        self.assertEqual(self.client.post("/login", auth=("alice", "wrong")).status_code, 401)
+
+    def test_unknown_user_verifies_a_hash_too(self):
+        with mock.patch.object(hasher, "_run", wraps=hasher._run) as run:
+            self.assertEqual(self.client.post("/login", auth=("mallory", "pw")).status_code, 401)
+        self.assertEqual(len(run.call_args_list), 1)
+        fn, password, stored = run.call_args.args
+        self.assertEqual((fn, password, stored), (verify_password, "pw", dummy_hash()))
+        # At the configured cost
+        self.assertFalse(needs_rehash(dummy_hash()))
+
+    def test_malformed_hash_fails_the_login(self):
+        self.session.query(User).filter(User.username == "alice").update({User.password: "pbkdf2_sha256$1000$c2FsdA=="})
+        self.session.commit()
+        self.assertEqual(self.client.post("/login", auth=("alice", "pw")).status_code, 401)
+
+    def test_signup_stores_a_hash(self):
+        response = self.client.post("/signup", json={"username": "bob", "password": "pw2", "full_name": "Bob"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_hashed(self.stored_password("bob")))
+        self.assertEqual(self.client.post("/login", auth=("bob", "pw2")).status_code, 200)
+
+    def test_saturated_hasher_returns_503(self):
+        with mock.patch.object(hasher, "max_pending", 0):
+            response = self.client.post("/signup", json={"username": "bob", "password": "pw2", "full_name": "Bob"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "1")
+        self.assertIsNone(self.stored_password("bob"))
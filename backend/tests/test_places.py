@@ -0,0 +1,114 @@
+import unittest
+from datetime import date
+
+from api_test_case import ApiTestCase
+from core.prefix_index import PrefixIndex, normalize
+from models.places import reload_places, reset_places
+from models.trips import Trip
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize("  São   Paulo "), "sao paulo")
+        self.assertEqual(normalize("ZÜRICH"), "zurich")
+        self.assertEqual(normalize("Straße"), "strasse")
+
+    def test_ranking(self):
+        index = PrefixIndex()
+        index.load([("Paris", 5), ("Parma", 2), ("Pamplona", 2), ("Porto", 9), ("Lyon", 1), ("", 3), ("Nowhere", 0)])
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.suggest("pa"), [("Paris", 5), ("Pamplona", 2), ("Parma", 2)])
+        self.assertEqual(index.suggest("P", 2), [("Porto", 9), ("Paris", 5)])
+        self.assertEqual(index.suggest("par"), [("Paris", 5), ("Parma", 2)])
+        self.assertEqual(index.suggest("x"), [])
+        self.assertEqual(index.suggest(" "), [])
+
+    def test_spellings_are_merged(self):
+        index = PrefixIndex()
+        index.load([("zurich", 1), ("Zürich", 3)])
+        self.assertEqual(index.suggest("zu"), [("Zürich", 4)])
+        index.add("ZURICH")
+        self.assertEqual(index.suggest("zür"), [("Zürich", 5)])
+
+    def test_add_and_remove(self):
+        index = PrefixIndex()
+        index.add("Oslo")
+        index.add("Osaka", 2)
+        self.assertEqual(index.suggest("os"), [("Osaka", 2), ("Oslo", 1)])
+        index.remove("Osaka", 2)
+        self.assertEqual(index.suggest("os"), [("Oslo", 1)])
+        index.remove("Osaka")
+        index.remove("Unknown")
+        self.assertEqual(len(index), 1)
+
+    def test_cached_tops_follow_the_changes(self):
+        index = PrefixIndex(max_results=3, cache_threshold=2)
+        index.load([("Berlin", 4), ("Bern", 3), ("Bergen", 2), ("Bilbao", 1)])
+        self.assertEqual(index.suggest("b"), [("Berlin", 4), ("Bern", 3), ("Bergen", 2)])
+        self.assertIn("b", index._top)
+
+        index.add("Bilbao", 9)
+        self.assertEqual(index.suggest("b"), [("Bilbao", 10), ("Berlin", 4), ("Bern", 3)])
+        index.add("Bordeaux", 5)
+        self.assertEqual(index.suggest("b"), [("Bilbao", 10), ("Bordeaux", 5), ("Berlin", 4)])
+
+        index.remove("Bilbao", 10)
+        self.assertNotIn("b", index._top)
+        self.assertEqual(index.suggest("b"), [("Bordeaux", 5), ("Berlin", 4), ("Bern", 3)])
+        index.remove("Bergen")
+        self.assertEqual(index.suggest("be"), [("Berlin", 4), ("Bern", 3), ("Bergen", 1)])
+
+
+class TestSuggestDestinations(ApiTestCase):
+    def setUp(self):
+        reset_places()
+        super().setUp()
+        self.user = self.add_user("alice", token=True)
+        self.session.add_all([
+            Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin=origin, destination=destination, user_id=self.user.id)
+            for origin, destination in [("Madrid", "Málaga"), ("Madrid", "Malmö"), ("Lisbon", "Málaga")]
+        ])
+        self.session.commit()
+
+    def tearDown(self):
+        super().tearDown()
+        reset_places()
+
+    def suggest(self, prefix, **params):
+        response = self.client.get("/destinations/suggest", params={"prefix": prefix, **params}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return [(suggestion["name"], suggestion["count"]) for suggestion in response.json()["suggestions"]]
+
+    def test_suggestions_are_ranked_by_trips(self):
+        self.assertEqual(self.suggest("ma"), [("Madrid", 2), ("Málaga", 2), ("Malmö", 1)])
+        self.assertEqual(self.suggest("MAL", limit=1), [("Málaga", 2)])
+        self.assertEqual(self.suggest("z"), [])
+
+    def test_validation(self):
+        self.assertEqual(self.client.get("/destinations/suggest", headers=self.headers).status_code, 422)
+        self.assertEqual(self.client.get("/destinations/suggest", params={"prefix": "ma", "limit": 50}, headers=self.headers).status_code, 422)
+        self.assertEqual(self.client.get("/destinations/suggest", params={"prefix": "ma"}, headers={"Authorization": "Bearer nope"}).status_code, 400)
+
+    def test_created_and_deleted_trips_update_the_index(self):
+        self.assertEqual(self.suggest("ma"), [("Madrid", 2), ("Málaga", 2), ("Malmö", 1)])
+        trip = {"startDate": "2023-05-01", "endDate": "2023-05-03", "origin": "Malmö", "destination": "Mannheim"}
+        for _ in range(2):
+            self.assertEqual(self.client.post("/trip/create", json=trip, headers=self.headers).status_code, 200)
+        self.assertEqual(self.suggest("ma"), [("Malmö", 3), ("Madrid", 2), ("Málaga", 2), ("Mannheim", 2)])
+
+        trip_id = self.session.query(Trip.id).filter(Trip.destination == "Malmö").scalar()
+        self.assertEqual(self.client.delete(f"/trips/{trip_id}", headers=self.headers).status_code, 200)
+        self.assertEqual(self.suggest("ma"), [("Málaga", 2), ("Malmö", 2), ("Mannheim", 2), ("Madrid", 1)])
+        # Same as a reload from the database
+        self.assertEqual(reload_places(self.session), 5)
+        self.assertEqual(self.suggest("ma"), [("Málaga", 2), ("Malmö", 2), ("Mannheim", 2), ("Madrid", 1)])
+
+    def test_rolled_back_changes_are_ignored(self):
+        self.assertEqual(self.suggest("li"), [("Lisbon", 1)])
+        self.session.add(Trip(origin="Lima", destination="Cusco", user_id=self.user.id))
+        self.session.flush()
+        self.session.rollback()
+        trip = self.session.query(Trip).filter(Trip.origin == "Lisbon").one()
+        trip.origin = "Lille"
+        self.session.commit()
+        self.assertEqual(self.suggest("li"), [("Lille", 1)])
@@ -0,0 +1,122 @@
+import unittest
+from datetime import date
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_test_case import ApiTestCase
+from core.db import build_engine
+from core.metrics import MetricsMiddleware, MetricsRegistry, allow_repeated_statements, instrument_engines
+from core.queries import QueryRecorder, assert_max_queries, fingerprint, repeated_statements
+from models.expenses import CreateExpenseRequest, OweUserDetail, create_expenses
+from models.trips import Trip, TripUsers
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_literals_and_placeholders(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM trips WHERE id = 12 AND origin = 'it''s'"),
+            fingerprint("SELECT *\n  FROM trips WHERE id = ? AND origin = ?"),
+        )
+        self.assertEqual(fingerprint("SELECT * FROM trips_1 WHERE x = 1.5"), "SELECT * FROM trips_1 WHERE x = ?")
+
+    def test_in_lists_collapse(self):
+        shape = fingerprint("SELECT * FROM trips WHERE id IN (?, ?, ?)")
+        self.assertEqual(shape, "SELECT * FROM trips WHERE id IN (?...)")
+        self.assertEqual(fingerprint("SELECT * FROM trips WHERE id IN (?)"), shape)
+        self.assertEqual(fingerprint("SELECT * FROM trips WHERE id IN (1, 2)"), shape)
+
+    def test_repeated_statements(self):
+        statements = {"SELECT a FROM t WHERE id = ?": 3, "SELECT a FROM t WHERE id = 7": 2, "SELECT b FROM t": 1}
+        self.assertEqual(repeated_statements(statements, 4), [("SELECT a FROM t WHERE id = ?", 5)])
+        self.assertEqual(repeated_statements(statements, 5), [])
+
+
+class TestAssertMaxQueries(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        users = [self.add_user(name, token=name == "alice") for name in ("alice", "bob", "carol", "dave")]
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin="A", destination="B", user_id=users[0].id)
+        self.session.add(trip)
+        self.session.flush()
+        self.session.add_all([TripUsers(user_id=user.id, trip_id=trip.id) for user in users])
+        self.session.commit()
+        self.trip_id, self.user_ids = trip.id, [user.id for user in users]
+
+    def add_expenses(self, count):
+        session = self.Session()
+        for _ in range(count):
+            create_expenses(session, CreateExpenseRequest(
+                trip_id=self.trip_id, paid_user_id=self.user_ids[0], description="Dinner",
+                details=[OweUserDetail(owe_user_id=user_id, amount=100) for user_id in self.user_ids[1:]],
+            ))
+        session.close()
+
+    def test_expense_listing_does_not_query_per_expense(self):
+        self.add_expenses(2)
+        with assert_max_queries(self.engine, 10) as few:
+            self.assertEqual(self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).status_code, 200)
+        self.add_expenses(30)
+        with assert_max_queries(self.engine, few.count, repeat_limit=2):
+            self.assertEqual(self.client.get(f"/trip/{self.trip_id}/expenses", headers=self.headers).status_code, 200)
+
+    def test_failure_lists_the_statements(self):
+        with self.assertRaises(AssertionError) as raised:
+            with assert_max_queries(self.engine, 2):
+                for i in range(3):
+                    with self.engine.connect() as conn:
+                        conn.exec_driver_sql(f"SELECT {i}")
+        self.assertIn("3 queries run, expected at most 2", str(raised.exception))
+        self.assertIn("3 x SELECT ?", str(raised.exception))
+
+        with self.assertRaises(AssertionError):
+            with assert_max_queries(self.engine, 10, repeat_limit=2):
+                for i in range(3):
+                    with self.engine.connect() as conn:
+                        conn.exec_driver_sql(f"SELECT {i}")
+
+    def test_recorder_stops_listening(self):
+        with QueryRecorder(self.engine) as recorder:
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 2")
+        self.assertEqual(recorder.statements, ["SELECT 1"])
+
+
+class TestRepeatedStatementWarning(unittest.TestCase):
+    def setUp(self):
+        instrument_engines()
+        self.engine = build_engine("sqlite://")
+        inner = FastAPI()
+
+        @inner.get("/items/{count}")
+        def items(count: int):
+            with self.engine.connect() as conn:
+                for i in range(count):
+                    conn.exec_driver_sql("SELECT ?", (i,))
+            return {}
+
+        @inner.get("/chunks/{count}")
+        @allow_repeated_statements
+        def chunks(count: int):
+            return items(count)
+
+        self.client = TestClient(MetricsMiddleware(inner, registry=MetricsRegistry(), repeat_threshold=5))
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_warns_above_the_threshold(self):
+        with self.assertLogs("core.queries", level="WARNING") as logs:
+            self.client.get("/items/6")
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("GET /items/{count}: statement ran 6 times: SELECT ?", logs.output[0])
+
+    def test_silent_at_the_threshold(self):
+        with self.assertNoLogs("core.queries", level="WARNING"):
+            self.client.get("/items/5")
+
+    def test_silent_on_the_routes_repeating_statements_by_design(self):
+        with self.assertNoLogs("core.queries", level="WARNING"):
+            self.client.get("/chunks/6")
@@ -0,0 +1,171 @@
+import unittest
+from datetime import date
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from core.db import build_engine, init_db
+from core.seeding import seed_database
+from models.search import fts_query, rebuild_trip_search, search_snapshots, search_trip_ids
+from models.trips import Trip, TripEvent, TripUsers, decode_cursor, encode_cursor
+
+
+class TestFtsQuery(unittest.TestCase):
+    def test_words_are_quoted(self):
+        self.assertEqual(fts_query("New York"), '"New" "York"*')
+        self.assertEqual(fts_query('paris" OR NEAR(x -yz'), '"paris" "OR" "NEAR" "x" "yz"*')
+        self.assertEqual(fts_query("Zürich"), '"Zürich"*')
+        self.assertEqual(fts_query("Rome a"), '"Rome" "a"')
+        self.assertIsNone(fts_query(" -*() "))
+
+
+class TestTripSearch(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        search_snapshots.clear()
+        self.user = self.add_user("alice", token=True)
+        self.session.commit()
+
+    def add_trip(self, origin, destination, *events):
+        trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 5), origin=origin, destination=destination, user_id=self.user.id)
+        self.session.add(trip)
+        self.session.flush()
+        self.session.add(TripUsers(user_id=self.user.id, trip_id=trip.id))
+        self.session.add_all([TripEvent(description=description, time=date(2023, 4, 2), trip_id=trip.id) for description in events])
+        self.session.commit()
+        return trip.id
+
+    def search(self, q, limit=100):
+        return search_trip_ids(self.session, q, limit)[0]
+
+    def test_triggers_keep_the_index_in_sync(self):
+        trip_id = self.add_trip("Lisbon", "Porto", "Wine tasting")
+        self.assertEqual(self.search("porto"), [trip_id])
+        self.assertEqual(self.search("wine"), [trip_id])
+        self.assertEqual(self.search("lisb"), [trip_id])
+
+        trip = self.session.get(Trip, trip_id)
+        trip.destination = "Faro"
+        event = self.session.query(TripEvent).filter(TripEvent.trip_id == trip_id).one()
+        self.session.add(TripEvent(description="Surf lesson", time=date(2023, 4, 3), trip_id=trip_id))
+        self.session.commit()
+        self.assertEqual(self.search("porto"), [])
+        self.assertEqual(self.search("faro surf"), [trip_id])
+
+        self.session.delete(event)
+        self.session.commit()
+        self.assertEqual(self.search("wine"), [])
+        self.assertEqual(self.search("surf"), [trip_id])
+
+        self.session.delete(self.session.get(Trip, trip_id))
+        self.session.commit()
+        self.assertEqual(self.search("faro"), [])
+
+    def test_ranking_and_pagination(self):
+        by_event = self.add_trip("Berlin", "Munich", "Day trip to Prague castle")
+        by_destination = self.add_trip("Vienna", "Prague")
+        others = [self.add_trip("Prague", "Brno") for _ in range(5)]
+        self.add_trip("Rome", "Milan", "Opera")
+        ids = self.search("prague")
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(ids[-1], by_event)
+        self.assertIn(by_destination, ids[:6])
+
+        pages = self.pages("prague", 3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), ids)
+        self.assertEqual(sorted(ids), sorted(others + [by_event, by_destination]))
+
+    def pages(self, q, limit, evict=False):
+        pages, after = [], None
+        while True:
+            page, after = search_trip_ids(self.session, q, limit, after)
+            pages.append(page)
+            if after is None:
+                return pages
+            if evict:
+                search_snapshots.clear()
+
+    def test_the_cap_keeps_the_best_matches(self):
+        by_destination = self.add_trip("Vienna", "Prague")
+        by_event = [self.add_trip("Berlin", "Munich", "Prague castle") for _ in range(4)]
+        previous = settings.search_max_candidates
+        settings.search_max_candidates = 3
+        try:
+            ids = self.search("prague")
+            self.assertEqual(sum(self.pages("prague", 2), []), ids)
+        finally:
+            settings.search_max_candidates = previous
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(ids[0], by_destination)
+        self.assertTrue(set(ids[1:]) < set(by_event))
+
+    def test_pages_follow_the_ranking_of_the_first_page(self):
+        ids = [self.add_trip("Berlin", "Munich", "Prague castle") for _ in range(6)]
+        first, after = search_trip_ids(self.session, "prague", 2)
+        # Better matches, and a change of every score of the index
+        self.add_trip("Vienna", "Prague")
+        self.session.delete(self.session.get(Trip, ids[-1]))
+        self.session.commit()
+        second, after = search_trip_ids(self.session, "prague", 2, after)
+        rest, _ = search_trip_ids(self.session, "prague", 10, after)
+        self.assertEqual(first + second + rest, ids)
+
+    def test_evicted_snapshots_are_ranked_again(self):
+        for _ in range(7):
+            self.add_trip("Berlin", "Munich", "Prague castle")
+        pages = self.pages("prague", 3, evict=True)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.search("prague"))
+
+    def test_invalid_cursors(self):
+        for _ in range(3):
+            self.add_trip("Vienna", "Prague")
+        _, after = search_trip_ids(self.session, "prague", 1)
+        for cursor in ("garbage", encode_cursor(-1.5, 1), encode_cursor(decode_cursor(after)[0], 0, 999)):
+            with self.assertRaises(ValueError):
+                search_trip_ids(self.session, "prague", 1, cursor)
+        # A cursor of another search
+        with self.assertRaises(ValueError):
+            search_trip_ids(self.session, "vienna", 1, after)
+
+    def test_endpoint(self):
+        trip_id = self.add_trip("Oslo", "Bergen", "Fjord cruise")
+        response = self.client.get("/trips/search", params={"q": "fjord"}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([trip["id"] for trip in body["trips"]], [trip_id])
+        self.assertEqual(body["trips"][0]["events"][0]["description"], "Fjord cruise")
+        self.assertTrue(body["trips"][0]["isCurrentUserInParticipants"])
+        self.assertIsNone(body["next_cursor"])
+
+        self.assertEqual(self.client.get("/trips/search", params={"q": "?!"}, headers=self.headers).json(), {"trips": [], "next_cursor": None})
+        self.assertEqual(self.client.get("/trips/search", params={"q": "oslo", "after": "garbage"}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get("/trips/search", headers=self.headers).status_code, 422)
+
+    def test_rebuild(self):
+        trip_id = self.add_trip("Seoul", "Busan", "Night market")
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM trip_search")
+        self.assertEqual(self.search("market"), [])
+        with self.engine.begin() as conn:
+            self.assertEqual(rebuild_trip_search(conn), 1)
+        self.assertEqual(self.search("busan market"), [trip_id])
+
+
+class TestSeededSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.iterations = settings.password_hash_iterations
+        settings.password_hash_iterations = 1000
+
+    def tearDown(self):
+        settings.password_hash_iterations = self.iterations
+
+    def test_seeding_indexes_every_trip_and_restores_the_triggers(self):
+        engine = build_engine("sqlite://")
+        init_db(engine)
+        counts = seed_database(engine, users=50, trips=80, max_trip_size=10, batch_size=20)
+        with engine.begin() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM trip_search").scalar(), counts["trips"])
+            conn.exec_driver_sql("INSERT INTO trips (origin, destination) VALUES ('Atlantis', 'Avalon')")
+            self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM trip_search WHERE trip_search MATCH 'atlantis'").scalar(), 1)
+        engine.dispose()
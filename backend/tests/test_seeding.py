@@ -0,0 +1,72 @@
+import unittest
+
+from sqlalchemy.orm import sessionmaker
+
+from core.config import settings
+from core.db import build_engine, init_db
+from core.passwords import verify_password
+from core.seeding import SEED_PASSWORD, seed_database
+from models.expenses import check_trip_balances
+from models.user_base import User
+
+TABLES = ["users", "trips", "trip_users", "trip_event", "expenses_meta", "expenses", "trip_balances"]
+
+
+class TestSeeding(unittest.TestCase):
+    def setUp(self):
+        self.iterations = settings.password_hash_iterations
+        settings.password_hash_iterations = 1000
+
+    def tearDown(self):
+        settings.password_hash_iterations = self.iterations
+
+    def seeded(self, **options):
+        engine = build_engine("sqlite://")
+        init_db(engine)
+        counts = seed_database(engine, **{"users": 200, "trips": 300, "max_trip_size": 50, "batch_size": 100, **options})
+        return engine, counts
+
+    def dump(self, engine, table):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+
+    def test_counts_and_consistency(self):
+        engine, counts = self.seeded()
+        with engine.connect() as conn:
+            for table in TABLES:
+                self.assertEqual(conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar(), counts[table], table)
+            self.assertEqual(conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall(), [])
+            self.assertEqual(conn.exec_driver_sql("PRAGMA foreign_keys").scalar(), 1)
+        self.assertEqual((counts["users"], counts["trips"]), (200, 300))
+        self.assertGreater(counts["expenses"], counts["expenses_meta"])
+
+        session = sessionmaker(bind=engine)()
+        self.assertEqual(check_trip_balances(session), [])
+        self.assertTrue(verify_password(SEED_PASSWORD, session.query(User).first().password))
+        session.close()
+        engine.dispose()
+
+    def test_deterministic(self):
+        first, _ = self.seeded(seed=7)
+        second, _ = self.seeded(seed=7)
+        other, _ = self.seeded(seed=8)
+        for table in ["trips", "trip_users", "expenses"]:
+            self.assertEqual(self.dump(first, table), self.dump(second, table), table)
+        self.assertNotEqual(self.dump(first, "trips"), self.dump(other, "trips"))
+
+    def test_skewed_trip_sizes(self):
+        engine, _ = self.seeded(users=2000, trips=2000, max_trip_size=500)
+        with engine.connect() as conn:
+            sizes = [row[0] for row in conn.exec_driver_sql("SELECT COUNT(*) FROM trip_users GROUP BY trip_id ORDER BY 1")]
+        self.assertLessEqual(sizes[len(sizes) // 2], 2)
+        self.assertGreater(sizes[-1], 100)
+
+    def test_seeds_on_top_of_existing_rows(self):
+        engine, counts = self.seeded()
+        again = seed_database(engine, users=10, trips=10, batch_size=100)
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM users").scalar(), counts["users"] + 10)
+        session = sessionmaker(bind=engine)()
+        self.assertEqual(check_trip_balances(session), [])
+        session.close()
+        self.assertEqual(again["trips"], 10)
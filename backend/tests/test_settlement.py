@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from models.settlement import (
+    EXACT_SETTLEMENT_MAX_USERS,
+    net_balances,
+    settle_balances,
+    settle_exact,
+    settle_greedy,
+)
+
+
+def apply(net, transfers):
+    balances = dict(net)
+    for transfer in transfers:
+        assert transfer.amount > 0
+        balances[transfer.from_user] += transfer.amount
+        balances[transfer.to_user] -= transfer.amount
+    return balances
+
+
+class TestSettlement(unittest.TestCase):
+    def test_net_balances(self):
+        summary = {"alice": {"bob": 1500, "carol": 2000}, "bob": {"alice": 300, "bob": 100}}
+        self.assertEqual(net_balances(summary), {"alice": 3200, "bob": -1200, "carol": -2000})
+
+    def test_transfers_settle_everything(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            values = [rng.randint(-5000, 5000) for _ in range(rng.randint(1, 10))]
+            values.append(-sum(values))
+            net = {f"user{i}": value for i, value in enumerate(values) if value}
+            for settle in (settle_greedy, settle_exact):
+                transfers = settle(net)
+                self.assertTrue(all(balance == 0 for balance in apply(net, transfers).values()))
+                self.assertLessEqual(len(transfers), max(len(net) - 1, 0))
+
+    def test_exact_beats_greedy(self):
+        net = {"a": -9, "b": 7, "c": -2, "d": 5, "e": 6, "f": -7}
+        self.assertEqual(len(settle_greedy(net)), 5)
+        # {b, f} and {a, c, d, e} both sum to 0: 6 users - 2 groups = 4 transfers
+        self.assertEqual(len(settle_exact(net)), 4)
+
+    def test_modes(self):
+        summary = {"alice": {"bob": 100}}
+        self.assertEqual(settle_balances(summary).mode, "exact")
+        self.assertEqual(settle_balances(summary, "greedy").transfers[0].dict(),
+                         {"from_user": "bob", "to_user": "alice", "amount": 100})
+        big = {"payer": {f"user{i}": 1 for i in range(EXACT_SETTLEMENT_MAX_USERS + 1)}}
+        self.assertEqual(settle_balances(big).mode, "greedy")
+        with self.assertRaises(ValueError):
+            settle_balances(big, "exact")
+        with self.assertRaises(ValueError):
+            settle_balances(summary, "cheapest")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from sqlalchemy import event
+
+from api_test_case import ApiTestCase
+from core import tokens
+from core.config import settings
+from core.user_management import UserManagement
+from models.user_base import Token
+
+
+class TestSignedTokens(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_user("alice")
+        self.session.commit()
+        self.previous_mode = settings.token_mode
+        settings.token_mode = "signed"
+
+    def tearDown(self):
+        settings.token_mode = self.previous_mode
+        settings.accept_legacy_tokens = True
+        super().tearDown()
+
+    def login(self):
+        response = self.client.post("/login", auth=("alice", "pw"))
+        self.assertEqual(response.status_code, 200)
+        return response.json()["access_token"]
+
+    def test_round_trip_and_tampering(self):
+        token = tokens.create_signed_token(42, ttl=60, now=1000)
+        self.assertEqual(tokens.decode_signed_token(token, now=1059)["sub"], 42)
+        self.assertIsNone(tokens.decode_signed_token(token, now=1060))
+        signature = token.rpartition(".")[2]
+        forged = tokens.create_signed_token(43, ttl=60, now=1000).rpartition(".")[0]
+        self.assertIsNone(tokens.decode_signed_token(f"{forged}.{signature}", now=1000))
+        self.assertIsNone(tokens.decode_signed_token("v1.garbage.é", now=1000))
+
+    def test_login_issues_signed_token_without_db_row(self):
+        token = self.login()
+        self.assertTrue(tokens.is_signed_token(token))
+        session = self.Session()
+        self.assertEqual(session.query(Token).count(), 0)
+        session.close()
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(self.engine, "before_cursor_execute", record)
+        try:
+            headers = {"Authorization": f"Bearer {token}"}
+            self.assertEqual(self.client.get("/users/me", headers=headers).json()["username"], "alice")
+            statements.clear()
+            self.assertEqual(self.client.get("/users/me", headers=headers).status_code, 200)
+            self.assertEqual(statements, [])
+        finally:
+            event.remove(self.engine, "before_cursor_execute", record)
+
+    def test_logout_adds_token_to_denylist(self):
+        token = self.login()
+        headers = {"Authorization": f"Bearer {token}"}
+        self.assertEqual(self.client.get("/users/me", headers=headers).status_code, 200)
+        self.client.post("/logout", headers=headers)
+        self.assertEqual(self.client.get("/users/me", headers=headers).status_code, 400)
+        # Another worker picks the revocation up from the table
+        other_worker = tokens.TokenDenylist()
+        session = self.Session()
+        other_worker.load(session)
+        session.close()
+        self.assertIn(tokens.decode_signed_token(token)["jti"], other_worker)
+
+    def test_legacy_tokens_during_migration(self):
+        session = self.Session()
+        session.add(Token(token="legacy-token", user_id=1))
+        session.commit()
+        session.close()
+        headers = {"Authorization": "Bearer legacy-token"}
+        self.assertEqual(self.client.get("/users/me", headers=headers).status_code, 200)
+        UserManagement.token_cache.clear()
+        settings.accept_legacy_tokens = False
+        self.assertEqual(self.client.get("/users/me", headers=headers).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from sqlalchemy import event
+
+from api_test_case import ApiTestCase
+from core.cache import TTLCache
+from core.config import settings
+from core.user_management import UserManagement
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expiry(self):
+        timer = FakeTimer()
+        cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+        cache.set("a", 1)
+        timer.now = 4.9
+        self.assertEqual(cache.get("a"), 1)
+        timer.now = 5.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_pop_where(self):
+        cache = TTLCache(maxsize=10, ttl=5)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 1)
+        self.assertEqual(cache.pop_where(lambda value: value == 1), 2)
+        self.assertEqual(cache.get("b"), 2)
+
+
+class TestCurrentUserCache(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.add_user("alice", token=True)
+        self.session.commit()
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+        super().tearDown()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_second_lookup_is_served_from_cache(self):
+        first = UserManagement.get_current_user(self.session, "alice-token")
+        self.assertEqual(len(self.statements), 1)
+        second = UserManagement.get_current_user(self.session, "alice-token")
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second.username, "alice")
+        self.assertIsNone(UserManagement.get_current_user(self.session, "unknown"))
+
+    def test_user_update_invalidates(self):
+        UserManagement.get_current_user(self.session, "alice-token")
+        UserManagement.update_user(self.session, self.user, full_name="Alice Liddell")
+        current_user = UserManagement.get_current_user(self.session, "alice-token")
+        self.assertEqual(current_user.full_name, "Alice Liddell")
+
+    def test_rehash_on_login_invalidates(self):
+        UserManagement.get_current_user(self.session, "alice-token")
+        self.assertEqual(len(UserManagement.token_cache), 1)
+        iterations = settings.password_hash_iterations
+        settings.password_hash_iterations = 1000
+        try:
+            # The plaintext password of alice is rehashed
+            self.assertIsNotNone(UserManagement.authenticate_user(self.session, "alice", "pw"))
+        finally:
+            settings.password_hash_iterations = iterations
+        self.assertEqual(len(UserManagement.token_cache), 0)
+
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.get("/users/me", headers=self.headers).status_code, 200)
+        self.assertEqual(self.client.post("/logout", headers=self.headers).json(), {"success": True})
+        self.assertEqual(self.client.get("/users/me", headers=self.headers).status_code, 400)
+        self.assertIn("token_cache_hits_total", self.client.get("/metrics").text)
+        self.assertEqual(self.client.get("/stats/token-cache").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from core.fast_json import dumps
+from core.queries import assert_max_queries
+from models.trips import Trip, TripEvent, TripUsers, TripsOut, convert_trips, convert_trips_to_dicts
+
+
+class TestConvertTrips(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.add_user("alice", token=True)
+        self.other = self.add_user("bob")
+        self.session.commit()
+
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+        super().tearDown()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def add_trips(self, count):
+        for i in range(count):
+            trip = Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 10),
+                        origin="New York", destination=f"City {i}", user_id=self.user.id)
+            self.session.add(trip)
+            self.session.flush()
+            self.session.add_all([
+                TripUsers(user_id=self.user.id, trip_id=trip.id),
+                TripUsers(user_id=self.other.id, trip_id=trip.id),
+                TripEvent(description="Second", time=date(2023, 4, 3), trip_id=trip.id),
+                TripEvent(description="First", time=date(2023, 4, 2), trip_id=trip.id),
+            ])
+        self.session.commit()
+
+    def queries_for(self, path):
+        self.statements.clear()
+        response = self.client.get(path, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements)
+
+    def test_convert_trips_groups_participants_and_events(self):
+        self.add_trips(2)
+        trips = convert_trips(self.session, self.session.query(Trip).order_by(Trip.id), self.user)
+        self.assertEqual(len(trips), 2)
+        for trip in trips:
+            self.assertEqual(sorted(u.username for u in trip.users), ["alice", "bob"])
+            self.assertEqual([e.description for e in trip.events], ["First", "Second"])
+            self.assertTrue(trip.isCurrentUserInParticipants)
+
+    def test_dicts_match_the_tripout_json(self):
+        self.add_trips(3)
+        trips = self.session.query(Trip).order_by(Trip.id).all()
+        self.session.add(Trip(start_date=None, end_date=None, origin=None, destination=None, user_id=self.other.id))
+        self.session.commit()
+        expected = json.loads(TripsOut(trips=convert_trips(self.session, trips, self.user)).json())
+        self.assertEqual(json.loads(dumps({"trips": convert_trips_to_dicts(self.session, trips, self.user), "next_cursor": None})), expected)
+
+        response = self.client.get("/all-trips", headers=self.headers)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json()["trips"][:3], [{**trip, "isCurrentUserInParticipants": False} for trip in expected["trips"]])
+        self.assertIsNone(response.json()["next_cursor"])
+
+    def test_large_responses_are_gzipped_when_accepted(self):
+        self.add_trips(20)
+        plain = self.client.get("/all-trips", headers={**self.headers, "Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", plain.headers)
+        compressed = self.client.get("/all-trips", headers={**self.headers, "Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["content-encoding"], "gzip")
+        self.assertEqual(compressed.json(), plain.json())
+        self.assertLess(int(compressed.headers["content-length"]), len(plain.content) // 4)
+        self.assertEqual(compressed.headers["etag"], plain.headers["etag"])
+        small = self.client.get("/users/me", headers={**self.headers, "Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", small.headers)
+
+    def test_query_count_is_constant(self):
+        self.queries_for("/users/me")
+        for path in ("/my-trips", "/all-trips"):
+            self.add_trips(2)
+            few = self.queries_for(path)
+            self.add_trips(40)
+            many = self.queries_for(path)
+            self.assertEqual(few, many, path)
+
+    def test_single_trip_uses_batch_path(self):
+        self.add_trips(1)
+        trip_id = self.session.query(Trip.id).scalar()
+        with assert_max_queries(self.engine, 5):
+            self.queries_for(f"/trip/{trip_id}")
+
+    def test_ndjson_export_loads_relations_per_chunk(self):
+        self.add_trips(7)
+        previous = settings.trips_export_chunk_size
+        settings.trips_export_chunk_size = 3
+        try:
+            self.statements.clear()
+            response = self.client.get("/all-trips/export", headers=self.headers)
+        finally:
+            settings.trips_export_chunk_size = previous
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([trip["id"] for trip in lines], sorted(trip["id"] for trip in lines))
+        self.assertEqual(len(lines), 7)
+        self.assertEqual([e["description"] for e in lines[0]["events"]], ["First", "Second"])
+        # participants and events are loaded once for each of the 3 chunks
+        chunk_queries = [s for s in self.statements if "FROM trip_users" in s or "FROM trip_event" in s]
+        self.assertEqual(len(chunk_queries), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
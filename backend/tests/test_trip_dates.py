@@ -0,0 +1,167 @@
+import random
+import unittest
+from datetime import date, timedelta
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from core.db import explain_query_plan
+from core.interval_tree import IntervalIndex
+from models.trip_dates import longest_trip_days, overlapping_trips, overlapping_trips_page, reset_trip_intervals, trip_intervals
+from models.trips import Trip
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_matches_a_scan(self):
+        rng = random.Random(5)
+        intervals = {}
+        for trip_id in range(3000):
+            start = rng.randint(0, 2000)
+            intervals[trip_id] = (start, start + min(int(rng.expovariate(1 / 6)), 90))
+        index = IntervalIndex(block_size=8, rebuild_threshold=40)
+        index.load((trip_id, start, end) for trip_id, (start, end) in intervals.items())
+        for step in range(300):
+            if step % 3 == 0:
+                trip_id = rng.choice(list(intervals))
+                del intervals[trip_id]
+                index.remove(trip_id)
+            elif step % 3 == 1:
+                trip_id = rng.randint(0, 3100)
+                start = rng.randint(0, 2000)
+                intervals[trip_id] = (start, start + rng.randint(0, 400))
+                index.add(trip_id, *intervals[trip_id])
+            start = rng.randint(-10, 2100)
+            end = start + rng.randint(0, 60)
+            expected = sorted((first, last, trip_id) for trip_id, (first, last) in intervals.items() if first <= end and last >= start)
+            self.assertEqual(index.overlapping(start, end), expected)
+
+    def test_bounds_are_included(self):
+        index = IntervalIndex()
+        index.load([(1, 10, 20), (2, 21, 30), (3, 5, 5)])
+        self.assertEqual(index.overlapping(20, 21), [(10, 20, 1), (21, 30, 2)])
+        self.assertEqual(index.overlapping(5, 5), [(5, 5, 3)])
+        self.assertEqual(index.overlapping(31, 40), [])
+        self.assertEqual(IntervalIndex().overlapping(0, 10), [])
+
+    def test_changes_clear_the_cached_windows(self):
+        index = IntervalIndex(cache_size=2)
+        index.load([(1, 10, 20)])
+        self.assertEqual(index.overlapping(0, 100), [(10, 20, 1)])
+        self.assertIn((0, 100), index._cache)
+        index.add(2, 5, 60)
+        self.assertEqual(index.overlapping(0, 100), [(5, 60, 2), (10, 20, 1)])
+        index.add(1, 70, 80)
+        self.assertEqual(index.overlapping(21, 30), [(5, 60, 2)])
+        index.remove(2)
+        self.assertEqual(index.overlapping(0, 100), [(70, 80, 1)])
+        for window in [(0, 1), (0, 2), (0, 3)]:
+            index.overlapping(*window)
+        self.assertEqual(list(index._cache), [(0, 2), (0, 3)])
+
+
+class TestOverlappingTrips(ApiTestCase):
+    def setUp(self):
+        reset_trip_intervals()
+        super().setUp()
+        self.user = self.add_user("alice", token=True)
+        self.session.commit()
+        self.interval_index = settings.trip_interval_index
+
+    def tearDown(self):
+        settings.trip_interval_index = self.interval_index
+        super().tearDown()
+        reset_trip_intervals()
+
+    def add_trip(self, start, days):
+        trip = Trip(start_date=start, end_date=start + timedelta(days=days), user_id=self.user.id)
+        self.session.add(trip)
+        self.session.commit()
+        return trip.id
+
+    def add_trips(self):
+        rng = random.Random(11)
+        trips = {}
+        for _ in range(300):
+            start = date(2023, 1, 1) + timedelta(days=rng.randint(0, 365))
+            days = rng.randint(0, 20)
+            trips[self.add_trip(start, days)] = (start, start + timedelta(days=days))
+        # A long trip widens the range read, but must still be found
+        start = date(2022, 6, 1)
+        trips[self.add_trip(start, 400)] = (start, start + timedelta(days=400))
+        self.session.add(Trip(user_id=self.user.id))
+        self.session.commit()
+        return trips
+
+    def expected(self, trips, start, end):
+        return [trip_id for first, last, trip_id in sorted((first, last, trip_id) for trip_id, (first, last) in trips.items() if first <= end and last >= start)]
+
+    def fetch(self, start, end, limit=None):
+        ids, after = [], None
+        while True:
+            params = {"overlaps_from": start.isoformat(), "overlaps_to": end.isoformat(), "limit": limit}
+            if after is not None:
+                params["after"] = after
+            response = self.client.get("/trips", params={k: v for k, v in params.items() if v is not None}, headers=self.headers)
+            self.assertEqual(response.status_code, 200, response.text)
+            body = response.json()
+            ids.extend(trip["id"] for trip in body["trips"])
+            after = body["next_cursor"]
+            if after is None:
+                return ids
+
+    def test_pages_match_a_scan(self):
+        trips = self.add_trips()
+        self.assertEqual(longest_trip_days(self.session), 400)
+        for start, end in [(date(2023, 3, 1), date(2023, 3, 7)), (date(2023, 7, 14), date(2023, 7, 14)),
+                           (date(2020, 1, 1), date(2020, 2, 1)), (date(2022, 12, 1), date(2024, 1, 1))]:
+            ids, after = [], None
+            while True:
+                page, after = overlapping_trips_page(self.session, start, end, 9, after)
+                ids.extend(trip.id for trip in page)
+                if after is None:
+                    break
+            self.assertEqual(ids, self.expected(trips, start, end))
+
+    def test_pages_read_the_date_index_in_order(self):
+        for seek in (None, (date(2023, 3, 1), date(2023, 3, 2), 5)):
+            query = overlapping_trips(self.session, date(2023, 3, 1), date(2023, 3, 7), seek).limit(10)
+            plan = " | ".join(explain_query_plan(self.engine, query))
+            self.assertIn("ix_trips_start_date_end_date", plan)
+            self.assertNotIn("SCAN", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_endpoint_from_both_sources(self):
+        trips = self.add_trips()
+        window = (date(2023, 5, 1), date(2023, 5, 31))
+        expected = self.expected(trips, *window)
+        self.assertGreater(len(expected), 10)
+        for interval_index in (False, True):
+            settings.trip_interval_index = interval_index
+            self.assertEqual(self.fetch(*window), expected)
+            self.assertEqual(self.fetch(*window, limit=7), expected)
+
+    def test_interval_index_follows_the_writes(self):
+        settings.trip_interval_index = True
+        first = self.add_trip(date(2023, 4, 1), 4)
+        window = (date(2023, 4, 3), date(2023, 4, 3))
+        self.assertEqual(self.fetch(*window), [first])
+
+        trip = {"startDate": "2023-04-02", "endDate": "2023-04-10", "origin": "Oslo", "destination": "Bergen"}
+        self.assertEqual(self.client.post("/trip/create", json=trip, headers=self.headers).status_code, 200)
+        second = self.session.query(Trip.id).filter(Trip.origin == "Oslo").scalar()
+        self.assertEqual(self.fetch(*window), [first, second])
+
+        self.session.get(Trip, first).end_date = date(2023, 4, 2)
+        self.session.commit()
+        self.assertEqual(self.client.delete(f"/trips/{second}", headers=self.headers).status_code, 200)
+        self.assertEqual(self.fetch(*window), [])
+        self.assertEqual([trip_id for _, _, trip_id in trip_intervals.overlapping(date(2023, 4, 1).toordinal(), date(2023, 4, 2).toordinal())], [first])
+
+    def test_validation(self):
+        params = {"overlaps_from": "2023-04-03", "overlaps_to": "2023-04-01"}
+        self.assertEqual(self.client.get("/trips", params=params, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get("/trips", params={"overlaps_from": "2023-04-03"}, headers=self.headers).status_code, 422)
+        self.assertEqual(self.client.get("/trips", params={"overlaps_from": "2023-04-03", "overlaps_to": "soon"}, headers=self.headers).status_code, 422)
+        for interval_index in (False, True):
+            settings.trip_interval_index = interval_index
+            params = {"overlaps_from": "2023-04-01", "overlaps_to": "2023-04-03", "after": "garbage"}
+            self.assertEqual(self.client.get("/trips", params=params, headers=self.headers).status_code, 400)
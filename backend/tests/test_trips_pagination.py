@@ -0,0 +1,53 @@
+import unittest
+from datetime import date
+
+from api_test_case import ApiTestCase
+from core.config import settings
+from models.trips import Trip, encode_cursor
+
+
+class TestTripsPagination(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        user = self.add_user("alice", token=True)
+        self.session.add_all([
+            Trip(start_date=date(2023, 4, 1), end_date=date(2023, 4, 2),
+                 origin="A", destination=f"City {i}", user_id=user.id)
+            for i in range(7)
+        ])
+        self.session.commit()
+
+    def test_walks_all_pages(self):
+        for path in ("/all-trips", "/my-trips"):
+            seen, cursor = [], None
+            while True:
+                params = {"limit": 3} if cursor is None else {"limit": 3, "after": cursor}
+                body = self.client.get(path, params=params, headers=self.headers).json()
+                self.assertLessEqual(len(body["trips"]), 3)
+                seen.extend(trip["id"] for trip in body["trips"])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+            self.assertEqual(seen, sorted(seen))
+            self.assertEqual(len(seen), 7)
+
+    def test_unpaginated_request_is_capped(self):
+        previous = settings.trips_page_size_max
+        settings.trips_page_size_max = 5
+        try:
+            body = self.client.get("/all-trips", headers=self.headers).json()
+            self.assertEqual(len(body["trips"]), 5)
+            self.assertIsNotNone(body["next_cursor"])
+            body = self.client.get("/all-trips", params={"limit": 100}, headers=self.headers).json()
+            self.assertEqual(len(body["trips"]), 5)
+        finally:
+            settings.trips_page_size_max = previous
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-a-cursor", encode_cursor("x")):
+            response = self.client.get("/all-trips", params={"after": cursor}, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()